@@ -1,89 +1,186 @@
 from langchain.chains import RetrievalQA
-from langchain.chat_models import ChatOpenAI
+from .client_pool import chat_model, completion_model, embedding_model
 from langchain.document_loaders import CSVLoader
 from langchain.vectorstores import DocArrayInMemorySearch # Langchain built-in vector store
 from IPython.display import display, Markdown
-from langchain.llms import OpenAI
 from langchain.indexes import VectorstoreIndexCreator
 
-file = 'your csv or other file'
-loader = CSVLoader(file_path=file)
 
-index = VectorstoreIndexCreator(
-    vectorstore_cls=DocArrayInMemorySearch
-).from_loaders([loader])
+def main():
+    file = 'your csv or other file'
+    loader = CSVLoader(file_path=file)
 
-query ="Please list all your shirts with sun protection \
+    index = VectorstoreIndexCreator(
+        vectorstore_cls=DocArrayInMemorySearch,
+        embedding=embedding_model(), # OpenAIEmbeddings() on the shared client
+    ).from_loaders([loader])
+
+    query ="Please list all your shirts with sun protection \
 in a table in markdown and summarize each one." # or other question you want to ask.
 
-llm_replacement_model = OpenAI(temperature=0,
-                               model='gpt-3.5-turbo-instruct')
+    llm_replacement_model = completion_model(temperature=0,
+                                             model='gpt-3.5-turbo-instruct') # OpenAI(...) on the shared client
 
-response = index.query(query,
-                       llm=llm_replacement_model)
-display(Markdown(response))
+    response = index.query(query,
+                           llm=llm_replacement_model)
+    display(Markdown(response))
 
 
-# Step by Step
-from langchain.document_loaders import CSVLoader
-loader = CSVLoader(file_path=file)
+    # Step by Step
+    loader = CSVLoader(file_path=file)
 
-docs = loader.load()
+    docs = loader.load()
 
-print(docs[0])
+    print(docs[0])
 
 
-from langchain.embeddings import OpenAIEmbeddings
-embeddings = OpenAIEmbeddings()
-embed = embeddings.embed_query("Hi my name is Harrison")
+    embeddings = embedding_model() # OpenAIEmbeddings() on the shared client
+    embed = embeddings.embed_query("Hi my name is Harrison")
 
-print(len(embed))
+    print(len(embed))
 
-print(embed[:5])
+    print(embed[:5])
 
-db = DocArrayInMemorySearch.from_documents(
-    docs, 
-    embeddings
-)
+    # Embedding cache
+    '''
+    Every run embeds the same catalog rows again. CachedEmbeddings keeps each vector in a local SQLite file
+    (plus an in-memory LRU), so only texts it has never seen are sent to OpenAI.
+    '''
+    from .embedding_cache import CachedEmbeddings
+    embeddings = CachedEmbeddings(embedding_model())
 
-query = "Please suggest a shirt with sunblocking"
+    db = DocArrayInMemorySearch.from_documents(
+        docs, 
+        embeddings
+    )
 
-docs = db.similarity_search(query)
+    query = "Please suggest a shirt with sunblocking"
 
-print(len(docs))
+    docs = db.similarity_search(query)
 
-print(docs[0])
+    print(len(docs))
 
+    print(docs[0])
 
-retriever = db.as_retriever()
-llm = ChatOpenAI(temperature=0.0, model="gpt-3.5-turbo-0301")
 
-qdocs = "".join([docs[i].page_content for i in range(len(docs))])
+    retriever = db.as_retriever()
+    llm = chat_model(temperature=0.0, model="gpt-3.5-turbo-0301")
 
-response = llm.call_as_llm(f"{qdocs} Question: Please list all your \
+    qdocs = "".join([docs[i].page_content for i in range(len(docs))])
+
+    response = llm.call_as_llm(f"{qdocs} Question: Please list all your \
 shirts with sun protection in a table in markdown and summarize each one.") 
 
-display(Markdown(response))
+    display(Markdown(response))
 
-qa_stuff = RetrievalQA.from_chain_type(
-    llm=llm, 
-    chain_type="stuff", 
-    retriever=retriever, 
-    verbose=True
-)
+    qa_stuff = RetrievalQA.from_chain_type(
+        llm=llm, 
+        chain_type="stuff", 
+        retriever=retriever, 
+        verbose=True
+    )
 
-query =  "Please list all your shirts with sun protection in a table \
+    query =  "Please list all your shirts with sun protection in a table \
 in markdown and summarize each one."
 
-response = qa_stuff.run(query)
+    response = qa_stuff.run(query)
+
+    display(Markdown(response))
+
+    response = index.query(query, llm=llm)
+
+
+    # Vectorized search
+    '''
+    DocArrayInMemorySearch scores the rows one by one, which gets slow on a big catalog.
+    NumpyVectorStore scores every row with a single matrix product and can answer several queries in one call.
+    It is a drop-in replacement: use it in vectorstore_cls= or call .as_retriever() on it.
+    '''
+    from .numpy_vectorstore import NumpyVectorStore
+
+    db = NumpyVectorStore.from_documents(loader.load(), embeddings)
+    retriever = db.as_retriever()
+
+    results = db.similarity_search_batch([
+        "Please suggest a shirt with sunblocking",
+        "Do you have a waterproof jacket?",
+    ], k=4) # one list of 4 documents per query
+
+
+    # Approximate search
+    '''
+    For millions of rows, even one matrix product per query is too slow.
+    IVFVectorStore groups the vectors in clusters and only scores the rows of the `nprobe` closest clusters.
+    recall_benchmark() shows how much recall each nprobe value costs compared with the exact search.
+    '''
+    from .ann_index import IVFVectorStore, recall_benchmark
+
+    db = IVFVectorStore.from_documents(loader.load(), embeddings, nprobe=8)
+    retriever = db.as_retriever()
+
+    questions = ["Please suggest a shirt with sunblocking", "Do you have a waterproof jacket?"]
+    for row in recall_benchmark(db.index, embeddings.embed_documents(questions), k=4):
+        print(row) # {'nprobe': 1, 'recall': ..., 'ms_per_query': ...}
+
+    db.save_local("catalog_ivf")
+    db = IVFVectorStore.load_local("catalog_ivf", embeddings)
+
+
+    # Streaming ingest
+    '''
+    loader.load() keeps every row of the CSV in memory before embedding starts.
+    ingest() reads the rows lazily and embeds/inserts them batch by batch while the file is still being read,
+    with bounded queues between the stages so memory stays flat for any file size.
+    '''
+    from .ingest_pipeline import ingest
+
+    db = NumpyVectorStore(embeddings)
+    stats = ingest(CSVLoader(file_path=file), embeddings, db, batch_size=256)
+    print(stats) # {'rows': ..., 'seconds': ..., 'rows_per_second': ..., 'load_seconds': ..., 'embed_seconds': ..., 'insert_seconds': ...}
+    retriever = db.as_retriever()
+
+    index = VectorstoreIndexCreator(
+        vectorstore_cls=NumpyVectorStore,
+        embedding=embeddings,
+    ).from_loaders([loader])
+
+
+
+
+    # Persistent index
+    '''
+    Both indexes above are rebuilt (and the whole CSV re-embedded) every time the script runs.
+    PersistentVectorIndex stores the vectors on disk the first time and re-opens them on the next run;
+    only rows whose content changed since the last run are sent to the embedding model again.
+    '''
+    from .persistent_index import PersistentVectorIndex
+
+    persistent_index = PersistentVectorIndex.from_loader("catalog_index", loader, embeddings)
+    print(persistent_index.header) # {'dimension': 1536, 'count': ..., 'embedding': ..., 'reembedded': ...}
+
+    db = persistent_index.as_vectorstore(embeddings)
+    docs = db.similarity_search("Please suggest a shirt with sunblocking")
+    print(docs[0])
+    print(embeddings.stats()) # {'memory_hits': ..., 'disk_hits': ..., 'misses': ..., 'hit_rate': ...}
+
+
 
-display(Markdown(response))
 
-response = index.query(query, llm=llm)
+    # Streaming the answer
+    '''
+    qa_stuff.run(query) returns after the whole table is generated. stream_retrieval_qa first gives the
+    retrieved documents (they can be shown before the LLM starts), then the answer token by token.
+    '''
+    from .streaming import stream_retrieval_qa, metrics
 
-index = VectorstoreIndexCreator(
-    vectorstore_cls=DocArrayInMemorySearch,
-    embedding=embeddings,
-).from_loaders([loader])
+    for kind, value in stream_retrieval_qa(qa_stuff, query):
+        if kind == "sources":
+            print([doc.metadata.get("row") for doc in value])
+        else:
+            print(value, end="", flush=True)
+    print()
+    print(metrics.summary()) # time to first token vs total time, in ms
 
 
+if __name__ == "__main__":
+    main()
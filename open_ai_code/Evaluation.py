@@ -10,10 +10,13 @@ It involves testing the model's responses against a set of predefined criteria o
 from langchain.evaluation.qa import QAEvalChain
 from langchain.evaluation.qa import QAGenerateChain
 from langchain.chains import RetrievalQA
-from langchain.chat_models import ChatOpenAI
 from langchain.document_loaders import CSVLoader
 from langchain.indexes import VectorstoreIndexCreator
 from langchain.vectorstores import DocArrayInMemorySearch
+from .client_pool import chat_model, embedding_model
+from langchain.globals import set_llm_cache
+from .embedding_cache import CachedEmbeddings
+from .llm_cache import SemanticLLMCache
 
 # account for deprecation of LLM model
 import datetime
@@ -29,87 +32,158 @@ if current_date > target_date:
 else:
     llm_model = "gpt-3.5-turbo-0301"
 
-file = 'OutdoorClothingCatalog_1000.csv'
-loader = CSVLoader(file_path=file)
-data = loader.load()
-
-index = VectorstoreIndexCreator(vectorstore_cls=DocArrayInMemorySearch).from_loaders([loader])
-
-llm = ChatOpenAI(temperature=0.0, model=llm_model)
-qa = RetrievalQA.from_chain_type(
-    llm=llm,
-    chain_type="stuff",
-    retriever=index.vectorstore.as_retriever(),
-    verbose=True,
-    chain_type_kwargs={
-        "document_separator": "<<<<>>>>>"
-    }
-)
-
-#Coming up with test datapoints
-data[10]
-data[11]
-
-# Hard-coded examples
-examples = [
-    {
-        "query": "Do the Cozy Comfort Pullover Set\
+
+def main():
+    file = 'OutdoorClothingCatalog_1000.csv'
+    loader = CSVLoader(file_path=file)
+    data = loader.load()
+
+    # Cache the embeddings so re-running the evaluation does not re-embed the catalog and the questions.
+    embeddings = CachedEmbeddings(embedding_model())
+    index = VectorstoreIndexCreator(
+        vectorstore_cls=DocArrayInMemorySearch,
+        embedding=embeddings,
+    ).from_loaders([loader])
+
+    # Cache the temperature=0 answers: identical prompts are not sent to the model again.
+    # Exact match only: the QA prompts and the grading prompts differ by a few words (another question,
+    # another student answer) and the semantic level would hand them the answer or grade of another prompt.
+    set_llm_cache(SemanticLLMCache("llm_cache.sqlite"))
+
+    llm = chat_model(temperature=0.0, model=llm_model)
+    qa = RetrievalQA.from_chain_type(
+        llm=llm,
+        chain_type="stuff",
+        retriever=index.vectorstore.as_retriever(),
+        verbose=True,
+        chain_type_kwargs={
+            "document_separator": "<<<<>>>>>"
+        }
+    )
+
+    #Coming up with test datapoints
+    data[10]
+    data[11]
+
+    # Hard-coded examples
+    examples = [
+        {
+            "query": "Do the Cozy Comfort Pullover Set\
         have side pockets?",
-        "answer": "Yes"
-    },
-    {
-        "query": "What collection is the Ultra-Lofty \
+            "answer": "Yes"
+        },
+        {
+            "query": "What collection is the Ultra-Lofty \
         850 Stretch Down Hooded Jacket from?",
-        "answer": "The DownTek collection"
-    }
-] # These are questions used in evaluating that file. You decide the questions you want to ask. But this is manual and not automated.
-
-# Below is automated.
-# LLM-Generated examples
-example_gen_chain = QAGenerateChain.from_llm(ChatOpenAI(model=llm_model))
-# the warning below can be safely ignored
-new_examples = example_gen_chain.apply_and_parse(
-    [{"doc": t} for t in data[:5]]
-)
-
-new_examples[0]
-data[0]
-
-# Combine examples
-examples += new_examples
-qa.run(examples[0]["query"])
-
-
-# Manual Evaluation
-import langchain
-langchain.debug = True # setting this to True lets you see the things going on inside the evaluation process. 
-
-qa.run(examples[0]["query"]) # This is the rerun of the qa above. 
-#Sometimes it's not the llm that has the problem in returning right answer but the retrieval process.
-# You'll get an overview of how many token you're using
-# Turn off the debug mode
-langchain.debug = False
-
-
-# LLM assisted evaluation
-predictions = qa.apply(examples) # This prints out the examples we have. You nay not have this much example. Itis just for tutorial.
-
-llm = ChatOpenAI(temperature=0, model=llm_model)
-eval_chain = QAEvalChain.from_llm(llm)
-
-graded_outputs = eval_chain.evaluate(examples, predictions)
-
-for i, eg in enumerate(examples):
-    print(f"Example {i}:")
-    print("Question: " + predictions[i]['query'])
-    print("Real Answer: " + predictions[i]['answer'])
-    print("Predicted Answer: " + predictions[i]['result'])
-    print("Predicted Grade: " + graded_outputs[i]['text'])
-    print()
-
-graded_outputs[0]
-
-
-
-
-
+            "answer": "The DownTek collection"
+        }
+    ] # These are questions used in evaluating that file. You decide the questions you want to ask. But this is manual and not automated.
+
+    # Below is automated.
+    # LLM-Generated examples
+    example_gen_chain = QAGenerateChain.from_llm(chat_model(model=llm_model))
+    # the warning below can be safely ignored
+    new_examples = example_gen_chain.apply_and_parse(
+        [{"doc": t} for t in data[:5]]
+    )
+
+    new_examples[0]
+    data[0]
+
+    # The whole catalog in batches
+    '''
+    One call per document, one after the other, is too slow for more than a few documents.
+    generate_dataset packs several documents in each prompt, runs the prompts in parallel under a
+    requests-per-minute limit, drops near-duplicate questions and saves the examples to a file
+    that the next runs load instead of generating them again.
+    '''
+    from .example_generation import generate_dataset
+
+    catalog_examples = generate_dataset(
+        data,
+        chat_model(model=llm_model),
+        path="eval_dataset.jsonl",
+        embeddings=embeddings, # used to drop near-duplicate questions
+        docs_per_prompt=5,
+        max_workers=4,
+        requests_per_minute=60,
+    )
+    print(len(catalog_examples), catalog_examples[0]) # {'query': ..., 'answer': ..., 'source': {'source': ..., 'row': ...}}
+
+    # Combine examples
+    examples += new_examples
+    qa.run(examples[0]["query"])
+
+
+    # Manual Evaluation
+    '''
+    Instead of langchain.debug = True (which prints every step to the console), the tracer records a span
+    per step of the chain: the retrieval, the prompt formatting, the LLM call (with its tokens), the parsing.
+    The spans are written to traces.jsonl (one JSON object per step), and summary() tells where the time goes.
+    '''
+    from .tracing import Tracer, JSONLExporter
+    tracer = Tracer(JSONLExporter("traces.jsonl"))
+    tracer.activate() # lets you see the things going on inside the evaluation process.
+
+    qa.run(examples[0]["query"]) # This is the rerun of the qa above. 
+    #Sometimes it's not the llm that has the problem in returning right answer but the retrieval process.
+    # You'll get an overview of how much time each step takes and how many token you're using
+    tracer.deactivate()
+    print(tracer.summary())
+    # {'chain:RetrievalQA': {'count': 1, 'total_ms': ..., 'p50_ms': ..., 'p99_ms': ..., 'tokens': 0, 'errors': 0},
+    #  'chain:StuffDocumentsChain': {...}, 'llm:ChatOpenAI': {'count': 1, ..., 'tokens': ...},
+    #  'retriever:VectorStoreRetriever': {...}, 'step:prompt.format': {...}, 'step:parse': {...}}
+
+
+    # Retrieval-only evaluation
+    '''
+    To check the retrieval without paying for generation, evaluate_retrieval runs only the retriever
+    for all the examples and reports recall@k (is the source row in the first k documents?), MRR and latency.
+    Each example needs the metadata of the row its question was written from.
+    '''
+    from .retrieval_eval import evaluate_retrieval
+
+    retrieval_examples = [
+        {"query": e["query"], "source": doc.metadata} # new_examples[i] was generated from data[i]
+        for e, doc in zip(new_examples, data[:5])
+    ] + catalog_examples # generate_dataset already saves the source row
+
+    print(evaluate_retrieval(index.vectorstore.as_retriever(), retrieval_examples, ks=(1, 4, 10)))
+    # {'queries': ..., 'recall@1': ..., 'recall@4': ..., 'recall@10': ..., 'mrr@10': ..., 'latency_ms': {'p50': ..., 'p90': ..., 'p99': ..., 'max': ...}, ...}
+
+
+    # LLM assisted evaluation
+    predictions = qa.apply(examples) # This prints out the examples we have. You nay not have this much example. Itis just for tutorial.
+
+    llm = chat_model(temperature=0, model=llm_model)
+    eval_chain = QAEvalChain.from_llm(llm)
+
+    graded_outputs = eval_chain.evaluate(examples, predictions)
+
+    for i, eg in enumerate(examples):
+        print(f"Example {i}:")
+        print("Question: " + predictions[i]['query'])
+        print("Real Answer: " + predictions[i]['answer'])
+        print("Predicted Answer: " + predictions[i]['result'])
+        print("Predicted Grade: " + graded_outputs[i]['text'])
+        print()
+
+    graded_outputs[0]
+
+
+    # Parallel evaluation with checkpoints
+    '''
+    qa.apply and eval_chain.evaluate make one LLM call after the other, and a failure loses the whole run.
+    EvaluationRunner predicts and grades several examples at the same time, writes each graded example
+    to a JSONL checkpoint as soon as it is done, and skips the examples already in the checkpoint when run again.
+    '''
+    from .eval_runner import EvaluationRunner
+
+    runner = EvaluationRunner(qa, eval_chain, checkpoint_path="eval_checkpoint.jsonl", max_workers=8)
+    graded = runner.run(examples) # run it again after a crash: it resumes from the checkpoint
+    print(graded[0]) # {'id': ..., 'query': ..., 'answer': ..., 'result': ..., 'grade': 'CORRECT', 'predict_ms': ..., 'grade_ms': ...}
+    print(runner.report()) # examples_per_second, and p50/p90/p99 latency of the predict and grade stages
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# open_ai_code
+'''
+The course lessons (start.py, chains.py, memory.py, ...) are scripts: run them with
+python -m open_ai_code.<lesson>. The helper modules next to them are the reusable part.
+
+Importing the package imports nothing else: each name below is imported from its module the first
+time it is used (PEP 562 module __getattr__), so `from open_ai_code import chat_model` only pays for
+client_pool.py, not for LangChain, numpy and every other helper.
+See import_time.py for the import time of each module.
+'''
+import importlib
+
+_EXPORTS = {
+    "ClientPool": "client_pool",
+    "AdaptiveLimiter": "client_pool",
+    "chat_model": "client_pool",
+    "embedding_model": "client_pool",
+    "configure": "client_pool",
+    "get_pool": "client_pool",
+    "ModelRegistry": "client_pool",
+    "get_registry": "client_pool",
+    "shared_chat_model": "client_pool",
+    "shared_embedding_model": "client_pool",
+    "CompiledChatPromptTemplate": "compiled_prompt",
+    "compile_template": "compiled_prompt",
+    "Tracer": "tracing",
+    "JSONLExporter": "tracing",
+    "OTLPJSONExporter": "tracing",
+    "instrument": "tracing",
+    "uninstrument": "tracing",
+    "FakeChatModel": "fake_backend",
+    "FakeEmbeddings": "fake_backend",
+    "NumpyVectorStore": "numpy_vectorstore",
+    "IVFVectorStore": "ann_index",
+    "PersistentVectorIndex": "persistent_index",
+    "CachedEmbeddings": "embedding_cache",
+    "SemanticLLMCache": "llm_cache",
+    "ingest": "ingest_pipeline",
+    "DAGSequentialChain": "dag_chain",
+    "EmbeddingRouterChain": "embedding_router",
+    "IncrementalTokenBufferMemory": "token_memory",
+    "BackgroundSummaryBufferMemory": "background_summary_memory",
+    "EvaluationRunner": "eval_runner",
+    "percentile": "latency",
+    "latency_summary": "latency",
+    "generate_dataset": "example_generation",
+    "evaluate_retrieval": "retrieval_eval",
+    "StreamMetrics": "streaming",
+    "stream_conversation": "streaming",
+    "stream_retrieval_qa": "streaming",
+    "IncrementalStructuredOutputParser": "streaming_parser",
+    "BulkReviewExtractor": "review_extraction",
+    "prefix_prompt": "prompt_prefix",
+    "cacheable_prefix": "prompt_prefix",
+    "prefix_report": "prompt_prefix",
+    "CachingAgentExecutor": "tool_executor",
+    "LocalWikipediaTool": "tool_executor",
+    "PythonWorkerPool": "python_pool",
+    "PooledPythonREPLTool": "python_pool",
+    "local_wikipedia": "wikipedia_fixture",
+}
+
+# Helper modules reachable as attributes (open_ai_code.tracing), imported on first access.
+_SUBMODULES = set(_EXPORTS.values()) | {"benchmarks", "fake_openai_server", "import_time"}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+    elif name in _SUBMODULES:
+        value = importlib.import_module(f".{name}", __name__)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value  # the next access does not go through __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS) | _SUBMODULES)
@@ -18,110 +18,178 @@ else:
     llm_model = "gpt-3.5-turbo-0301"
 
 
-#!pip install -U wikipedia
-from langchain.chat_models import ChatOpenAI
-
-llm = ChatOpenAI(temperature=0, model=llm_model)
-tools = load_tools(["llm-math","wikipedia"], llm=llm)
-agent = initialize_agent(
-    tools,
-    llm,
-    agent=AgentType.CHAT_ZERO_SHOT_REACT_DESCRIPTION,
-    handle_parsing_errors=True,
-    verbose=True)
-
-    
-agent("What is the 25% of 300?")
-# Output
-'''
-Entering new AgentExecutor chain...
-Thought: We can use the calculator tool to find 25% of 300.
-Action:
-```
-{
-  "action": "Calculator",
-  "action_input": "25% of 300"
-}
-```
-Observation: Answer: 75.0
-Thought:Final Answer: 75.0
-
-> Finished chain.
-{'input': 'What is the 25% of 300?', 'output': '75.0'}
-'''
-
-# Wikipedia example
-
-question = "Tom M. Mitchell is an American computer scientist \
+def main():
+    #!pip install -U wikipedia
+    from .client_pool import chat_model
+
+    llm = chat_model(temperature=0, model=llm_model)
+    tools = load_tools(["llm-math","wikipedia"], llm=llm)
+    agent = initialize_agent(
+        tools,
+        llm,
+        agent=AgentType.CHAT_ZERO_SHOT_REACT_DESCRIPTION,
+        handle_parsing_errors=True,
+        verbose=True)
+
+
+    agent("What is the 25% of 300?")
+    # Output
+    '''
+    Entering new AgentExecutor chain...
+    Thought: We can use the calculator tool to find 25% of 300.
+    Action:
+    ```
+    {
+      "action": "Calculator",
+      "action_input": "25% of 300"
+    }
+    ```
+    Observation: Answer: 75.0
+    Thought:Final Answer: 75.0
+
+    > Finished chain.
+    {'input': 'What is the 25% of 300?', 'output': '75.0'}
+    '''
+
+    # Wikipedia example
+
+    question = "Tom M. Mitchell is an American computer scientist \
 and the Founders University Professor at Carnegie Mellon University (CMU)\
 what book did he write?"
-result = agent(question) 
-
-print(result)
-
-#Python Agent
-agent = create_python_agent(
-    llm,
-    tool=PythonREPLTool(),
-    verbose=True
-)
-
-customer_list = [["Harrison", "Chase"], 
-                 ["Lang", "Chain"],
-                 ["Dolly", "Too"],
-                 ["Elle", "Elem"], 
-                 ["Geoff","Fusion"], 
-                 ["Trance","Former"],
-                 ["Jen","Ayai"]
-                ]
-
-agent.run(f"""Sort these customers by \
+    result = agent(question) 
+
+    print(result)
+
+    #Python Agent
+    agent = create_python_agent(
+        llm,
+        tool=PythonREPLTool(),
+        verbose=True
+    )
+
+    customer_list = [["Harrison", "Chase"], 
+                     ["Lang", "Chain"],
+                     ["Dolly", "Too"],
+                     ["Elle", "Elem"], 
+                     ["Geoff","Fusion"], 
+                     ["Trance","Former"],
+                     ["Jen","Ayai"]
+                    ]
+
+    agent.run(f"""Sort these customers by \
 last name and then first name \
 and print the output: {customer_list}""")
 
 
-# View detailed outputs of the chains
-import langchain
-langchain.debug=True
-agent.run(f"""Sort these customers by \
+    # View detailed outputs of the chains
+    '''
+    The tracer records each step of the agent as a span (the LLM calls, the tool calls, the parsing) with
+    its duration and tokens, nested under the agent run; OTLPJSONExporter writes them in the OpenTelemetry
+    format. sample_rate=0.1 would trace only one agent run out of ten.
+    '''
+    from .tracing import Tracer, OTLPJSONExporter
+    tracer = Tracer(OTLPJSONExporter("traces.otlp.jsonl"))
+    tracer.activate()
+    agent.run(f"""Sort these customers by \
 last name and then first name \
 and print the output: {customer_list}""") 
-langchain.debug=False
-
-
-# Define your own tool
-#!pip install DateTime
-
-from langchain.agents import tool
-from datetime import date
-
-
-@tool
-def time(text: str) -> str:
-    """Returns todays date, use this for any \
-    questions related to knowing todays date. \
-    The input should always be an empty string, \
-    and this function will always return todays \
-    date - any date mathmatics should occur \
-    outside this function."""
-    return str(date.today())
-
-agent= initialize_agent(
-    tools + [time], 
-    llm, 
-    agent=AgentType.CHAT_ZERO_SHOT_REACT_DESCRIPTION,
-    handle_parsing_errors=True,
-    verbose = True)
-
-'''
-Note:
-The agent will sometimes come to the wrong conclusion (agents are a work in progress!).
-If it does, please try running it again.
-'''
-
-try:
-    result = agent("whats the date today?") 
-except: 
-    print("exception on external access")
-
-
+    tracer.deactivate()
+    print(tracer.summary())
+
+
+    # Python agent on a pool of worker processes
+    '''
+    PythonREPLTool runs the code in this process: a snippet that never ends blocks the agent, and several
+    agent sessions cannot run code at the same time. PooledPythonREPLTool sends it to a PythonWorkerPool:
+    worker processes started in advance (one per core), with a CPU time, memory and wall-clock limit for each
+    execution, replaced after max_runs_per_worker executions. Every agent can share the same pool.
+    '''
+    from .python_pool import PythonWorkerPool, PooledPythonREPLTool
+
+    python_pool = PythonWorkerPool(max_runs_per_worker=100, cpu_seconds=5, memory_mb=512, timeout=10)
+    agent = create_python_agent(
+        llm,
+        tool=PooledPythonREPLTool(pool=python_pool),
+        verbose=True
+    )
+    agent.run(f"""Sort these customers by \
+last name and then first name \
+and print the output: {customer_list}""")
+    print(python_pool.stats()) # {'runs': ..., 'ok': ..., 'cpu_limit': ..., 'memory_limit': ..., 'timeout': ..., 'killed': ...}
+
+
+    # Define your own tool
+    #!pip install DateTime
+
+    from langchain.agents import tool
+    from datetime import date
+
+
+    @tool
+    def time(text: str) -> str:
+        """Returns todays date, use this for any \
+        questions related to knowing todays date. \
+        The input should always be an empty string, \
+        and this function will always return todays \
+        date - any date mathmatics should occur \
+        outside this function."""
+        return str(date.today())
+
+    agent= initialize_agent(
+        tools + [time], 
+        llm, 
+        agent=AgentType.CHAT_ZERO_SHOT_REACT_DESCRIPTION,
+        handle_parsing_errors=True,
+        verbose = True)
+
+    '''
+    Note:
+    The agent will sometimes come to the wrong conclusion (agents are a work in progress!).
+    If it does, please try running it again.
+    '''
+
+    try:
+        result = agent("whats the date today?") 
+    except: 
+        print("exception on external access")
+
+
+
+
+
+    # Cached, parallel tool calls
+    '''
+    The agent above asks Wikipedia again for a page it looked up for an earlier question, and runs the
+    actions of a step one by one. CachingAgentExecutor keeps the observations of the tools listed in tool_ttl
+    for that many seconds (keyed on the action_input, ignoring extra spaces) and runs the actions of a step
+    in parallel. The other tools (here, the date) are never cached.
+    This ReAct agent plans one action per step, so here the gain comes from the cache: the parallel actions
+    help agents that ask for several tools at once (create_openai_tools_agent with parallel tool calls).
+    With local_wikipedia() the agent runs without network, from a few pages stored in wikipedia_fixture.py.
+    '''
+    from .tool_executor import CachingAgentExecutor, replace_tool
+    from .wikipedia_fixture import local_wikipedia
+
+    with CachingAgentExecutor.from_executor(
+        agent,
+        tool_ttl={"wikipedia": 24 * 3600},
+        max_workers=4,
+    ) as cached_agent:
+        cached_agent(question)
+        cached_agent(question) # the Wikipedia lookups are answered from the cache
+        print(cached_agent.stats()) # {'cache_hits': ..., 'cache_misses': ...}
+
+    with CachingAgentExecutor.from_executor(
+        initialize_agent(
+            replace_tool(tools + [time], local_wikipedia()),
+            llm,
+            agent=AgentType.CHAT_ZERO_SHOT_REACT_DESCRIPTION,
+            handle_parsing_errors=True,
+            verbose=True),
+        tool_ttl={"wikipedia": 24 * 3600},
+    ) as offline_agent:
+        offline_agent(question)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+# Approximate Nearest Neighbour (IVF) Index
+'''
+Even NumpyVectorStore compares the query with every row: the cost of a search grows with the catalog.
+
+An IVF (inverted file) index splits the vectors into `nlist` clusters with k-means.
+A search first compares the query with the cluster centers only, then scores the rows
+of the `nprobe` closest clusters. With nlist=1000 and nprobe=10, about 1% of the rows are scored.
+
+The result is approximate: the true best match may sit in a cluster that was not probed.
+nprobe is the knob: higher nprobe -> better recall, slower search. recall_benchmark() compares
+the index with the exact search so you can pick the smallest nprobe with the recall you need.
+
+Vectors can be added after training (they join the closest cluster), and the index
+can be saved to / loaded from disk. Each time the index doubles in size it is trained again,
+so the clusters (and, with nlist=None, their number) keep up with the data.
+'''
+import json
+import os
+import time
+
+import numpy as np
+from langchain.schema import Document
+
+from .numpy_vectorstore import normalize, top_k, NumpyVectorStore
+
+# Number of rows assigned to clusters at once, to bound the size of the score matrix.
+ASSIGN_CHUNK = 65536
+
+
+def kmeans(vectors, nlist, iterations=20, seed=0):
+    """Spherical k-means: centers are normalized so the closest center has the highest dot product."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = assign(vectors, centroids)
+        counts = np.bincount(assignments, minlength=nlist)
+        empty = counts == 0
+        # Sum the vectors of each cluster: sort them by cluster, then add up each contiguous run.
+        order = np.argsort(assignments, kind="stable")
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        sums = np.zeros_like(centroids)
+        sums[~empty] = np.add.reduceat(vectors[order], starts[~empty], axis=0)
+        # An empty cluster takes a random vector as its new center.
+        sums[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()))]
+        centroids = normalize(sums)
+    return centroids
+
+
+def default_nlist(size):
+    """Number of clusters when nlist is not given: the square root of the number of rows."""
+    return max(1, int(np.sqrt(size)))
+
+
+def assign(vectors, centroids):
+    out = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), ASSIGN_CHUNK):
+        chunk = vectors[start:start + ASSIGN_CHUNK]
+        out[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return out
+
+
+class IVFIndex:
+    """Inverted-file index over normalized float32 vectors (cosine similarity)."""
+
+    def __init__(self, nlist=None, nprobe=8, train_size_per_list=39):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_size_per_list = train_size_per_list
+        self._auto_nlist = nlist is None
+        self.clear()
+
+    def clear(self):
+        """Remove every vector; nlist, nprobe and train_size_per_list are kept."""
+        if self._auto_nlist:
+            self.nlist = None
+        self._trained_size = 0
+        self.centroids = None
+        self._vectors = None
+        self._size = 0
+        self.assignments = np.empty(0, dtype=np.int64)
+        self._lists = None  # cluster -> array of row ids, rebuilt after adds
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def vectors(self):
+        if self._vectors is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return self._vectors[:self._size]
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    def train(self, iterations=20, seed=0):
+        vectors = self.vectors
+        nlist = default_nlist(len(vectors)) if self._auto_nlist else self.nlist
+        nlist = min(nlist, len(vectors))
+        sample_size = min(len(vectors), nlist * self.train_size_per_list * 4)
+        sample = vectors[np.random.default_rng(seed).choice(len(vectors), sample_size, replace=False)]
+        self.nlist = nlist
+        self.centroids = kmeans(sample, nlist, iterations, seed)
+        self.assignments = assign(vectors, self.centroids)
+        self._lists = None
+        self._trained_size = len(vectors)
+
+    def _should_retrain(self):
+        if self._size < 2 * self._trained_size:
+            return False
+        if self._auto_nlist:
+            return default_nlist(self._size) > self.nlist
+        # A fixed nlist gains nothing once the training sample is full.
+        return self._trained_size < self.nlist * self.train_size_per_list * 4
+
+    def add(self, vectors):
+        vectors = normalize(vectors)
+        needed = self._size + len(vectors)
+        if self._vectors is None or needed > len(self._vectors):
+            capacity = max(needed, 2 * self._size, 1024)
+            grown = np.empty((capacity, vectors.shape[1]), dtype=np.float32)
+            if self._size:
+                grown[:self._size] = self.vectors
+            self._vectors = grown
+        self._vectors[self._size:needed] = vectors
+        self._size = needed
+
+        if self.is_trained and self._should_retrain():
+            self.train()
+        elif self.is_trained:
+            self.assignments = np.concatenate([self.assignments, assign(vectors, self.centroids)])
+            self._lists = None
+        elif self._size >= (self.nlist or default_nlist(self._size)) * self.train_size_per_list:
+            # Enough vectors to train the clusters the first time
+            # (with nlist=None, from about 1500 rows: sqrt(rows) clusters of train_size_per_list rows).
+            self.train()
+
+    @property
+    def lists(self):
+        if self._lists is None:
+            order = np.argsort(self.assignments, kind="stable")
+            bounds = np.searchsorted(self.assignments[order], np.arange(self.nlist + 1))
+            self._lists = [order[bounds[c]:bounds[c + 1]] for c in range(self.nlist)]
+        return self._lists
+
+    def search(self, queries, k=4, nprobe=None):
+        """Return (scores, ids) for each query: two lists of arrays, best match first."""
+        if len(queries) == 0:
+            return [], []
+        queries = normalize(queries).reshape(len(queries), -1)
+        vectors = self.vectors
+        if not self.is_trained:
+            # Too few vectors to cluster yet: exact search.
+            scores = queries @ vectors.T
+            best = top_k(scores, k)
+            return [scores[i, best[i]] for i in range(len(queries))], list(best)
+
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        probes = top_k(queries @ self.centroids.T, nprobe)
+        lists = self.lists
+        all_scores, all_ids = [], []
+        for query, probe in zip(queries, probes):
+            candidates = np.concatenate([lists[c] for c in probe])
+            scores = vectors[candidates] @ query
+            best = top_k(scores[None, :], k)[0]
+            all_scores.append(scores[best])
+            all_ids.append(candidates[best])
+        return all_scores, all_ids
+
+    def save(self, path):
+        np.savez(
+            path,
+            vectors=self.vectors,
+            centroids=self.centroids if self.is_trained else np.empty((0, 0), dtype=np.float32),
+            assignments=self.assignments,
+            params=np.array(json.dumps({
+                "nlist": None if self._auto_nlist else self.nlist,
+                "nprobe": self.nprobe,
+                "train_size_per_list": self.train_size_per_list,
+                "trained_size": self._trained_size,
+            })),
+        )
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        params = json.loads(str(data["params"]))
+        trained_size = params.pop("trained_size", None)
+        index = cls(**params)
+        index._vectors = data["vectors"]
+        index._size = len(index._vectors)
+        if data["centroids"].size:
+            index.centroids = data["centroids"]
+            index.nlist = len(index.centroids)
+            index._trained_size = index._size if trained_size is None else trained_size
+        index.assignments = data["assignments"]
+        return index
+
+
+def recall_benchmark(index, queries, k=4, nprobes=(1, 2, 4, 8, 16, 32)):
+    """Recall@k and latency of the IVF search for several nprobe values, against the exact search."""
+    queries = normalize(queries)
+    started = time.perf_counter()
+    exact = top_k(queries @ index.vectors.T, k)
+    exact_ms = (time.perf_counter() - started) * 1000 / len(queries)
+
+    results = [{"nprobe": "exact", "recall": 1.0, "ms_per_query": exact_ms}]
+    for nprobe in nprobes:
+        if index.is_trained and nprobe > index.nlist:
+            break
+        started = time.perf_counter()
+        _, ids = index.search(queries, k, nprobe=nprobe)
+        elapsed_ms = (time.perf_counter() - started) * 1000 / len(queries)
+        found = sum(len(set(got.tolist()) & set(want.tolist())) for got, want in zip(ids, exact))
+        results.append({
+            "nprobe": nprobe,
+            "recall": found / (len(queries) * exact.shape[1]),
+            "ms_per_query": elapsed_ms,
+        })
+    return results
+
+
+class IVFVectorStore(NumpyVectorStore):
+    """NumpyVectorStore searching through an IVFIndex instead of scanning every row."""
+
+    def __init__(self, embedding, index=None, documents=None, ids=None, nlist=None, nprobe=8):
+        super().__init__(embedding, documents=documents, ids=ids)
+        self.index = index or IVFIndex(nlist=nlist, nprobe=nprobe)
+
+    @property
+    def matrix(self):
+        return self.index.vectors
+
+    def __len__(self):
+        return len(self.index)
+
+    def clear(self):
+        self.index.clear()
+        self.documents = []
+        self.ids = []
+
+    def add_embeddings(self, texts, vectors, metadatas=None, ids=None):
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = list(ids) if ids is not None else [str(i) for i in range(len(self), len(self) + len(texts))]
+        self.index.add(np.asarray(vectors, dtype=np.float32).reshape(len(texts), -1))
+        self.documents.extend(
+            Document(page_content=t, metadata=m) for t, m in zip(texts, metadatas)
+        )
+        self.ids.extend(ids)
+        return ids
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, nlist=None, nprobe=8, **kwargs):
+        store = cls(embedding, nlist=nlist, nprobe=nprobe)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        if not store.index.is_trained and len(store):
+            store.index.train()
+        return store
+
+    def similarity_search_with_score_by_vectors(self, vectors, k=4, nprobe=None):
+        if len(self) == 0:
+            return [[] for _ in vectors]
+        scores, ids = self.index.search(vectors, k, nprobe=nprobe)
+        return [
+            [(self.documents[i], float(s)) for s, i in zip(row_scores, row_ids)]
+            for row_scores, row_ids in zip(scores, ids)
+        ]
+
+    def save_local(self, folder):
+        os.makedirs(folder, exist_ok=True)
+        self.index.save(os.path.join(folder, "ivf.npz"))
+        with open(os.path.join(folder, "documents.jsonl"), "w", encoding="utf-8") as f:
+            for doc_id, doc in zip(self.ids, self.documents):
+                f.write(json.dumps({
+                    "id": doc_id,
+                    "page_content": doc.page_content,
+                    "metadata": doc.metadata,
+                }) + "\n")
+
+    @classmethod
+    def load_local(cls, folder, embedding):
+        index = IVFIndex.load(os.path.join(folder, "ivf.npz"))
+        with open(os.path.join(folder, "documents.jsonl"), encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        documents = [Document(page_content=r["page_content"], metadata=r["metadata"]) for r in records]
+        return cls(embedding, index=index, documents=documents, ids=[r["id"] for r in records])
+
+
+if __name__ == "__main__":
+    # Synthetic clustered vectors, to see the recall/latency trade-off without any API call.
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(200, 256))
+    data = centers[rng.integers(0, 200, 100_000)] + 0.3 * rng.normal(size=(100_000, 256))
+    index = IVFIndex(nlist=316)
+    index.add(data)
+    queries = data[rng.integers(0, len(data), 200)] + 0.1 * rng.normal(size=(200, 256))
+    for row in recall_benchmark(index, queries, k=10):
+        print(row)
@@ -0,0 +1,133 @@
+# Background Summary Buffer Memory
+'''
+ConversationSummaryBufferMemory calls the LLM inside save_context as soon as the buffer is
+over max_token_limit, so conversation.predict(...) only returns once that summary is written:
+the user waits for two LLM calls instead of one.
+
+BackgroundSummaryBufferMemory moves the overflowed turns to a pending list and returns at once.
+A background thread summarizes them into the moving summary. Until the new summary lands,
+the pending turns are still given to the prompt word for word, so nothing is lost in between.
+Turns that overflow while a summary is being written are summarized together in the next call
+(batch_delay lets the thread wait a little to group more of them). The thread only lives while
+there are turns to summarize: it ends when the pending list is empty and the next overflow starts
+a new one, so an idle or forgotten conversation does not keep a thread (and itself) alive.
+
+With background=False it behaves exactly like ConversationSummaryBufferMemory.
+'''
+import threading
+import time
+from typing import Any
+
+from langchain.memory import ConversationSummaryBufferMemory
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain.pydantic_v1 import PrivateAttr
+from langchain.schema import get_buffer_string
+
+
+class BackgroundSummaryBufferMemory(ConversationSummaryBufferMemory):
+    """ConversationSummaryBufferMemory summarizing overflowed turns in a background thread."""
+
+    background: bool = True
+    batch_delay: float = 0.0
+    """Seconds to wait before summarizing, so that more overflowed turns share one LLM call."""
+    summary_calls: int = 0
+    overflow_events: int = 0
+    last_error: Any = None
+
+    _pending: Any = PrivateAttr(default_factory=list)
+    _condition: Any = PrivateAttr(default_factory=threading.Condition)
+    _worker: Any = PrivateAttr(default=None)
+    _busy: bool = PrivateAttr(default=False)
+    _failed: bool = PrivateAttr(default=False)
+    _generation: int = PrivateAttr(default=0)
+
+    def load_memory_variables(self, inputs):
+        with self._condition:
+            buffer = self._pending + self.chat_memory.messages
+            summary = self.moving_summary_buffer
+        if summary != "":
+            buffer = [self.summary_message_cls(content=summary)] + buffer
+        if self.return_messages:
+            final_buffer = buffer
+        else:
+            final_buffer = get_buffer_string(
+                buffer, human_prefix=self.human_prefix, ai_prefix=self.ai_prefix
+            )
+        return {self.memory_key: final_buffer}
+
+    def save_context(self, inputs, outputs):
+        if not self.background:
+            return super().save_context(inputs, outputs)
+        with self._condition:
+            BaseChatMemory.save_context(self, inputs, outputs)
+        self.prune()
+
+    def prune(self):
+        if not self.background:
+            return super().prune()
+        # Under the lock: the turns move from the buffer to the pending list in one step,
+        # without racing another save_context or being missing from load_memory_variables.
+        with self._condition:
+            buffer = self.chat_memory.messages
+            curr_buffer_length = self.llm.get_num_tokens_from_messages(buffer)
+            if curr_buffer_length <= self.max_token_limit:
+                return
+            pruned_memory = []
+            while curr_buffer_length > self.max_token_limit:
+                pruned_memory.append(buffer.pop(0))
+                curr_buffer_length = self.llm.get_num_tokens_from_messages(buffer)
+            self._pending.extend(pruned_memory)
+            self.overflow_events += 1
+            self._failed = False
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="summary-memory", daemon=True)
+                self._worker.start()
+            self._condition.notify_all()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._pending or self._failed:
+                    # Nothing left to do (or the call failed): end the thread, prune() starts a new one.
+                    self._worker = None
+                    self._condition.notify_all()
+                    return
+                self._busy = True
+            if self.batch_delay:
+                time.sleep(self.batch_delay)
+            with self._condition:
+                batch = list(self._pending)
+                summary = self.moving_summary_buffer
+                generation = self._generation
+            try:
+                new_summary = self.predict_new_summary(batch, summary)
+            except Exception as e:
+                # Keep the turns pending (they are still in the prompt) and retry
+                # with the next overflow.
+                with self._condition:
+                    self.last_error = e
+                    self._failed = True
+                    self._busy = False
+                    self._condition.notify_all()
+                continue
+            with self._condition:
+                # clear() may have been called while the summary was written.
+                if generation == self._generation:
+                    self.moving_summary_buffer = new_summary
+                    del self._pending[:len(batch)]
+                    self.summary_calls += 1
+                self._busy = False
+                self._condition.notify_all()
+
+    def wait(self, timeout=None):
+        """Block until the pending turns are summarized (or the summary call failed)."""
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self._busy and (not self._pending or self._failed), timeout
+            )
+
+    def clear(self):
+        with self._condition:
+            self._generation += 1
+            self._pending.clear()
+            super().clear()
@@ -0,0 +1,192 @@
+# Benchmarks
+'''
+Runs each course flow against the offline backend of fake_backend.py, so what is measured is
+the time spent in LangChain and in our code, not the provider:
+- translation: prompt template + chat model (start.py, prompt_template.py)
+- sequential: SimpleSequentialChain of two LLMChains (chains.py)
+- router: MultiPromptChain with the LLM router (chains.py)
+- memory: ConversationChain with a window memory (memory.py)
+- retrieval_qa: RetrievalQA "stuff" over a vector store of a synthetic catalog (Doc_Q&A.py)
+- structured: prompt with format instructions + StructuredOutputParser (output_parser.py)
+
+For each flow: calls per second, p50 / p99 latency (ms), and the memory allocated per call
+(peak, and what is still allocated after the call), measured with tracemalloc in a separate run
+so that tracing does not slow the timed one.
+
+    python -m open_ai_code.benchmarks --iterations 200
+    python -m open_ai_code.benchmarks --flows router memory --latency 0.05 --tokens-per-second 50
+'''
+import argparse
+import json
+import time
+import tracemalloc
+import warnings
+
+from langchain.chains import ConversationChain, LLMChain, RetrievalQA, SimpleSequentialChain
+from langchain.chains.router import MultiPromptChain
+from langchain.chains.router.llm_router import LLMRouterChain, RouterOutputParser
+from langchain.chains.router.multi_prompt_prompt import MULTI_PROMPT_ROUTER_TEMPLATE
+from langchain.memory import ConversationBufferWindowMemory
+from langchain.output_parsers import ResponseSchema, StructuredOutputParser
+from langchain.prompts import ChatPromptTemplate, PromptTemplate
+
+from .latency import percentile
+from .fake_backend import FakeChatModel, FakeEmbeddings
+from .numpy_vectorstore import NumpyVectorStore
+
+TRANSLATION_TEMPLATE = """Translate the text \
+that is delimited by triple backticks \
+into a style that is {style}. \
+text: ```{text}```
+"""
+
+CUSTOMER_EMAIL = """Arrr, I be fuming that me blender lid flew off and splattered me kitchen walls \
+with smoothie! And to make matters worse, the warranty don't cover the cost of cleaning up me kitchen."""
+
+REVIEW = """This leaf blower is pretty amazing. It arrived in two days, just in time for my wife's \
+anniversary present. It's slightly more expensive than the other leaf blowers out there."""
+
+
+def build_flows(llm, embeddings):
+    """{name: function running one call of the flow}."""
+    flows = {}
+
+    translation = ChatPromptTemplate.from_template(TRANSLATION_TEMPLATE)
+    flows["translation"] = lambda: llm.invoke(
+        translation.format_messages(style="American English in a calm tone", text=CUSTOMER_EMAIL)
+    ).content
+
+    first = LLMChain(llm=llm, prompt=ChatPromptTemplate.from_template(
+        "What is the best name to describe a company that makes {product}?"))
+    second = LLMChain(llm=llm, prompt=ChatPromptTemplate.from_template(
+        "Write a 20 words description for the following company: {company_name}"))
+    sequential = SimpleSequentialChain(chains=[first, second])
+    flows["sequential"] = lambda: sequential.run("Queen Size Sheet Set")
+
+    prompt_infos = [
+        ("physics", "Good for answering questions about physics"),
+        ("math", "Good for answering math questions"),
+        ("history", "Good for answering history questions"),
+    ]
+    destination_chains = {
+        name: LLMChain(llm=llm, prompt=ChatPromptTemplate.from_template(
+            f"You are an expert in {name}.\n\nHere is a question:\n{{input}}"))
+        for name, _ in prompt_infos
+    }
+    router_prompt = PromptTemplate(
+        template=MULTI_PROMPT_ROUTER_TEMPLATE.format(
+            destinations="\n".join(f"{name}: {description}" for name, description in prompt_infos)
+        ),
+        input_variables=["input"],
+        output_parser=RouterOutputParser(),
+    )
+    router = MultiPromptChain(
+        router_chain=LLMRouterChain.from_llm(llm, router_prompt),
+        destination_chains=destination_chains,
+        default_chain=LLMChain(llm=llm, prompt=ChatPromptTemplate.from_template("{input}")),
+    )
+    flows["router"] = lambda: router.run("What is black body radiation?")
+
+    conversation = ConversationChain(llm=llm, memory=ConversationBufferWindowMemory(k=5))
+    flows["memory"] = lambda: conversation.predict(input="What is on the schedule today?")
+
+    catalog = [
+        f"name: Product {i}\ndescription: A {color} {kind} with {feature}."
+        for i, (color, kind, feature) in enumerate(
+            (color, kind, feature)
+            for color in ("blue", "red", "green", "black", "white")
+            for kind in ("shirt", "jacket", "hat", "pants", "blender")
+            for feature in ("sun protection", "pockets", "a lid", "UPF 50+", "a zipper", "stretch fabric", "a hood", "a warranty")
+        )
+    ]
+    db = NumpyVectorStore.from_texts(catalog, embeddings, metadatas=[{"row": i} for i in range(len(catalog))])
+    qa = RetrievalQA.from_chain_type(llm=llm, chain_type="stuff", retriever=db.as_retriever())
+    flows["retrieval_qa"] = lambda: qa.run("Please list all your shirts with sun protection.")
+
+    parser = StructuredOutputParser.from_response_schemas([
+        ResponseSchema(name="gift", description="Was the item purchased as a gift?"),
+        ResponseSchema(name="delivery_days", description="How many days did it take to arrive?"),
+        ResponseSchema(name="price_value", description="Sentences about the value or price."),
+    ])
+    review_prompt = ChatPromptTemplate.from_template(
+        "For the following text, extract the following information:\n\ntext: {text}\n\n{format_instructions}"
+    )
+    format_instructions = parser.get_format_instructions()
+    flows["structured"] = lambda: parser.parse(llm.invoke(
+        review_prompt.format_messages(text=REVIEW, format_instructions=format_instructions)
+    ).content)
+    return flows
+
+
+def time_flow(fn, iterations, warmup=5):
+    """Latency (ms) of each of `iterations` calls of `fn`, and the total seconds."""
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        call_started = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - call_started) * 1000)
+    return latencies, time.perf_counter() - started
+
+
+def allocations(fn, iterations):
+    """Mean peak and retained memory (KB) allocated by one call of `fn`, traced with tracemalloc."""
+    tracemalloc.start()
+    peaks, retained = [], []
+    try:
+        for _ in range(iterations):
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            fn()
+            after, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            retained.append(after - before)
+    finally:
+        tracemalloc.stop()
+    return sum(peaks) / len(peaks) / 1024, sum(retained) / len(retained) / 1024
+
+
+def run_benchmarks(flows=None, iterations=200, alloc_iterations=20, latency=0.0, tokens_per_second=0.0):
+    llm = FakeChatModel(latency=latency, tokens_per_second=tokens_per_second)
+    all_flows = build_flows(llm, FakeEmbeddings())
+    results = {}
+    for name in flows or all_flows:
+        fn = all_flows[name]
+        latencies, seconds = time_flow(fn, iterations)
+        peak_kb, retained_kb = allocations(fn, alloc_iterations)
+        results[name] = {
+            "ops_per_second": iterations / seconds,
+            "p50_ms": percentile(latencies, 50),
+            "p99_ms": percentile(latencies, 99),
+            "peak_kb_per_call": peak_kb,
+            "retained_kb_per_call": retained_kb,
+        }
+    return results
+
+
+def print_table(results):
+    print(f"{'flow':14} {'ops/sec':>10} {'p50 ms':>9} {'p99 ms':>9} {'peak KB':>9} {'kept KB':>9}")
+    for name, r in results.items():
+        print(
+            f"{name:14} {r['ops_per_second']:10.1f} {r['p50_ms']:9.2f} {r['p99_ms']:9.2f} "
+            f"{r['peak_kb_per_call']:9.1f} {r['retained_kb_per_call']:9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--flows", nargs="*", default=None)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--alloc-iterations", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="0 = instant")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore")  # LangChain deprecation warnings
+    results = run_benchmarks(args.flows, args.iterations, args.alloc_iterations, args.latency, args.tokens_per_second)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
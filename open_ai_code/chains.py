@@ -10,126 +10,154 @@ essentially, it's the most fundamental way to use an LLM within LangChain by def
 from langchain.prompts import PromptTemplate
 from langchain.chains.router import MultiPromptChain
 from langchain.chains import SequentialChain
-from langchain.chat_models import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
+from .client_pool import get_registry, shared_chat_model, shared_embedding_model
+from .compiled_prompt import CompiledChatPromptTemplate
 from langchain.chains import LLMChain
+from langchain.globals import set_llm_cache
+from .llm_cache import SemanticLLMCache
 
 
-llm = ChatOpenAI(temperature=0.0, llm_model="gpt-3.5-turbo-0301")
+def main():
+    # Cache the answers of the temperature=0 models (the temperature=0.9 ones are never cached)
+    set_llm_cache(SemanticLLMCache("llm_cache.sqlite"))
 
-prompt = ChatPromptTemplate.from_template(
-    "What is the best name to describe a company that makes {product}?"
-)
-chain = LLMChain(llm=llm, prompt=prompt)
-product = "Queen Size Sheet Set"
-chain.run(product)
+    llm = shared_chat_model(temperature=0.0, model="gpt-3.5-turbo-0301")
 
+    prompt = CompiledChatPromptTemplate.from_template(
+        "What is the best name to describe a company that makes {product}?"
+    )
+    chain = LLMChain(llm=llm, prompt=prompt)
+    product = "Queen Size Sheet Set"
+    chain.run(product)
 
-# SimpleSequential Chain
-'''
-SimpleSequentialChain. The simplest form of a sequential chain is where each step has a single input and output. 
-The output of one step is passed as input to the next step in the chain. 
-You would use SimpleSequentialChain it when you have a linear pipeline where each step has a single input and output.
-'''
-from langchain.chains import SimpleSequentialChain
 
-llm = ChatOpenAI(temperature=0.9, model="gpt-3.5-turbo-0301")
+    # SimpleSequential Chain
+    '''
+    SimpleSequentialChain. The simplest form of a sequential chain is where each step has a single input and output. 
+    The output of one step is passed as input to the next step in the chain. 
+    You would use SimpleSequentialChain it when you have a linear pipeline where each step has a single input and output.
+    '''
+    from langchain.chains import SimpleSequentialChain
 
-# prompt template 1
-first_prompt = ChatPromptTemplate.from_template(
-    "What is the best name to describe \
+    llm = shared_chat_model(temperature=0.9, model="gpt-3.5-turbo-0301")
+
+    # prompt template 1
+    first_prompt = CompiledChatPromptTemplate.from_template(
+        "What is the best name to describe \
     a company that makes {product}?"
-)
+    )
 
-# Chain 1
-chain_one = LLMChain(llm=llm, prompt=first_prompt)
+    # Chain 1
+    chain_one = LLMChain(llm=llm, prompt=first_prompt)
 
-# prompt template 2
-second_prompt = ChatPromptTemplate.from_template(
-    "Write a 20 words description for the following \
+    # prompt template 2
+    second_prompt = CompiledChatPromptTemplate.from_template(
+        "Write a 20 words description for the following \
     company:{company_name}"
-)
-# chain 2
-chain_two = LLMChain(llm=llm, prompt=second_prompt)
-
-overall_simple_chain = SimpleSequentialChain(chains=[chain_one, chain_two], verbose=True)
-overall_simple_chain.run(product)
-
-
-# Sequential Chain
-'''
-This is used when you have multiple inputs or multiple outputs. It merges various chains by using the output of one chain as the input for the next.
-It operates by executing a series of chains consecutively.
-This approach is valuable when you need to utilize the result of one operation as the starting point for the next one, creating a seamless flow of processes.
-'''
-
-llm = ChatOpenAI(temperature=0.9, model="gpt-3.5-turbo-0301")
-
-# prompt template 1: translate to english
-first_prompt = ChatPromptTemplate.from_template(
-    "Translate the following review to english:"
-    "\n\n{Review}"
-)
-# chain 1: input= Review and output= English_Review
-chain_one = LLMChain(llm=llm, prompt=first_prompt,
-                     output_key="English_Review"
-                     )
-
-second_prompt = ChatPromptTemplate.from_template(
-    "Can you summarize the following review in 1 sentence:"
-    "\n\n{English_Review}"
-)
-# chain 2: input= English_Review and output= summary
-chain_two = LLMChain(llm=llm, prompt=second_prompt,
-                     output_key="summary"
-                     )
-
-# prompt template 3: translate to english
-third_prompt = ChatPromptTemplate.from_template(
-    "What language is the following review:\n\n{Review}"
-)
-# chain 3: input= Review and output= language
-chain_three = LLMChain(llm=llm, prompt=third_prompt,
-                       output_key="language"
-                       )
-
-
-# prompt template 4: follow up message
-fourth_prompt = ChatPromptTemplate.from_template(
-    "Write a follow up response to the following "
-    "summary in the specified language:"
-    "\n\nSummary: {summary}\n\nLanguage: {language}"
-)
-# chain 4: input= summary, language and output= followup_message
-chain_four = LLMChain(llm=llm, prompt=fourth_prompt,
-                      output_key="followup_message"
-                      )
-# overall_chain: input= Review
-# and output= English_Review,summary, followup_message
-overall_chain = SequentialChain(
-    chains=[chain_one, chain_two, chain_three, chain_four],
-    input_variables=["Review"],
-    output_variables=["English_Review", "summary", "followup_message"],
-    verbose=True
-)
-
-review = df.Review[5] # panda dataframe
-overall_chain(review)
-
-
-# Router Chain
-'''
-The Router Chain is used for complicated tasks. 
-If we have multiple subchains, each of which is specialized for a particular type of input, 
-we could have a router chain that decides which subchain to pass the input to.
-
-It consists of:
-Router Chain: It is responsible for selecting the next chain to call.
-Destination Chains: Chains that the router chain can route to.
-Default chain: Used when the router can’t decide which subchain to use.
-'''
-
-physics_template = """You are a very smart physics professor. \
+    )
+    # chain 2
+    chain_two = LLMChain(llm=llm, prompt=second_prompt)
+
+    overall_simple_chain = SimpleSequentialChain(chains=[chain_one, chain_two], verbose=True)
+    overall_simple_chain.run(product)
+
+
+    # Sequential Chain
+    '''
+    This is used when you have multiple inputs or multiple outputs. It merges various chains by using the output of one chain as the input for the next.
+    It operates by executing a series of chains consecutively.
+    This approach is valuable when you need to utilize the result of one operation as the starting point for the next one, creating a seamless flow of processes.
+    '''
+
+    llm = shared_chat_model(temperature=0.9, model="gpt-3.5-turbo-0301")
+
+    # prompt template 1: translate to english
+    first_prompt = CompiledChatPromptTemplate.from_template(
+        "Translate the following review to english:"
+        "\n\n{Review}"
+    )
+    # chain 1: input= Review and output= English_Review
+    chain_one = LLMChain(llm=llm, prompt=first_prompt,
+                         output_key="English_Review"
+                         )
+
+    second_prompt = CompiledChatPromptTemplate.from_template(
+        "Can you summarize the following review in 1 sentence:"
+        "\n\n{English_Review}"
+    )
+    # chain 2: input= English_Review and output= summary
+    chain_two = LLMChain(llm=llm, prompt=second_prompt,
+                         output_key="summary"
+                         )
+
+    # prompt template 3: translate to english
+    third_prompt = CompiledChatPromptTemplate.from_template(
+        "What language is the following review:\n\n{Review}"
+    )
+    # chain 3: input= Review and output= language
+    chain_three = LLMChain(llm=llm, prompt=third_prompt,
+                           output_key="language"
+                           )
+
+
+    # prompt template 4: follow up message
+    fourth_prompt = CompiledChatPromptTemplate.from_template(
+        "Write a follow up response to the following "
+        "summary in the specified language:"
+        "\n\nSummary: {summary}\n\nLanguage: {language}"
+    )
+    # chain 4: input= summary, language and output= followup_message
+    chain_four = LLMChain(llm=llm, prompt=fourth_prompt,
+                          output_key="followup_message"
+                          )
+    # overall_chain: input= Review
+    # and output= English_Review,summary, followup_message
+    overall_chain = SequentialChain(
+        chains=[chain_one, chain_two, chain_three, chain_four],
+        input_variables=["Review"],
+        output_variables=["English_Review", "summary", "followup_message"],
+        verbose=True
+    )
+
+    review = df.Review[5] # panda dataframe
+    overall_chain(review)
+
+
+    # DAG Sequential Chain
+    '''
+    chain_three (language) only needs the Review, so it does not have to wait for chain_one and chain_two.
+    DAGSequentialChain takes the same arguments as SequentialChain, works out which chain depends on which
+    from their input and output keys, and runs the independent ones at the same time.
+    '''
+    from .dag_chain import DAGSequentialChain
+
+    overall_chain = DAGSequentialChain(
+        chains=[chain_one, chain_two, chain_three, chain_four],
+        input_variables=["Review"],
+        output_variables=["English_Review", "summary", "followup_message"],
+    )
+    overall_chain(review)
+
+    # The whole dataframe, with at most 8 reviews in flight at a time
+    results = overall_chain.batch(
+        [{"Review": r} for r in df.Review],
+        config={"max_concurrency": 8},
+    )
+
+
+    # Router Chain
+    '''
+    The Router Chain is used for complicated tasks. 
+    If we have multiple subchains, each of which is specialized for a particular type of input, 
+    we could have a router chain that decides which subchain to pass the input to.
+
+    It consists of:
+    Router Chain: It is responsible for selecting the next chain to call.
+    Destination Chains: Chains that the router chain can route to.
+    Default chain: Used when the router can’t decide which subchain to use.
+    '''
+
+    physics_template = """You are a very smart physics professor. \
 You are great at answering questions about physics in a concise\
 and easy to understand manner. \
 When you don't know the answer to a question you admit\
@@ -139,7 +167,7 @@ Here is a question:
 {input}"""
 
 
-math_template = """You are a very good mathematician. \
+    math_template = """You are a very good mathematician. \
 You are great at answering math questions. \
 You are so good because you are able to break down \
 hard problems into their component parts, 
@@ -149,7 +177,7 @@ to answer the broader question.
 Here is a question:
 {input}"""
 
-history_template = """You are a very good historian. \
+    history_template = """You are a very good historian. \
 You have an excellent knowledge of and understanding of people,\
 events and contexts from a range of historical periods. \
 You have the ability to think, reflect, debate, discuss and \
@@ -161,7 +189,7 @@ Here is a question:
 {input}"""
 
 
-computerscience_template = """ You are a successful computer scientist.\
+    computerscience_template = """ You are a successful computer scientist.\
 You have a passion for creativity, collaboration,\
 forward-thinking, confidence, strong problem-solving capabilities,\
 understanding of theories and algorithms, and excellent communication \
@@ -175,50 +203,50 @@ time complexity and space complexity.
 Here is a question:
 {input}"""
 
-prompt_infos = [
-    {
-        "name": "physics",
-        "description": "Good for answering questions about physics",
-        "prompt_template": physics_template
-    },
-    {
-        "name": "math",
-        "description": "Good for answering math questions",
-        "prompt_template": math_template
-    },
-    {
-        "name": "History",
-        "description": "Good for answering history questions",
-        "prompt_template": history_template
-    },
-    {
-        "name": "computer science",
-        "description": "Good for answering computer science questions",
-        "prompt_template": computerscience_template
-    }
-]
-
-from langchain.chains.router.llm_router import LLMRouterChain, RouterOutputParser
-
-llm = ChatOpenAI(temperature=0, model="gpt-3.5-turbo-0301")
-
-
-destination_chains = {}
-for p_info in prompt_infos:
-    name = p_info["name"]
-    prompt_template = p_info["prompt_template"]
-    prompt = ChatPromptTemplate.from_template(template=prompt_template)
-    chain = LLMChain(llm=llm, prompt=prompt)
-    destination_chains[name] = chain
-
-destinations = [f"{p['name']}: {p['description']}" for p in prompt_infos]
-destinations_str = "\n".join(destinations)
-
-default_prompt = ChatPromptTemplate.from_template("{input}")
-default_chain = LLMChain(llm=llm, prompt=default_prompt)
-
-
-MULTI_PROMPT_ROUTER_TEMPLATE = """Given a raw text input to a \
+    prompt_infos = [
+        {
+            "name": "physics",
+            "description": "Good for answering questions about physics",
+            "prompt_template": physics_template
+        },
+        {
+            "name": "math",
+            "description": "Good for answering math questions",
+            "prompt_template": math_template
+        },
+        {
+            "name": "History",
+            "description": "Good for answering history questions",
+            "prompt_template": history_template
+        },
+        {
+            "name": "computer science",
+            "description": "Good for answering computer science questions",
+            "prompt_template": computerscience_template
+        }
+    ]
+
+    from langchain.chains.router.llm_router import LLMRouterChain, RouterOutputParser
+
+    llm = shared_chat_model(temperature=0, model="gpt-3.5-turbo-0301")
+
+
+    destination_chains = {}
+    for p_info in prompt_infos:
+        name = p_info["name"]
+        prompt_template = p_info["prompt_template"]
+        prompt = CompiledChatPromptTemplate.from_template(template=prompt_template)
+        chain = LLMChain(llm=llm, prompt=prompt)
+        destination_chains[name] = chain
+
+    destinations = [f"{p['name']}: {p['description']}" for p in prompt_infos]
+    destinations_str = "\n".join(destinations)
+
+    default_prompt = CompiledChatPromptTemplate.from_template("{input}")
+    default_chain = LLMChain(llm=llm, prompt=default_prompt)
+
+
+    MULTI_PROMPT_ROUTER_TEMPLATE = """Given a raw text input to a \
 language model select the model prompt best suited for the input. \
 You will be given the names of the available prompts and a \
 description of what the prompt is best suited for. \
@@ -248,26 +276,87 @@ if you don't think any modifications are needed.
 
 << OUTPUT (remember to include the ```json)>>"""
 
-router_template = MULTI_PROMPT_ROUTER_TEMPLATE.format(
-    destinations=destinations_str
-)
-router_prompt = PromptTemplate(
-    template=router_template,
-    input_variables=["input"],
-    output_parser=RouterOutputParser(),
-)
+    router_template = MULTI_PROMPT_ROUTER_TEMPLATE.format(
+        destinations=destinations_str
+    )
+    router_prompt = PromptTemplate(
+        template=router_template,
+        input_variables=["input"],
+        output_parser=RouterOutputParser(),
+    )
+
+    router_chain = LLMRouterChain.from_llm(llm, router_prompt)
+
+
+    chain = MultiPromptChain(router_chain=router_chain, 
+                             destination_chains=destination_chains, 
+                             default_chain=default_chain, verbose=True
+                            )
+
+    chain.run("What is black body radiation?")
+
+    chain.run("what is 2 + 2")
+
+    chain.run("Why does every cell in our body contain DNA?")
+
+
+    # Embedding Router Chain
+    '''
+    LLMRouterChain spends one LLM call just to pick the destination, before the call that answers.
+    EmbeddingRouterChain embeds the destination descriptions once and picks the closest one to the question.
+    Only when the best match is not clear enough does it ask the LLM router (passed as fallback).
+    '''
+    from .embedding_router import EmbeddingRouterChain
+
+    embedding_router_chain = EmbeddingRouterChain.from_prompt_infos(
+        prompt_infos,
+        shared_embedding_model(),
+        fallback=router_chain,
+        threshold=0.75, # minimum similarity for the best destination
+        margin=0.02, # minimum gap between the best and the second best destination
+    )
+
+    chain = MultiPromptChain(router_chain=embedding_router_chain,
+                             destination_chains=destination_chains,
+                             default_chain=default_chain, verbose=True
+                            )
+
+    chain.run("What is black body radiation?")
+
+    chain.run("what is 2 + 2")
+
+    print(embedding_router_chain.stats()) # {'fast_routes': ..., 'fallback_routes': ..., 'fast_path_rate': ...}
+
+
 
-router_chain = LLMRouterChain.from_llm(llm, router_prompt)
 
+    # Prompt prefixes
+    '''
+    The provider caches the start of the prompts it has seen recently, so what is the same for every call should
+    come first and the variables last. The destination templates and the router template already end with
+    {input}, so the prompts the chains send are already in that order, in a single human message.
+    prefix_report shows how many tokens of each prompt are the same for every input (prefix_tokens)
+    and how many of them the provider can cache (cached_tokens, from 1024 tokens on).
+    '''
+    from .prompt_prefix import prefix_report
 
-chain = MultiPromptChain(router_chain=router_chain, 
-                         destination_chains=destination_chains, 
-                         default_chain=default_chain, verbose=True
-                        )
+    destination_prompts = {name: chain.prompt for name, chain in destination_chains.items()}
+    destination_prompts["router"] = router_prompt
+    print(prefix_report(destination_prompts, llm.get_num_tokens))
+    # {'physics': {'prefix_tokens': ..., 'static_tokens': ..., 'prefix_share': ..., 'cached_tokens': 0}, ...}
 
-chain.run("What is black body radiation?")
 
-chain.run("what is 2 + 2")
+    # Shared models
+    '''
+    Every section asks for its model with shared_chat_model(...): the sections with the same arguments
+    (temperature=0.9 for the sequential chains, temperature=0 for the routers) get the same instance instead
+    of building a new ChatOpenAI each time, and all of them send their requests on the same pooled connections.
+    get_registry().stats() shows the requests of each model and the connections of the pool.
+    '''
+    print(get_registry().stats())
+    # {'models': {'chat openai {"model": "gpt-3.5-turbo-0301", "temperature": 0.9}': {'in_flight': 0, 'requests': ..., 'errors': 0}, ...},
+    #  'pool': {'limiter': {...}, 'sync': {'waiting': 0, 'in_flight': 0, 'connections': ..., 'idle': ..., 'in_use': 0}}}
 
-chain.run("Why does every cell in our body contain DNA?")
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,612 @@
+# Shared OpenAI Client Pool
+'''
+Every script builds its own ChatOpenAI(...) / OpenAIEmbeddings(), each with its own HTTP client
+and no idea of what the others are sending. Under load they all hit the rate limit (HTTP 429)
+together and retry together; the rest of the time part of the quota is left unused.
+
+This module gives all the models one shared HTTP client (one connection pool with keep-alive,
+so connections and TLS handshakes are reused) and one AdaptiveLimiter in front of it:
+- token buckets cap the requests per minute and the tokens per minute sent to the API,
+- the number of requests in flight adapts AIMD-style (like TCP): it grows by about one per round
+  of successful fast requests, and is halved on a 429 or when the latency goes over latency_target,
+  at most once per window (the requests already in flight when it was halved do not halve it again,
+  so a burst of 429s halves it once instead of collapsing it to min_concurrency),
+- a Retry-After header on a 429 pauses every request until that time.
+
+Use chat_model(...), embedding_model(...) and completion_model(...) instead of ChatOpenAI(...),
+OpenAIEmbeddings() and OpenAI(...): they take the same arguments and plug in the shared clients.
+To try it without the API, run fake_openai_server.py and pass base_url="http://127.0.0.1:8010/v1".
+With LLM_BACKEND=fake in the environment they return the local models of fake_backend.py instead.
+
+chat_model(...) still builds a new model object (and parses its configuration) on every call.
+shared_chat_model(...) and shared_embedding_model(...) hand out one instance per set of arguments
+(model, temperature, ...) from a process-wide ModelRegistry, so the sections of a script and the
+requests of a service reuse the same objects. Each shared model counts its own requests (in flight,
+total, errors) on top of the shared connection pool: get_registry().stats() reports them with the
+state of the pool: the requests waiting for the limiter and in flight (counted by the pool itself),
+and the connections open, idle and in use. The shared instances are used from several threads at once:
+do not change their attributes, ask the registry for other arguments instead.
+
+configure(...) replaces the shared pool for the models created afterwards. The old pool is not closed:
+models created before still use it, and its connections go away with the last of them.
+'''
+import asyncio
+import json
+import os
+import threading
+import time
+
+import httpx
+
+DEFAULT_COMPLETION_TOKENS = 256
+
+
+class TokenBucket:
+    """Refills `per_minute` units per minute, holding at most `capacity` (one minute's worth by default)."""
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` units are available (0 if they are now)."""
+        self._refill(now)
+        # A request larger than the bucket only waits for a full bucket.
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self.level -= min(amount, self.capacity)
+
+
+class AdaptiveLimiter:
+    def __init__(self, requests_per_minute=3500, tokens_per_minute=90000, initial_concurrency=4,
+                 min_concurrency=1, max_concurrency=64, latency_target=10.0):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.concurrency = float(initial_concurrency)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.latency_target = latency_target
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.successes = 0
+        self.throttled = 0
+        self.errors = 0
+        self._decreased_at = float("-inf")  # when the concurrency was last halved
+        self._condition = threading.Condition()
+        self._async_waiters = []  # (event loop, future) of the aacquire calls waiting for a release
+
+    def _try_acquire(self, tokens):
+        """Take a slot and the tokens if possible; else return how long to wait."""
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.in_flight >= int(self.concurrency):
+            return None  # wait for a release
+        wait = max(self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+        if wait > 0:
+            return wait
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        self.in_flight += 1
+        return 0.0
+
+    def acquire(self, tokens=1):
+        with self._condition:
+            while True:
+                wait = self._try_acquire(tokens)
+                if wait == 0.0:
+                    return
+                self._condition.wait(timeout=wait)
+
+    async def aacquire(self, tokens=1):
+        # Never block the event loop: wait on a future that release() resolves (from any thread),
+        # with a timeout when the wait is for the token buckets or a Retry-After pause.
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._condition:
+                wait = self._try_acquire(tokens)
+                if wait == 0.0:
+                    return
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            try:
+                await asyncio.wait_for(waiter, timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._condition:
+                    if (loop, waiter) in self._async_waiters:
+                        self._async_waiters.remove((loop, waiter))
+
+    def _decrease(self, started):
+        # Once per window: the requests started before the last decrease saw the old limit.
+        if started >= self._decreased_at:
+            self.concurrency = max(self.min_concurrency, self.concurrency / 2)
+            self._decreased_at = time.monotonic()
+
+    def release(self, status=None, latency=0.0, retry_after=None):
+        started = time.monotonic() - latency
+        with self._condition:
+            self.in_flight -= 1
+            if status == 429:
+                self.throttled += 1
+                self._decrease(started)
+                if retry_after:
+                    self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+            elif status is None or status >= 500:
+                self.errors += 1
+            elif latency > self.latency_target:
+                self.successes += 1
+                self._decrease(started)
+            else:
+                self.successes += 1
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+            self._condition.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, waiter in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, waiter)
+            except RuntimeError:  # the loop was closed
+                pass
+
+    def stats(self):
+        with self._condition:
+            return {
+                "concurrency_limit": int(self.concurrency),
+                "in_flight": self.in_flight,
+                "successes": self.successes,
+                "throttled": self.throttled,
+                "errors": self.errors,
+            }
+
+
+def _wake(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+def estimate_tokens(request):
+    """Rough token count of an OpenAI request (4 characters per token), without a tokenizer."""
+    try:
+        body = json.loads(request.content or b"{}")
+    except ValueError:
+        return 1
+    characters = 0
+    for message in body.get("messages", []):
+        content = message.get("content") or ""
+        characters += len(content) if isinstance(content, str) else len(json.dumps(content))
+    inputs = body.get("input", [])
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    for item in inputs:
+        # Embedding inputs may already be token ids.
+        characters += len(item) if isinstance(item, str) else 4 * len(item)
+    completion = body.get("max_tokens") or (DEFAULT_COMPLETION_TOKENS if "messages" in body else 0)
+    return max(1, characters // 4 + completion)
+
+
+def _retry_after(response):
+    value = response.headers.get("retry-after")
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+class PendingRequests:
+    """Requests of one transport waiting for the limiter, and sent but not answered yet."""
+
+    def __init__(self):
+        self.waiting = 0
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def add(self, waiting=0, in_flight=0):
+        with self._lock:
+            self.waiting += waiting
+            self.in_flight += in_flight
+
+    def stats(self):
+        with self._lock:
+            return {"waiting": self.waiting, "in_flight": self.in_flight}
+
+
+class LimitedTransport(httpx.BaseTransport):
+    def __init__(self, limiter, transport):
+        self.limiter = limiter
+        self.transport = transport
+        self.pending = PendingRequests()
+
+    def handle_request(self, request):
+        self.pending.add(waiting=1)
+        try:
+            self.limiter.acquire(estimate_tokens(request))
+        finally:
+            self.pending.add(waiting=-1)
+        self.pending.add(in_flight=1)
+        started = time.monotonic()
+        try:
+            response = self.transport.handle_request(request)
+        except BaseException:
+            self.limiter.release()
+            raise
+        finally:
+            self.pending.add(in_flight=-1)
+        self.limiter.release(response.status_code, time.monotonic() - started, _retry_after(response))
+        return response
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncLimitedTransport(httpx.AsyncBaseTransport):
+    def __init__(self, limiter, transport):
+        self.limiter = limiter
+        self.transport = transport
+        self.pending = PendingRequests()
+
+    async def handle_async_request(self, request):
+        self.pending.add(waiting=1)
+        try:
+            await self.limiter.aacquire(estimate_tokens(request))
+        finally:
+            self.pending.add(waiting=-1)
+        self.pending.add(in_flight=1)
+        started = time.monotonic()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except BaseException:
+            self.limiter.release()
+            raise
+        finally:
+            self.pending.add(in_flight=-1)
+        self.limiter.release(response.status_code, time.monotonic() - started, _retry_after(response))
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class RequestCounter:
+    """Requests of one model: in flight, finished, and failed (error or HTTP status >= 400)."""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def finish(self, failed=False):
+        with self._lock:
+            self.in_flight -= 1
+            self.requests += 1
+            self.errors += failed
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": self.in_flight, "requests": self.requests, "errors": self.errors}
+
+
+class CountingTransport(httpx.BaseTransport):
+    """Counts the requests of one model, sent on the shared transport."""
+
+    def __init__(self, counter, transport):
+        self.counter = counter
+        self.transport = transport
+
+    def handle_request(self, request):
+        self.counter.start()
+        try:
+            response = self.transport.handle_request(request)
+        except BaseException:
+            self.counter.finish(failed=True)
+            raise
+        self.counter.finish(response.status_code >= 400)
+        return response
+
+    def close(self):
+        pass  # the shared transport belongs to the ClientPool
+
+
+class AsyncCountingTransport(httpx.AsyncBaseTransport):
+    def __init__(self, counter, transport):
+        self.counter = counter
+        self.transport = transport
+
+    async def handle_async_request(self, request):
+        self.counter.start()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except BaseException:
+            self.counter.finish(failed=True)
+            raise
+        self.counter.finish(response.status_code >= 400)
+        return response
+
+    async def aclose(self):
+        pass
+
+
+def _connection_stats(transport):
+    """Requests waiting and in flight on `transport` (a LimitedTransport), and the connections behind it."""
+    stats = transport.pending.stats()
+    pool = getattr(transport.transport, "_pool", None)  # the httpcore pool of httpx.HTTPTransport
+    connections = getattr(pool, "connections", None)
+    if connections is not None:
+        idle = sum(1 for c in connections if c.is_idle())
+        closed = sum(1 for c in connections if c.is_closed())
+        stats.update(connections=len(connections), idle=idle, in_use=len(connections) - idle - closed)
+    return stats
+
+
+class ClientPool:
+    """One limiter and one pair of pooled sync/async httpx clients, shared by every model."""
+
+    def __init__(self, limiter=None, max_connections=100, max_keepalive_connections=20,
+                 keepalive_expiry=30.0, timeout=60.0):
+        self.limiter = limiter or AdaptiveLimiter()
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = timeout
+        self._http_client = None
+        self._http_async_client = None
+        self._transport = None
+        self._async_transport = None
+        self._lock = threading.Lock()
+
+    @property
+    def transport(self):
+        """The shared LimitedTransport: the limiter in front of the pooled connections."""
+        with self._lock:
+            if self._transport is None:
+                self._transport = LimitedTransport(self.limiter, httpx.HTTPTransport(limits=self.limits))
+            return self._transport
+
+    @property
+    def async_transport(self):
+        with self._lock:
+            if self._async_transport is None:
+                self._async_transport = AsyncLimitedTransport(
+                    self.limiter, httpx.AsyncHTTPTransport(limits=self.limits)
+                )
+            return self._async_transport
+
+    @property
+    def http_client(self):
+        transport = self.transport
+        with self._lock:
+            if self._http_client is None:
+                self._http_client = httpx.Client(transport=transport, timeout=self.timeout)
+            return self._http_client
+
+    @property
+    def http_async_client(self):
+        transport = self.async_transport
+        with self._lock:
+            if self._http_async_client is None:
+                self._http_async_client = httpx.AsyncClient(transport=transport, timeout=self.timeout)
+            return self._http_async_client
+
+    def model_clients(self, counter):
+        """A sync and an async client counting the requests of one model in `counter`, on the shared connections."""
+        return (
+            httpx.Client(transport=CountingTransport(counter, self.transport), timeout=self.timeout),
+            httpx.AsyncClient(transport=AsyncCountingTransport(counter, self.async_transport), timeout=self.timeout),
+        )
+
+    def stats(self):
+        """The limiter, and the requests and connections of the sync and async clients created so far."""
+        with self._lock:
+            transports = {"sync": self._transport, "async": self._async_transport}
+        stats = {"limiter": self.limiter.stats()}
+        for name, transport in transports.items():
+            if transport is not None:
+                stats[name] = _connection_stats(transport)
+        return stats
+
+    def close(self):
+        """Close the shared clients: only when no model created on this pool is used any more."""
+        with self._lock:
+            sync_client = self._http_client or self._transport
+            async_client = self._http_async_client or self._async_transport
+            self._http_client = self._transport = None
+            self._http_async_client = self._async_transport = None
+        if sync_client is not None:
+            sync_client.close()
+        if async_client is not None:
+            _close_async(async_client)
+
+
+def _close_async(client):
+    """Close an httpx.AsyncClient (or async transport) from sync code, inside or outside a running event loop."""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        try:
+            asyncio.run(client.aclose())
+        except RuntimeError:
+            pass  # its connections belong to an event loop that is already closed
+    else:
+        loop.create_task(client.aclose())
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def configure(**kwargs):
+    """Replace the shared pool, e.g. configure(limiter=AdaptiveLimiter(requests_per_minute=500)).
+
+    The old pool stays open: the models created on it keep working until they are dropped.
+    """
+    global _pool
+    with _pool_lock:
+        _pool = ClientPool(**kwargs)
+    _registry.clear()  # the next shared models are built on the new pool
+    return _pool
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ClientPool()
+        return _pool
+
+
+def chat_model(**kwargs):
+    """ChatOpenAI(**kwargs) using the shared clients."""
+    return _chat_model(kwargs)
+
+
+def embedding_model(**kwargs):
+    """OpenAIEmbeddings(**kwargs) using the shared clients."""
+    return _embedding_model(kwargs)
+
+
+def completion_model(**kwargs):
+    """OpenAI(**kwargs) (the completions API, e.g. gpt-3.5-turbo-instruct) using the shared clients."""
+    if os.environ.get("LLM_BACKEND") == "fake":
+        from .fake_backend import fake_chat_model
+
+        return fake_chat_model(**kwargs)
+    from langchain_openai import OpenAI
+
+    pool = get_pool()
+    return OpenAI(http_client=pool.http_client, http_async_client=pool.http_async_client, **kwargs)
+
+
+def _clients(counter, pool=None):
+    pool = pool or get_pool()
+    if counter is None:
+        return pool.http_client, pool.http_async_client
+    return pool.model_clients(counter)
+
+
+def _chat_model(kwargs, counter=None, pool=None):
+    if os.environ.get("LLM_BACKEND") == "fake":
+        from .fake_backend import fake_chat_model
+
+        return fake_chat_model(counter=counter, **kwargs)
+    from langchain_openai import ChatOpenAI
+
+    http_client, http_async_client = _clients(counter, pool)
+    return ChatOpenAI(http_client=http_client, http_async_client=http_async_client, **kwargs)
+
+
+def _embedding_model(kwargs, counter=None, pool=None):
+    if os.environ.get("LLM_BACKEND") == "fake":
+        from .fake_backend import fake_embeddings
+
+        return fake_embeddings(counter=counter, **kwargs)
+    from langchain_openai import OpenAIEmbeddings
+
+    http_client, http_async_client = _clients(counter, pool)
+    return OpenAIEmbeddings(http_client=http_client, http_async_client=http_async_client, **kwargs)
+
+
+class ModelRegistry:
+    """One shared model per kind and arguments, each counting its requests on the shared pool."""
+
+    def __init__(self):
+        self._models = {}  # (kind, backend, arguments) -> (model, RequestCounter, label, ClientPool)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(kind, kwargs):
+        """The same key for the same model: temperature=0 and 0.0, model= and model_name= are alike."""
+        normalized = {}
+        for name, value in kwargs.items():
+            if isinstance(value, int) and not isinstance(value, bool):
+                value = float(value)
+            normalized["model" if name == "model_name" else name] = value
+        arguments = json.dumps(normalized, sort_keys=True, default=repr)
+        return kind, os.environ.get("LLM_BACKEND", "openai"), arguments
+
+    @staticmethod
+    def label(kind, kwargs):
+        """The key as shown in stats(), without the API keys."""
+        shown = {k: "***" if "key" in k or "secret" in k else v for k, v in kwargs.items()}
+        return f"{kind} {os.environ.get('LLM_BACKEND', 'openai')} {json.dumps(shown, sort_keys=True, default=repr)}"
+
+    def _get(self, kind, factory, kwargs):
+        key = self.key(kind, kwargs)
+        pool = get_pool()
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is None or entry[3] is not pool:  # none yet, or built on a pool replaced by configure()
+                counter = RequestCounter()
+                model = factory(kwargs, counter, pool)
+                entry = self._models[key] = (model, counter, self.label(kind, kwargs), pool)
+            return entry[0]
+
+    def chat_model(self, **kwargs):
+        return self._get("chat", _chat_model, kwargs)
+
+    def embedding_model(self, **kwargs):
+        return self._get("embedding", _embedding_model, kwargs)
+
+    def model_stats(self, model):
+        """Requests of the shared `model`, and the connections of the pool it was built on."""
+        with self._lock:
+            entries = [(counter, pool) for instance, counter, _, pool in self._models.values() if instance is model]
+        if not entries:
+            raise KeyError("model not created by this registry (or created before the last configure())")
+        counter, pool = entries[0]
+        return dict(counter.stats(), pool=pool.stats())
+
+    def stats(self):
+        """{"models": {label: requests of the model}, "pool": connections of the pool of the models}.
+
+        configure() empties the registry, so its models share the current pool (the pools
+        of models built before configure() are in their model_stats()).
+        """
+        with self._lock:
+            entries = list(self._models.values())
+        pools = {id(pool): pool for _, _, _, pool in entries}
+        pool = next(iter(pools.values())) if len(pools) == 1 else get_pool()
+        return {
+            "models": {label: counter.stats() for _, counter, label, _ in entries},
+            "pool": pool.stats(),
+        }
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+
+    def __len__(self):
+        return len(self._models)
+
+
+_registry = ModelRegistry()
+
+
+def get_registry():
+    return _registry
+
+
+def shared_chat_model(**kwargs):
+    """The process-wide ChatOpenAI(**kwargs), created on first use (see ModelRegistry)."""
+    return _registry.chat_model(**kwargs)
+
+
+def shared_embedding_model(**kwargs):
+    """The process-wide OpenAIEmbeddings(**kwargs), created on first use (see ModelRegistry)."""
+    return _registry.embedding_model(**kwargs)
@@ -0,0 +1,93 @@
+# DAG Sequential Chain
+'''
+SequentialChain runs its chains one after the other, even when a chain does not need
+the output of the previous one. In the review example of chains.py:
+
+    Review ─> chain_one (English_Review) ─> chain_two (summary) ─┐
+    Review ─> chain_three (language) ────────────────────────────┴─> chain_four (followup_message)
+
+chain_three only needs the Review, so it can run while chain_one and chain_two are running.
+
+DAGSequentialChain takes the same arguments as SequentialChain. It reads each chain's
+input keys and output keys to find which chain depends on which, and starts every chain
+as soon as the chains it depends on are finished.
+
+To process many reviews, use .batch() / .abatch() with a "max_concurrency" limit:
+    overall_chain.batch([{"Review": r} for r in df.Review], config={"max_concurrency": 8})
+'''
+import asyncio
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextvars import copy_context
+
+from langchain.callbacks.manager import (
+    AsyncCallbackManagerForChainRun,
+    CallbackManagerForChainRun,
+)
+from langchain.chains import SequentialChain
+
+
+class DAGSequentialChain(SequentialChain):
+    """SequentialChain that runs independent chains concurrently."""
+
+    max_workers: int = 4
+    """Maximum number of chains running at the same time for one input (sync calls only)."""
+
+    def dependencies(self):
+        """For each chain (by position), the positions of the chains producing its inputs."""
+        producer = {}
+        for i, chain in enumerate(self.chains):
+            for key in chain.output_keys:
+                producer[key] = i
+        return [
+            sorted({producer[key] for key in chain.input_keys if key in producer})
+            for chain in self.chains
+        ]
+
+    def _call(self, inputs, run_manager=None):
+        known_values = inputs.copy()
+        _run_manager = run_manager or CallbackManagerForChainRun.get_noop_manager()
+        dependencies = self.dependencies()
+
+        def run(chain, chain_inputs):
+            return chain(chain_inputs, return_only_outputs=True, callbacks=_run_manager.get_child())
+
+        # Start every chain whose inputs are known, then wait for any running chain to finish
+        # and start the chains it unblocked.
+        pending = list(range(len(self.chains)))
+        running = {}
+        finished = set()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                for i in [i for i in pending if finished.issuperset(dependencies[i])]:
+                    chain = self.chains[i]
+                    chain_inputs = {k: known_values[k] for k in chain.input_keys}
+                    running[pool.submit(copy_context().run, run, chain, chain_inputs)] = i
+                    pending.remove(i)
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    known_values.update(future.result())
+                    finished.add(running.pop(future))
+        return {k: known_values[k] for k in self.output_variables}
+
+    async def _acall(self, inputs, run_manager=None):
+        known_values = inputs.copy()
+        _run_manager = run_manager or AsyncCallbackManagerForChainRun.get_noop_manager()
+        callbacks = _run_manager.get_child()
+        dependencies = self.dependencies()
+        tasks = {}
+
+        async def run(i):
+            await asyncio.gather(*(tasks[j] for j in dependencies[i]))
+            chain = self.chains[i]
+            chain_inputs = {k: known_values[k] for k in chain.input_keys}
+            outputs = await chain.acall(chain_inputs, return_only_outputs=True, callbacks=callbacks)
+            known_values.update(outputs)
+
+        for i in range(len(self.chains)):
+            tasks[i] = asyncio.ensure_future(run(i))
+        try:
+            await asyncio.gather(*tasks.values())
+        finally:
+            for task in tasks.values():
+                task.cancel()
+        return {k: known_values[k] for k in self.output_variables}
@@ -0,0 +1,137 @@
+# Embedding Cache
+'''
+OpenAIEmbeddings() has no memory: the same product rows and the same evaluation questions
+are sent to the API again on every run.
+
+CachedEmbeddings wraps any embeddings object (OpenAIEmbeddings or other) and keys every
+vector on (model name, sha256 of the text):
+- a small in-process LRU dictionary answers the most recent texts without touching disk,
+- a local SQLite file keeps every vector ever computed across runs,
+- whatever is still missing is sent to the wrapped model in batches, so only unseen texts
+  reach the provider.
+
+Queries go to the wrapped embed_query and are cached under their own keys: some models embed a
+query differently from a document. Every vector is returned as stored, with float32 precision,
+whether it comes from the cache or from the model.
+
+The hits/misses counters show how many calls were saved.
+'''
+import hashlib
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+
+from langchain.embeddings.base import Embeddings
+
+# SQLite limits the number of "?" placeholders in one statement.
+SQLITE_BATCH = 500
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper with an LRU memory tier and a SQLite disk tier."""
+
+    def __init__(self, embeddings, path="embedding_cache.sqlite", max_memory_items=10000,
+                 batch_size=500, model_name=None):
+        self.embeddings = embeddings
+        self.model_name = model_name or getattr(embeddings, "model", None) or type(embeddings).__name__
+        self.max_memory_items = max_memory_items
+        self.batch_size = batch_size
+        self.memory = OrderedDict()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)"
+        )
+        self._db.commit()
+
+    def key(self, text, query=False):
+        prefix = f"{self.model_name}\0query" if query else self.model_name
+        return hashlib.sha256(f"{prefix}\0{text}".encode("utf-8")).hexdigest()
+
+    @property
+    def hits(self):
+        return self.memory_hits + self.disk_hits
+
+    def stats(self):
+        with self._lock:
+            memory_hits, disk_hits, misses = self.memory_hits, self.disk_hits, self.misses
+        total = memory_hits + disk_hits + misses
+        return {
+            "memory_hits": memory_hits,
+            "disk_hits": disk_hits,
+            "misses": misses,
+            "hit_rate": (memory_hits + disk_hits) / total if total else 0.0,
+        }
+
+    def _remember(self, key, vector):
+        self.memory[key] = vector
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.max_memory_items:
+            self.memory.popitem(last=False)
+
+    def _from_disk(self, keys):
+        found = {}
+        for start in range(0, len(keys), SQLITE_BATCH):
+            chunk = keys[start:start + SQLITE_BATCH]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self._db.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+            )
+            for key, blob in rows:
+                found[key] = array("f", blob).tolist()
+        return found
+
+    def embed_documents(self, texts):
+        return self._embed(texts, self.embeddings.embed_documents, query=False)
+
+    def embed_query(self, text):
+        return self._embed([text], lambda batch: [self.embeddings.embed_query(t) for t in batch], query=True)[0]
+
+    def _embed(self, texts, compute, query):
+        keys = [self.key(t, query) for t in texts]
+        vectors = {}
+
+        with self._lock:
+            for key in keys:
+                if key in self.memory:
+                    vectors[key] = self.memory[key]
+                    self.memory.move_to_end(key)
+            self.memory_hits += sum(1 for key in keys if key in vectors)
+
+            # The same text may appear twice in one call; look it up (and embed it) once.
+            wanted = list(dict.fromkeys(k for k in keys if k not in vectors))
+            on_disk = self._from_disk(wanted)
+            for key, vector in on_disk.items():
+                vectors[key] = vector
+                self._remember(key, vector)
+            self.disk_hits += sum(1 for key in keys if key in on_disk)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+        missing_keys = list(missing)
+        for start in range(0, len(missing_keys), self.batch_size):
+            batch = missing_keys[start:start + self.batch_size]
+            # Stored as float32: return the stored values, so a miss and a later hit give the same vector.
+            embedded = [array("f", v) for v in compute([missing[k] for k in batch])]
+            with self._lock:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(k, v.tobytes()) for k, v in zip(batch, embedded)],
+                )
+                self._db.commit()
+                for k, v in zip(batch, embedded):
+                    vectors[k] = v.tolist()
+                    self._remember(k, vectors[k])
+        with self._lock:
+            self.misses += sum(1 for key in keys if key in missing)
+
+        return [vectors[key] for key in keys]
+
+    def close(self):
+        self._db.close()
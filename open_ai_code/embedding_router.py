@@ -0,0 +1,77 @@
+# Embedding Router Chain
+'''
+LLMRouterChain asks the LLM which destination to use, so every question costs two LLM calls:
+one to pick physics/math/History/computer science, then the real answer.
+
+EmbeddingRouterChain embeds each destination description once. For a new question it embeds
+the question and picks the destination with the highest cosine similarity, without any LLM call.
+
+When the choice is not clear (best similarity under `threshold`, or the two best destinations
+closer than `margin`), it falls back to the LLM router if one is given, else to the default chain.
+stats() tells how often the fast path was used.
+
+It is a RouterChain, so it plugs into MultiPromptChain(router_chain=...) like LLMRouterChain.
+'''
+from typing import Any, List, Optional
+
+import numpy as np
+from langchain.callbacks.manager import CallbackManagerForChainRun
+from langchain.chains.router.base import RouterChain
+from langchain.embeddings.base import Embeddings
+
+from .numpy_vectorstore import normalize
+
+
+class EmbeddingRouterChain(RouterChain):
+    """Route by cosine similarity between the input and the destination descriptions."""
+
+    embeddings: Embeddings
+    names: List[str]
+    vectors: Any
+    fallback: Optional[RouterChain] = None
+    threshold: float = 0.75
+    margin: float = 0.02
+    input_key: str = "input"
+    fast_routes: int = 0
+    fallback_routes: int = 0
+
+    @classmethod
+    def from_prompt_infos(cls, prompt_infos, embeddings, fallback=None, **kwargs):
+        """Build the router from the prompt_infos list used for the destination chains."""
+        names = [p["name"] for p in prompt_infos]
+        descriptions = [f"{p['name']}: {p['description']}" for p in prompt_infos]
+        vectors = normalize(embeddings.embed_documents(descriptions))
+        return cls(embeddings=embeddings, names=names, vectors=vectors, fallback=fallback, **kwargs)
+
+    @property
+    def input_keys(self):
+        return [self.input_key]
+
+    def scores(self, text):
+        query = normalize(self.embeddings.embed_query(text))
+        return self.vectors @ query
+
+    def _call(self, inputs, run_manager=None):
+        _run_manager = run_manager or CallbackManagerForChainRun.get_noop_manager()
+        scores = self.scores(inputs[self.input_key])
+        order = np.argsort(-scores)
+        best = float(scores[order[0]])
+        second = float(scores[order[1]]) if len(order) > 1 else -1.0
+
+        if best >= self.threshold and best - second >= self.margin:
+            self.fast_routes += 1
+            return {"destination": self.names[order[0]], "next_inputs": inputs}
+
+        self.fallback_routes += 1
+        if self.fallback is None:
+            return {"destination": None, "next_inputs": inputs}
+        result = self.fallback(inputs, callbacks=_run_manager.get_child())
+        return {"destination": result["destination"], "next_inputs": result["next_inputs"]}
+
+    def stats(self):
+        total = self.fast_routes + self.fallback_routes
+        return {
+            "fast_routes": self.fast_routes,
+            "fallback_routes": self.fallback_routes,
+            "fast_path_rate": self.fast_routes / total if total else 0.0,
+        }
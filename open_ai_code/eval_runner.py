@@ -0,0 +1,144 @@
+# Parallel Evaluation Runner
+'''
+Evaluation.py predicts every example with qa.apply(examples), then grades them all with
+eval_chain.evaluate(examples, predictions): one LLM call after the other, and if one call fails
+near the end, every prediction and grade of the run is lost.
+
+EvaluationRunner predicts and grades each example on a pool of threads (max_workers calls in flight).
+Each graded example is appended to a JSONL checkpoint file as soon as it is done. Running again
+with the same checkpoint skips the examples already in it, so a crashed run resumes where it stopped.
+A failed call is retried a few times; an example that keeps failing is reported but not written,
+so the next run tries it again.
+
+report() gives the throughput and the latency percentiles of the prediction and grading stages.
+'''
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextvars import copy_context
+
+from .latency import latency_summary
+
+
+def example_id(example, question_key="query", answer_key="answer"):
+    """Stable id of an example, so it is recognized in the checkpoint of an earlier run."""
+    text = json.dumps([example[question_key], example[answer_key]])
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def call_with_retries(fn, retries, backoff):
+    for attempt in range(retries + 1):
+        try:
+            return fn()
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2 ** attempt)
+
+
+class EvaluationRunner:
+    def __init__(self, qa_chain, eval_chain, checkpoint_path="eval_checkpoint.jsonl",
+                 max_workers=8, retries=2, backoff=1.0,
+                 question_key="query", answer_key="answer", prediction_key="result"):
+        self.qa_chain = qa_chain
+        self.eval_chain = eval_chain
+        self.checkpoint_path = checkpoint_path
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.question_key = question_key
+        self.answer_key = answer_key
+        self.prediction_key = prediction_key
+        self.records = []
+        self.failures = []
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def load_checkpoint(self):
+        done = {}
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # last line cut short by a crash
+                    done[record["id"]] = record
+        return done
+
+    def _evaluate_one(self, example):
+        question = example[self.question_key]
+        started = time.perf_counter()
+        prediction = call_with_retries(
+            lambda: self.qa_chain({self.question_key: question}), self.retries, self.backoff
+        )
+        predict_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        graded = call_with_retries(
+            lambda: self.eval_chain.evaluate(
+                [example], [prediction],
+                question_key=self.question_key,
+                answer_key=self.answer_key,
+                prediction_key=self.prediction_key,
+            )[0],
+            self.retries, self.backoff,
+        )
+        grade_ms = (time.perf_counter() - started) * 1000
+
+        return {
+            "id": example_id(example, self.question_key, self.answer_key),
+            "query": question,
+            "answer": example[self.answer_key],
+            "result": prediction[self.prediction_key],
+            "grade": graded[self.eval_chain.output_key],
+            "predict_ms": predict_ms,
+            "grade_ms": grade_ms,
+        }
+
+    def run(self, examples):
+        """Predict and grade `examples`, returning one record per example (in input order)."""
+        done = self.load_checkpoint()
+        todo = [
+            e for e in examples
+            if example_id(e, self.question_key, self.answer_key) not in done
+        ]
+        started = time.perf_counter()
+        new_records = []
+        self.failures = []
+        with open(self.checkpoint_path, "a", encoding="utf-8") as checkpoint:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                futures = {pool.submit(copy_context().run, self._evaluate_one, e): e for e in todo}
+                for future in as_completed(futures):
+                    try:
+                        record = future.result()
+                    except Exception as e:
+                        self.failures.append({"example": futures[future], "error": repr(e)})
+                        continue
+                    with self._lock:
+                        checkpoint.write(json.dumps(record) + "\n")
+                        checkpoint.flush()
+                    new_records.append(record)
+        self.seconds = time.perf_counter() - started
+
+        done.update((r["id"], r) for r in new_records)
+        self.records = new_records
+        ids = [example_id(e, self.question_key, self.answer_key) for e in examples]
+        return [done[i] for i in ids if i in done]
+
+    def report(self):
+        """Throughput and latency percentiles (ms) of the examples evaluated by the last run()."""
+        return {
+            "evaluated": len(self.records),
+            "failed": len(self.failures),
+            "seconds": self.seconds,
+            "examples_per_second": len(self.records) / self.seconds if self.seconds else 0.0,
+            "predict_ms": latency_summary([r["predict_ms"] for r in self.records]),
+            "grade_ms": latency_summary([r["grade_ms"] for r in self.records]),
+        }
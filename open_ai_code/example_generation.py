@@ -0,0 +1,192 @@
+# Batched Example Generation
+'''
+QAGenerateChain writes one question/answer pair per LLM call, one call after the other,
+which is why Evaluation.py only generates examples for data[:5].
+
+generate_dataset() builds a whole evaluation set from the catalog:
+- several documents are packed in each prompt (docs_per_prompt), with one question/answer
+  pair asked for each of them, so the quiz instructions are sent once per batch of documents;
+- the prompts run on a pool of threads (max_workers), under a requests-per-minute limit; a failed
+  batch is retried (max_retries) without stopping the others;
+- each batch is appended to <path>.partial as soon as it is done: if the run stops (or a batch still
+  fails after its retries), the next run only generates the batches that are missing;
+- questions that repeat an earlier one (same text up to case and spaces, then cosine similarity
+  of their embeddings above dedupe_threshold) are dropped;
+- the examples are written to a JSONL dataset file with the row they came from. Next time the
+  file is loaded instead of generating again.
+'''
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextvars import copy_context
+
+import numpy as np
+from langchain.chains import LLMChain
+from langchain.prompts import ChatPromptTemplate
+
+from .numpy_vectorstore import normalize
+
+batch_template = """You are a teacher coming up with questions to ask on a quiz. \
+For each of the numbered documents below, please generate one question and answer \
+based on that document.
+
+Example Format:
+DOCUMENT 1
+QUESTION: question here
+ANSWER: answer here
+
+DOCUMENT 2
+QUESTION: question here
+ANSWER: answer here
+
+These questions should be detailed and be based explicitly on information in the document. \
+Answer for every document, in the same order. Begin!
+
+{docs}"""
+
+BATCH_PROMPT = ChatPromptTemplate.from_template(batch_template)
+
+PAIR = re.compile(
+    r"DOCUMENT\s+(\d+)\s*\n+QUESTION:\s*(.*?)\s*\n+ANSWER:\s*(.*?)\s*(?=\n+DOCUMENT\s+\d+|\Z)",
+    re.DOTALL,
+)
+
+
+def format_docs(docs):
+    return "\n\n".join(
+        f"DOCUMENT {i}\n<Begin Document>\n{doc.page_content}\n<End Document>"
+        for i, doc in enumerate(docs, start=1)
+    )
+
+
+def parse_pairs(text, docs):
+    """Question/answer pairs of a batch answer, with the metadata of the document each one is about."""
+    examples = []
+    for match in PAIR.finditer(text):
+        number = int(match.group(1))
+        if 1 <= number <= len(docs):
+            examples.append({
+                "query": match.group(2),
+                "answer": match.group(3),
+                "source": docs[number - 1].metadata,
+            })
+    return examples
+
+
+class RateLimiter:
+    """Lets at most `requests_per_minute` calls start per minute, evenly spaced."""
+
+    def __init__(self, requests_per_minute):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def dedupe(examples, embeddings, threshold=0.92):
+    """Drop the examples whose question is too similar to the question of an earlier example."""
+    # Exact repeats first, with a set: only the distinct questions are embedded and compared.
+    seen = set()
+    unique = []
+    for example in examples:
+        text = " ".join(example["query"].lower().split())
+        if text not in seen:
+            seen.add(text)
+            unique.append(example)
+    examples = unique
+    if not examples:
+        return []
+    vectors = normalize(embeddings.embed_documents([e["query"] for e in examples]))
+    kept = []
+    for i in range(len(vectors)):
+        if kept and float(np.max(vectors[kept] @ vectors[i])) >= threshold:
+            continue
+        kept.append(i)
+    return [examples[i] for i in kept]
+
+
+def load_dataset(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_dataset(examples, path):
+    with open(path, "w", encoding="utf-8") as f:
+        for example in examples:
+            f.write(json.dumps(example) + "\n")
+
+
+def load_partial(path):
+    """{batch number: examples} of the batches already generated by an interrupted run."""
+    done = {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # last line cut by a crash
+                done[record["batch"]] = record["examples"]
+    return done
+
+
+def generate_dataset(docs, llm, path="eval_dataset.jsonl", embeddings=None, docs_per_prompt=5,
+                     max_workers=4, requests_per_minute=60, dedupe_threshold=0.92, overwrite=False,
+                     max_retries=3, retry_delay=2.0):
+    """Generate question/answer examples for `docs`, or load them from `path` if it exists."""
+    partial_path = path + ".partial"
+    if overwrite and os.path.exists(partial_path):
+        os.remove(partial_path)
+    if os.path.exists(path) and not overwrite:
+        return load_dataset(path)
+
+    chain = LLMChain(llm=llm, prompt=BATCH_PROMPT)
+    limiter = RateLimiter(requests_per_minute)
+    batches = [docs[i:i + docs_per_prompt] for i in range(0, len(docs), docs_per_prompt)]
+    done = load_partial(partial_path)
+
+    def generate(batch):
+        for attempt in range(max_retries + 1):
+            limiter.wait()
+            try:
+                return parse_pairs(chain.run(docs=format_docs(batch)), batch)
+            except Exception:
+                if attempt == max_retries:
+                    raise
+                time.sleep(retry_delay * 2 ** attempt)
+
+    errors = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool, open(partial_path, "a", encoding="utf-8") as partial:
+        futures = {
+            pool.submit(copy_context().run, generate, batch): number
+            for number, batch in enumerate(batches) if number not in done
+        }
+        for future in as_completed(futures):
+            number = futures[future]
+            try:
+                done[number] = future.result()
+            except Exception as e:
+                errors.append(e)
+                continue
+            partial.write(json.dumps({"batch": number, "examples": done[number]}) + "\n")
+            partial.flush()
+    if errors:
+        # The other batches are saved in the .partial file: the next call only retries these.
+        raise errors[0]
+    examples = [e for number in sorted(done) for e in done[number]]
+
+    if embeddings is not None:
+        examples = dedupe(examples, embeddings, dedupe_threshold)
+    save_dataset(examples, path)
+    os.remove(partial_path)
+    return examples
@@ -0,0 +1,225 @@
+# Offline Fake Backend
+'''
+Every script calls the OpenAI API, so nothing runs without network and an API key, and the time
+spent in LangChain itself cannot be told apart from the time spent waiting for the provider.
+
+FakeChatModel is a chat model that answers locally:
+- with `responses`, it gives them in turn (scripted answers),
+- otherwise default_response() answers in the format each course prompt expects (the router JSON,
+  the ```json of the output parsers, "Final Answer:" for the agents, CORRECT for the grader, ...)
+  and echoes the end of the prompt for everything else,
+- latency is the time before the first token and tokens_per_second the speed of the generation
+  (0 = instant), with streaming support, so providers of different speeds can be simulated.
+FakeEmbeddings embeds each text by hashing its words into `size` dimensions: deterministic, no network,
+and texts sharing words get similar vectors, so retrieval still finds something sensible.
+
+With LLM_BACKEND=fake in the environment, chat_model() and embedding_model() (client_pool.py) return
+these instead of the OpenAI models, and the scripts run offline (the shared models of the ModelRegistry
+count their calls as requests, like the HTTP clients of the real ones):
+
+    LLM_BACKEND=fake python -m open_ai_code.chains
+
+benchmarks.py uses them to measure the overhead of each course flow.
+'''
+import asyncio
+import hashlib
+import json
+import re
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, List, Optional
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+_WORD = re.compile(r"\w+")
+_TOKEN = re.compile(r"\S+\s*|\s+")
+_JSON_KEY = re.compile(r'"(\w+)":\s*(\w+)')
+
+
+@contextmanager
+def counted(counter):
+    """Count one call in `counter` (a client_pool.RequestCounter, or None for no counting)."""
+    if counter is None:
+        yield
+        return
+    counter.start()
+    try:
+        yield
+    except BaseException:
+        counter.finish(failed=True)
+        raise
+    counter.finish()
+
+
+def count_tokens(text):
+    """Rough token count: words and punctuation marks."""
+    return len(re.findall(r"\w+|[^\w\s]", text))
+
+
+def default_response(prompt):
+    """An answer in the format the course prompt in `prompt` asks for."""
+    if "<< CANDIDATE PROMPTS >>" in prompt:
+        candidates = prompt.split("<< CANDIDATE PROMPTS >>")[1].split("<<")[0].strip().splitlines()
+        question = prompt.split("<< INPUT >>")[1].split("<<")[0].strip() if "<< INPUT >>" in prompt else ""
+        destination = candidates[0].split(":")[0] if candidates else "DEFAULT"
+        return "```json\n" + json.dumps({"destination": destination, "next_inputs": question}) + "\n```"
+    if "Final Answer" in prompt and "Action" in prompt:
+        return "Final Answer: " + " ".join(prompt.split()[-12:])
+    if "GRADE:" in prompt:
+        return "CORRECT"
+    if "QUESTION: question here" in prompt:
+        documents = re.findall(r"DOCUMENT (\d+)", prompt.split("Begin!")[-1])
+        return "\n\n".join(
+            f"DOCUMENT {n}\nQUESTION: What is in document {n}?\nANSWER: Document {n}." for n in documents
+        ) or "QUESTION: What is in the document?\nANSWER: The document."
+    if "```json" in prompt:
+        fields = {}
+        for key, kind in _JSON_KEY.findall(prompt.split("```json")[-1]):
+            fields[key] = 1 if kind in ("int", "integer", "number") else "unknown"
+        if "REVIEW " in prompt:  # review_extraction.py: one object per review
+            ids = re.findall(r"REVIEW (\S+):", prompt)
+            return "```json\n" + json.dumps([dict(fields, id=i) for i in ids]) + "\n```"
+        return "```json\n" + json.dumps(fields) + "\n```"
+    return "Echo: " + " ".join(prompt.split()[-20:])
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model answering locally, with a configurable latency and token rate."""
+
+    responses: Optional[List[str]] = None
+    respond: Callable[[str], str] = default_response
+    latency: float = 0.0
+    tokens_per_second: float = 0.0
+    model_name: str = "fake-chat"
+    calls: int = 0
+    counter: Any = None  # RequestCounter of a shared model
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    @property
+    def _identifying_params(self):
+        return {"model_name": self.model_name}
+
+    def get_num_tokens(self, text):
+        return count_tokens(text)
+
+    def _answer(self, messages):
+        prompt = "\n".join(m.content for m in messages if isinstance(m.content, str))
+        if self.responses:
+            text = self.responses[self.calls % len(self.responses)]
+        else:
+            text = self.respond(prompt)
+        self.calls += 1
+        return prompt, text
+
+    def _metadata(self, prompt, text):
+        prompt_tokens, completion_tokens = count_tokens(prompt), count_tokens(text)
+        return {
+            "model_name": self.model_name,
+            "token_usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def _delay(self, tokens):
+        return tokens / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        with counted(self.counter):
+            prompt, text = self._answer(messages)
+            delay = self.latency + self._delay(count_tokens(text))
+            if delay:
+                time.sleep(delay)
+        metadata = self._metadata(prompt, text)
+        message = AIMessage(content=text, response_metadata=metadata)
+        return ChatResult(generations=[ChatGeneration(message=message)], llm_output=metadata)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        with counted(self.counter):
+            prompt, text = self._answer(messages)
+            delay = self.latency + self._delay(count_tokens(text))
+            if delay:
+                await asyncio.sleep(delay)
+        metadata = self._metadata(prompt, text)
+        message = AIMessage(content=text, response_metadata=metadata)
+        return ChatResult(generations=[ChatGeneration(message=message)], llm_output=metadata)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        with counted(self.counter):
+            _, text = self._answer(messages)
+            if self.latency:
+                time.sleep(self.latency)
+        for token in _TOKEN.findall(text):
+            delay = self._delay(1)
+            if delay:
+                time.sleep(delay)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        with counted(self.counter):
+            _, text = self._answer(messages)
+            if self.latency:
+                await asyncio.sleep(self.latency)
+        for token in _TOKEN.findall(text):
+            delay = self._delay(1)
+            if delay:
+                await asyncio.sleep(delay)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic embeddings: the words of the text hashed into `size` dimensions (no network)."""
+
+    def __init__(self, size=256, model_name="fake-embedding", counter=None):
+        self.size = size
+        self.model_name = model_name
+        self.counter = counter  # RequestCounter of a shared model
+
+    def _embed(self, text):
+        vector = np.zeros(self.size, dtype=np.float32)
+        for word in _WORD.findall(text.lower()):
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            index = int.from_bytes(digest[:4], "little") % self.size
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            vector[0] = 1.0  # empty text: any unit vector
+            norm = 1.0
+        return (vector / norm).tolist()
+
+    def embed_documents(self, texts):
+        with counted(self.counter):
+            return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        with counted(self.counter):
+            return self._embed(text)
+
+
+def fake_chat_model(counter=None, **kwargs):
+    """FakeChatModel taking the arguments of ChatOpenAI (temperature, model, ...)."""
+    fields = {k: v for k, v in kwargs.items() if k in FakeChatModel.__fields__ and k not in ("model_name", "counter")}
+    return FakeChatModel(
+        model_name=kwargs.get("model") or kwargs.get("model_name") or "fake-chat", counter=counter, **fields
+    )
+
+
+def fake_embeddings(counter=None, **kwargs):
+    """FakeEmbeddings taking the arguments of OpenAIEmbeddings (model, dimensions, ...)."""
+    return FakeEmbeddings(
+        size=kwargs.get("dimensions") or 256, model_name=kwargs.get("model") or "fake-embedding", counter=counter
+    )
@@ -0,0 +1,118 @@
+# Fake OpenAI Server
+'''
+A small local HTTP server answering /v1/chat/completions and /v1/embeddings like the OpenAI API,
+to try the client pool without an API key or network:
+- every response is delayed by `latency` seconds,
+- a fraction `error_rate` of the requests gets a 429 with a Retry-After header.
+
+    python -m open_ai_code.fake_openai_server --port 8010 --latency 0.2 --error-rate 0.1
+
+then build the models with base_url="http://127.0.0.1:8010/v1", api_key="fake".
+'''
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def fake_embedding(text, size=8):
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return [b / 255.0 for b in digest[:size]]
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with server.lock:
+            server.requests += 1
+            server.connections.add(self.client_address)
+        time.sleep(server.latency)
+
+        if random.random() < server.error_rate:
+            with server.lock:
+                server.throttled += 1
+            self._send(
+                429,
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                {"Retry-After": str(server.retry_after)},
+            )
+            return
+
+        if self.path.endswith("/embeddings"):
+            inputs = body.get("input", [])
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            self._send(200, {
+                "object": "list",
+                "model": body.get("model", "fake"),
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": fake_embedding(str(text))}
+                    for i, text in enumerate(inputs)
+                ],
+                "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)},
+            })
+        elif self.path.endswith("/chat/completions"):
+            last = body.get("messages", [{}])[-1].get("content", "")
+            self._send(200, {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "fake"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": f"echo: {last}"},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+            })
+        else:
+            self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+
+
+def start_server(port=8010, latency=0.0, error_rate=0.0, retry_after=1):
+    """Start the fake server in a background thread and return it (call .shutdown() to stop)."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeOpenAIHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.error_rate = error_rate
+    server.retry_after = retry_after
+    server.requests = 0
+    server.throttled = 0
+    server.connections = set()  # distinct client (host, port) pairs: few means keep-alive works
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.1)
+    parser.add_argument("--retry-after", type=float, default=1)
+    args = parser.parse_args()
+    server = start_server(args.port, args.latency, args.error_rate, args.retry_after)
+    print(f"Fake OpenAI API on http://127.0.0.1:{args.port}/v1")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
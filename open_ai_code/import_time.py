@@ -0,0 +1,117 @@
+# Import Time
+'''
+A CLI worker that imports a lesson or a helper pays for everything it imports before doing anything.
+This measures it the way python -X importtime does, in a fresh interpreter for each module
+(cold: nothing imported yet), and checks it against a budget:
+- the package and the lesson modules (start.py, prompt_template.py) import nothing heavy,
+- client_pool.py imports httpx, and LangChain only when a model is created,
+- the helpers built on LangChain classes pay for langchain_core (most of their time).
+
+Each module is imported `runs` times and the fastest run is kept (the first one also pays for the
+disk cache). --top lists the heaviest imports under each module, to see what to make lazy.
+The exit status is 1 when a module is over its budget, so it can run in CI.
+
+    python -m open_ai_code.import_time
+    python -m open_ai_code.import_time open_ai_code.tracing --top 10
+'''
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+DEFAULT_MODULES = (
+    "open_ai_code",
+    "open_ai_code.start",
+    "open_ai_code.prompt_template",
+    "open_ai_code.client_pool",
+    "open_ai_code.eval_runner",
+    "open_ai_code.compiled_prompt",
+    "open_ai_code.tracing",
+    "open_ai_code.numpy_vectorstore",
+)
+
+# Cold-start budget (ms of import time) per module; DEFAULT_BUDGET_MS for the others.
+BUDGETS_MS = {
+    "open_ai_code": 20,
+    "open_ai_code.start": 100,
+    "open_ai_code.prompt_template": 100,
+    "open_ai_code.client_pool": 250,
+    "open_ai_code.eval_runner": 100,
+}
+DEFAULT_BUDGET_MS = 1500
+
+
+def _root():
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(module, python=sys.executable):
+    """{imported module: (self ms, cumulative ms)} for `import module` in a fresh interpreter, and its wall time (ms)."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [_root(), os.environ.get("PYTHONPATH")])))
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [python, "-X", "importtime", "-c", f"import {module}"], env=env, capture_output=True, text=True
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+    if completed.returncode != 0:
+        raise ImportError(f"import {module} failed:\n{completed.stderr.strip().splitlines()[-1]}")
+    times = {}
+    for line in completed.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(self_us) / 1000, int(cumulative_us) / 1000)
+    return times, wall_ms
+
+
+def measure(module, runs=3, python=sys.executable):
+    """Fastest of `runs` cold imports of `module`: its import time (ms), wall time (ms) and the imports of that run."""
+    best = None
+    for _ in range(runs):
+        times, wall_ms = import_times(module, python)
+        result = {"import_ms": times[module][1], "wall_ms": wall_ms, "imports": times}
+        if best is None or result["import_ms"] < best["import_ms"]:
+            best = result
+    return best
+
+
+def heaviest(imports, top=10):
+    """The `top` imports with the most self time: [(name, self ms, cumulative ms)]."""
+    ranked = sorted(imports.items(), key=lambda item: -item[1][0])
+    return [(name, self_ms, cumulative_ms) for name, (self_ms, cumulative_ms) in ranked[:top]]
+
+
+def run(modules=DEFAULT_MODULES, runs=3, budgets=None, default_budget_ms=DEFAULT_BUDGET_MS):
+    budgets = dict(BUDGETS_MS, **(budgets or {}))
+    results = {}
+    for module in modules:
+        result = measure(module, runs)
+        result["budget_ms"] = budgets.get(module, default_budget_ms)
+        result["ok"] = result["import_ms"] <= result["budget_ms"]
+        results[module] = result
+    return results
+
+
+def print_report(results, top=0):
+    print(f"{'module':32} {'import ms':>10} {'wall ms':>9} {'budget':>8}")
+    for module, r in results.items():
+        status = "ok" if r["ok"] else "OVER"
+        print(f"{module:32} {r['import_ms']:10.1f} {r['wall_ms']:9.1f} {r['budget_ms']:8.0f}  {status}")
+        if top:
+            for name, self_ms, cumulative_ms in heaviest(r["imports"], top):
+                print(f"    {name:40} self {self_ms:7.1f} ms  cumulative {cumulative_ms:7.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("modules", nargs="*", default=list(DEFAULT_MODULES))
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=0, help="list the N heaviest imports of each module")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS,
+                        help="budget of the modules without their own in BUDGETS_MS")
+    args = parser.parse_args()
+    results = run(args.modules, args.runs, default_budget_ms=args.budget_ms)
+    print_report(results, args.top)
+    sys.exit(0 if all(r["ok"] for r in results.values()) else 1)
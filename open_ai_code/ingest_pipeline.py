@@ -0,0 +1,180 @@
+# Streaming Ingest Pipeline
+'''
+loader.load() reads the whole CSV into a list of Documents before the first row is embedded:
+memory grows with the file and the embedding calls wait for the parsing to finish.
+
+ingest() streams the rows instead, through three stages running at the same time:
+
+    load (loader.lazy_load())  ->  embed (batches of rows)  ->  insert (vector store)
+
+Stages are connected with bounded queues: when the embedding stage is the bottleneck the
+loader waits instead of piling rows up in memory. At most `queue_size` batches are in flight
+between two stages, so memory stays flat whatever the size of the file, and the total time is
+close to the time of the slowest stage instead of the sum of the three.
+Batches are numbered when they are loaded: with several embedding workers they may finish out of
+order, and the insert stage puts them back in the order of the file. The loader also waits when it
+gets too far ahead of the last inserted batch, so a slow batch cannot make the batches finished
+after it pile up in the reorder buffer.
+'''
+import queue
+import threading
+import time
+from itertools import islice
+
+_DONE = object()
+
+
+def iter_batches(iterable, batch_size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+class _Stage(threading.Thread):
+    """Worker pulling items from `inbox`, calling `work` and pushing the result to `outbox`."""
+
+    def __init__(self, name, work, inbox, outbox, pipeline):
+        super().__init__(name=name, daemon=True)
+        self.work = work
+        self.inbox = inbox
+        self.outbox = outbox
+        self.pipeline = pipeline
+        self.busy = 0.0
+
+    def run(self):
+        while True:
+            try:
+                item = self.inbox.get(timeout=0.1)
+            except queue.Empty:
+                if self.pipeline.error is not None:
+                    return
+                continue
+            if item is _DONE:
+                self.pipeline.put(self.inbox, _DONE)  # let the other workers of this stage stop too
+                return
+            try:
+                started = time.perf_counter()
+                result = self.work(item)
+                self.busy += time.perf_counter() - started
+            except BaseException as e:
+                self.pipeline.fail(e)
+                return
+            if self.outbox is not None and not self.pipeline.put(self.outbox, result):
+                return
+
+
+class IngestPipeline:
+    def __init__(self, embeddings, vectorstore, batch_size=256, queue_size=4, embed_workers=2):
+        self.embeddings = embeddings
+        self.vectorstore = vectorstore
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.embed_workers = embed_workers
+        self.error = None
+        self.rows = 0
+        self._pending = {}  # batch number -> embedded batch waiting for the batches before it
+        self._next_batch = 0
+        # Batches loaded but not inserted yet: both queues, the embedding workers and _pending.
+        self.max_in_flight = 2 * queue_size + embed_workers
+        self._in_flight = None
+
+    def fail(self, error):
+        if self.error is None:
+            self.error = error
+
+    def put(self, q, item):
+        """Blocking put that gives up (returning False) as soon as any stage has failed."""
+        while self.error is None:
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _acquire(self, semaphore):
+        """Blocking acquire that gives up (returning False) as soon as any stage has failed."""
+        while self.error is None:
+            if semaphore.acquire(timeout=0.1):
+                return True
+        return False
+
+    def _embed(self, item):
+        number, docs = item
+        texts = [d.page_content for d in docs]
+        if not hasattr(self.vectorstore, "add_embeddings"):
+            # The store embeds by itself in add_texts().
+            return number, (docs, texts, None)
+        return number, (docs, texts, self.embeddings.embed_documents(texts))
+
+    def _insert(self, item):
+        number, batch = item
+        self._pending[number] = batch
+        while self._next_batch in self._pending:
+            docs, texts, vectors = self._pending.pop(self._next_batch)
+            metadatas = [d.metadata for d in docs]
+            if vectors is None:
+                self.vectorstore.add_texts(texts, metadatas=metadatas)
+            else:
+                self.vectorstore.add_embeddings(texts, vectors, metadatas=metadatas)
+            self.rows += len(docs)
+            self._next_batch += 1
+            self._in_flight.release()
+
+    def run(self, documents):
+        """Push an iterable of Documents through the pipeline, returning timing stats."""
+        started = time.perf_counter()
+        self._in_flight = threading.Semaphore(self.max_in_flight)
+        to_embed = queue.Queue(maxsize=self.queue_size)
+        to_insert = queue.Queue(maxsize=self.queue_size)
+        embedders = [
+            _Stage(f"embed-{i}", self._embed, to_embed, to_insert, self)
+            for i in range(self.embed_workers)
+        ]
+        # A single inserter: vector stores are not expected to be thread safe.
+        inserter = _Stage("insert", self._insert, to_insert, None, self)
+        for stage in embedders + [inserter]:
+            stage.start()
+
+        load_time = 0.0
+        batches = enumerate(iter_batches(documents, self.batch_size))
+        while self.error is None:
+            t = time.perf_counter()
+            try:
+                batch = next(batches, None)
+            except BaseException as e:
+                # The loader failed: stop the other stages (they exit once an error is set) and raise below.
+                self.fail(e)
+                break
+            load_time += time.perf_counter() - t
+            if batch is None:
+                break
+            if not self._acquire(self._in_flight) or not self.put(to_embed, batch):
+                break
+
+        self.put(to_embed, _DONE)
+        for stage in embedders:
+            stage.join()
+        self.put(to_insert, _DONE)
+        inserter.join()
+        if self.error is not None:
+            raise self.error
+
+        total = time.perf_counter() - started
+        return {
+            "rows": self.rows,
+            "seconds": total,
+            "rows_per_second": self.rows / total if total else 0.0,
+            "load_seconds": load_time,
+            "embed_seconds": sum(s.busy for s in embedders) / len(embedders),
+            "insert_seconds": inserter.busy,
+        }
+
+
+def ingest(loader, embeddings, vectorstore, batch_size=256, queue_size=4, embed_workers=2):
+    """Stream the loader's rows into `vectorstore` (see IngestPipeline)."""
+    pipeline = IngestPipeline(embeddings, vectorstore, batch_size, queue_size, embed_workers)
+    return pipeline.run(loader.lazy_load())
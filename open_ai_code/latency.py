@@ -0,0 +1,25 @@
+# Latency Percentiles
+'''
+Small helpers shared by the modules that time LLM calls (eval_runner, streaming, tracing,
+retrieval_eval, benchmarks). Pure Python, no dependency: importing it costs nothing.
+'''
+
+
+def percentile(values, p):
+    """p-th percentile (0-100) of `values`, by linear interpolation."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    rank = (len(values) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def latency_summary(values):
+    return {
+        "p50": percentile(values, 50),
+        "p90": percentile(values, 90),
+        "p99": percentile(values, 99),
+        "max": max(values, default=0.0),
+    }
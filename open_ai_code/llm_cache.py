@@ -0,0 +1,229 @@
+# Semantic LLM Cache
+'''
+Every chat(messages) / chain.run(...) goes to the model, even when the same question was
+answered a minute ago. With temperature=0 the answer would be the same, so it can be cached.
+
+SemanticLLMCache is a LangChain cache (set it once with set_llm_cache) with two levels:
+1. exact:    the formatted messages (whitespace normalized) + the model settings
+             (model name, temperature, ...) must match exactly.
+2. semantic: optional. If an embeddings model is given, a prompt whose last user message
+             is close enough (cosine similarity >= similarity_threshold) to the one of a cached
+             prompt of the same model settings reuses its answer.
+             Only the user message is embedded: in a RetrievalQA prompt the retrieved context
+             (system message) would dominate the embedding and two different questions would match.
+             Prompts that put everything in one message (the QAEvalChain grading prompt: query,
+             answer and student answer together) must not use this level: near-identical text
+             there has different answers. Keep the exact level only for them.
+
+Entries live in a local SQLite file, expire after ttl_seconds and the least recently used
+ones are evicted beyond max_entries.
+Only calls with temperature 0 are cached: with a higher temperature the caller asked for varied answers.
+The model settings are keyed without the objects LangChain cannot serialize (the pooled
+http_client, ...): their repr holds a memory address, which would change the key in every process.
+'''
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from array import array
+
+import numpy as np
+from langchain.load import dumps, loads
+from langchain.schema.cache import BaseCache
+
+from .numpy_vectorstore import normalize
+
+# Matches both the JSON form ("temperature": 0.0) and the tuple form ('temperature', 0.0)
+# of the llm_string LangChain builds from the model settings.
+TEMPERATURE = re.compile(r"""["']temperature["']\s*[:,]\s*(-?[0-9.]+)""")
+
+
+def is_deterministic(llm_string):
+    match = TEMPERATURE.search(llm_string)
+    return match is not None and float(match.group(1)) == 0.0
+
+
+# "<httpx.Client object at 0x7f...>": the address in a repr, for llm_strings that are not JSON.
+OBJECT_ADDRESS = re.compile(r" at 0x[0-9a-fA-F]+")
+
+
+def _serializable(value):
+    if isinstance(value, dict):
+        return {
+            k: _serializable(v) for k, v in value.items()
+            if not (isinstance(v, dict) and v.get("type") == "not_implemented")
+        }
+    if isinstance(value, list):
+        return [_serializable(v) for v in value]
+    return value
+
+
+def canonical_llm_string(llm_string):
+    """The llm_string without the parts that change from one process to the next."""
+    settings, sep, params = llm_string.rpartition("---")
+    try:
+        return json.dumps(_serializable(json.loads(settings)), sort_keys=True) + sep + params
+    except ValueError:
+        return OBJECT_ADDRESS.sub("", llm_string)
+
+
+def normalize_prompt(prompt):
+    return " ".join(prompt.split())
+
+
+def prompt_text(prompt):
+    """The last user message of a serialized chat prompt (what the semantic level compares)."""
+    try:
+        messages = json.loads(prompt)
+        human = [m["kwargs"]["content"] for m in messages if m["kwargs"].get("type") == "human"]
+        return human[-1] if human else "\n".join(m["kwargs"]["content"] for m in messages)
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return prompt
+
+
+class SemanticLLMCache(BaseCache):
+    def __init__(self, path="llm_cache.sqlite", embeddings=None, similarity_threshold=0.95,
+                 ttl_seconds=7 * 24 * 3600, max_entries=10000):
+        self.embeddings = embeddings
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+        self._vectors = {}  # model settings hash -> (keys, matrix) for the semantic level
+        self._pending_vectors = {}  # key -> embedding computed by a missed lookup, reused by update
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, llm TEXT, vector BLOB, value TEXT, created REAL, used REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS llm_cache_llm ON llm_cache (llm)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS llm_cache_used ON llm_cache (used)")
+        self._db.commit()
+
+    @staticmethod
+    def _hash(text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _llm(self, llm_string):
+        return self._hash(canonical_llm_string(llm_string))
+
+    def _key(self, prompt, llm):
+        return self._hash(llm + normalize_prompt(prompt))
+
+    def _row(self, key):
+        row = self._db.execute(
+            "SELECT value, created FROM llm_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, created = row
+        if time.time() - created > self.ttl_seconds:
+            self._db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self._db.commit()
+            self._vectors.clear()
+            return None
+        self._db.execute("UPDATE llm_cache SET used = ? WHERE key = ?", (time.time(), key))
+        self._db.commit()
+        return [loads(g) for g in json.loads(value)]
+
+    def _semantic_index(self, llm):
+        if llm not in self._vectors:
+            rows = self._db.execute(
+                "SELECT key, vector FROM llm_cache WHERE llm = ? AND vector IS NOT NULL", (llm,)
+            ).fetchall()
+            keys = [key for key, _ in rows]
+            matrix = np.array([array("f", blob).tolist() for _, blob in rows], dtype=np.float32)
+            self._vectors[llm] = (keys, matrix)
+        return self._vectors[llm]
+
+    def lookup(self, prompt, llm_string):
+        if not is_deterministic(llm_string):
+            return None
+        llm = self._llm(llm_string)
+        key = self._key(prompt, llm)
+        with self._lock:
+            value = self._row(key)
+            if value is not None:
+                self.exact_hits += 1
+                return value
+            if self.embeddings is None:
+                self.misses += 1
+                return None
+
+        vector = normalize(self.embeddings.embed_query(prompt_text(prompt)))
+        with self._lock:
+            if len(self._pending_vectors) > 1000:
+                # Lookups whose call failed never reach update(); do not let them pile up.
+                self._pending_vectors.clear()
+            self._pending_vectors[key] = vector
+            keys, matrix = self._semantic_index(llm)
+            if len(keys):
+                scores = matrix @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity_threshold:
+                    value = self._row(keys[best])
+                    if value is not None:
+                        self.semantic_hits += 1
+                        return value
+            self.misses += 1
+        return None
+
+    def update(self, prompt, llm_string, return_val):
+        if not is_deterministic(llm_string):
+            return
+        llm = self._llm(llm_string)
+        key = self._key(prompt, llm)
+        vector = None
+        if self.embeddings is not None:
+            with self._lock:
+                vector = self._pending_vectors.pop(key, None)
+            if vector is None:
+                vector = normalize(self.embeddings.embed_query(prompt_text(prompt)))
+        value = json.dumps([dumps(g) for g in return_val])
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, llm, vector, value, created, used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, llm, None if vector is None else array("f", vector).tobytes(), value, now, now),
+            )
+            self._evict()
+            self._db.commit()
+            if vector is not None and llm in self._vectors:
+                keys, matrix = self._vectors[llm]
+                matrix = np.vstack([matrix, vector]) if len(keys) else vector[None, :]
+                self._vectors[llm] = (keys + [key], matrix)
+
+    def _evict(self):
+        self._db.execute(
+            "DELETE FROM llm_cache WHERE created < ?", (time.time() - self.ttl_seconds,)
+        )
+        count = self._db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        if count > self.max_entries:
+            self._db.execute(
+                "DELETE FROM llm_cache WHERE key IN "
+                "(SELECT key FROM llm_cache ORDER BY used LIMIT ?)",
+                (count - self.max_entries,),
+            )
+            self._vectors.clear()
+
+    def clear(self, **kwargs):
+        with self._lock:
+            self._db.execute("DELETE FROM llm_cache")
+            self._db.commit()
+            self._vectors.clear()
+            self._pending_vectors.clear()
+
+    def stats(self):
+        total = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.semantic_hits) / total if total else 0.0,
+        }
@@ -0,0 +1,156 @@
+# NumPy Vector Store
+'''
+DocArrayInMemorySearch scores the documents one after the other in Python, so a search
+gets slower with every row added to the catalog.
+
+NumpyVectorStore keeps all the vectors in one contiguous float32 matrix, normalized once
+when they are added. Cosine similarity for a query is then a single matrix product,
+and the k best rows are picked with np.argpartition (no full sort of every score).
+Several queries can be searched together in one call: they become one matrix product too.
+
+It is a regular LangChain VectorStore, so it works anywhere DocArrayInMemorySearch did:
+    VectorstoreIndexCreator(vectorstore_cls=NumpyVectorStore)
+    NumpyVectorStore.from_documents(docs, embeddings).as_retriever()
+'''
+import uuid
+
+import numpy as np
+from langchain.schema import Document
+from langchain.vectorstores.base import VectorStore
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def top_k(scores, k):
+    """Indices of the k highest scores of every row of `scores`, best first."""
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    if k < scores.shape[1]:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        part = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1)
+    return np.take_along_axis(part, order, axis=1)
+
+
+class NumpyVectorStore(VectorStore):
+    """In-memory vector store doing exact cosine search with one matrix product."""
+
+    def __init__(self, embedding, matrix=None, documents=None, ids=None):
+        self.embedding = embedding
+        # `matrix` may be larger than the number of rows in use: it grows by doubling
+        # so adding texts one batch at a time does not copy the whole matrix every time.
+        self._matrix = matrix
+        self._size = 0 if matrix is None else len(matrix)
+        self.documents = list(documents or [])
+        self.ids = list(ids) if ids is not None else [str(uuid.uuid4()) for _ in self.documents]
+
+    @property
+    def embeddings(self):
+        return self.embedding
+
+    @property
+    def matrix(self):
+        if self._matrix is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return self._matrix[:self._size]
+
+    def __len__(self):
+        return self._size
+
+    def add_embeddings(self, texts, vectors, metadatas=None, ids=None):
+        """Add texts whose embeddings are already computed."""
+        texts = list(texts)
+        if not texts:
+            return []
+        vectors = normalize(vectors).reshape(len(texts), -1)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = list(ids) if ids is not None else [str(uuid.uuid4()) for _ in texts]
+
+        needed = self._size + len(texts)
+        if self._matrix is None or needed > len(self._matrix) or not self._matrix.flags.writeable:
+            capacity = max(needed, 2 * self._size, 1024)
+            grown = np.empty((capacity, vectors.shape[1]), dtype=np.float32)
+            if self._size:
+                grown[:self._size] = self.matrix
+            self._matrix = grown
+        self._matrix[self._size:needed] = vectors
+        self._size = needed
+
+        self.documents.extend(
+            Document(page_content=t, metadata=m) for t, m in zip(texts, metadatas)
+        )
+        self.ids.extend(ids)
+        return ids
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        vectors = self.embedding.embed_documents(texts) if texts else []
+        return self.add_embeddings(texts, vectors, metadatas, ids)
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, **kwargs):
+        store = cls(embedding)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+    @classmethod
+    def from_persistent_index(cls, index, embedding):
+        """Search a PersistentVectorIndex straight from its memory-mapped matrix."""
+        ids = [r["key"] for r in index.records]
+        return cls(embedding, matrix=index.vectors, documents=index.documents(), ids=ids)
+
+    def clear(self):
+        """Remove every row (and release the matrix, e.g. the memory map of a closed PersistentVectorIndex)."""
+        self._matrix = None
+        self._size = 0
+        self.documents = []
+        self.ids = []
+
+    # Batch search: one matrix product for all the queries.
+    def similarity_search_with_score_by_vectors(self, vectors, k=4):
+        if len(vectors) == 0:
+            return []
+        if self._size == 0:
+            return [[] for _ in vectors]
+        queries = normalize(vectors).reshape(len(vectors), -1)
+        scores = queries @ self.matrix.T
+        best = top_k(scores, k)
+        return [
+            [(self.documents[i], float(scores[row, i])) for i in best[row]]
+            for row in range(len(queries))
+        ]
+
+    def similarity_search_by_vectors(self, vectors, k=4):
+        return [
+            [doc for doc, _ in results]
+            for results in self.similarity_search_with_score_by_vectors(vectors, k)
+        ]
+
+    def similarity_search_batch(self, queries, k=4):
+        """Search several text queries at once, returning one list of documents per query."""
+        # embed_query, not embed_documents: some embeddings (instruction-tuned ones such as
+        # HuggingFaceInstructEmbeddings) embed a query differently from a document.
+        vectors = [self.embedding.embed_query(query) for query in queries]
+        return self.similarity_search_by_vectors(vectors, k)
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4):
+        return self.similarity_search_with_score_by_vectors([embedding], k)[0]
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k)
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return self.similarity_search_by_vector(self.embedding.embed_query(query), k)
+
+    def _select_relevance_score_fn(self):
+        # Cosine similarity in [-1, 1] -> relevance in [0, 1]
+        return lambda score: (score + 1.0) / 2.0
@@ -1,6 +1,6 @@
-from langchain.prompts import ChatPromptTemplate
+from .compiled_prompt import CompiledChatPromptTemplate
 from langchain.output_parsers import ResponseSchema, StructuredOutputParser
-from langchain_openai import ChatOpenAI
+from .client_pool import chat_model
 
 
 {
@@ -42,62 +42,64 @@ price_value
 text: {text}
 """
 
-prompt_template = ChatPromptTemplate.from_template(review_template)
-print(prompt_template)
 
-messages = prompt_template.format_messages(text=customer_review)
-chat = ChatOpenAI(temperature=0.0, model="gpt-3.5-turbo")
-response = chat(messages)
-print(response.content)
+def main():
+    prompt_template = CompiledChatPromptTemplate.from_template(review_template)
+    print(prompt_template)
 
-#OUTPUT
-# {
-#     "gift": true,
-#     "delivery_days": 2,
-#     "price_value": "It's slightly more expensive than the other leaf blowers out there"
-# }
+    messages = prompt_template.format_messages(text=customer_review)
+    chat = chat_model(temperature=0.0, model="gpt-3.5-turbo")
+    response = chat(messages)
+    print(response.content)
 
+    #OUTPUT
+    # {
+    #     "gift": true,
+    #     "delivery_days": 2,
+    #     "price_value": "It's slightly more expensive than the other leaf blowers out there"
+    # }
 
-# ---> Parse the LLM output string into a Python dictionary
-gift_schema = ResponseSchema(name="gift",
-                             description="Was the item purchased\
+
+    # ---> Parse the LLM output string into a Python dictionary
+    gift_schema = ResponseSchema(name="gift",
+                                 description="Was the item purchased\
                              as a gift for someone else? \
                              Answer True if yes,\
                              False if not or unknown.")
-delivery_days_schema = ResponseSchema(name="delivery_days",
-                                      description="How many days\
+    delivery_days_schema = ResponseSchema(name="delivery_days",
+                                          description="How many days\
                                       did it take for the product\
                                       to arrive? If this \
                                       information is not found,\
                                       output -1.")
-price_value_schema = ResponseSchema(name="price_value",
-                                    description="Extract any\
+    price_value_schema = ResponseSchema(name="price_value",
+                                        description="Extract any\
                                     sentences about the value or \
                                     price, and output them as a \
                                     comma separated Python list.")
 
-response_schemas = [gift_schema,
-                    delivery_days_schema,
-                    price_value_schema]
+    response_schemas = [gift_schema,
+                        delivery_days_schema,
+                        price_value_schema]
 
-output_parser = StructuredOutputParser.from_response_schemas(response_schemas)
-format_instructions = output_parser.get_format_instructions()
-print(format_instructions)
+    output_parser = StructuredOutputParser.from_response_schemas(response_schemas)
+    format_instructions = output_parser.get_format_instructions()
+    print(format_instructions)
 
-#OUTPUT:
-'''
-The output should be a markdown code snippet formatted in the following schema, including the leading and trailing "\`\`\`json" and "\`\`\`":
+    #OUTPUT:
+    '''
+    The output should be a markdown code snippet formatted in the following schema, including the leading and trailing "\`\`\`json" and "\`\`\`":
 
-json
-{
-	"gift": string // Was the item purchased as a gift for someone else? Answer True if yes, False if not or unknown.
-	"delivery_days": string // How many days did it take for the product to arrive? If this information is not found,output - 1.
-	"price_value": string // Extract any sentences about the value or price, and output them as acomma separated Python list.
-}
-```
-'''
+    json
+    {
+    	"gift": string // Was the item purchased as a gift for someone else? Answer True if yes, False if not or unknown.
+    	"delivery_days": string // How many days did it take for the product to arrive? If this information is not found,output - 1.
+    	"price_value": string // Extract any sentences about the value or price, and output them as acomma separated Python list.
+    }
+    ```
+    '''
 
-review_template_2 = """\
+    review_template_2 = """\
 For the following text, extract the following information:
 
 gift: Was the item purchased as a gift for someone else? \
@@ -114,57 +116,135 @@ text: {text}
 {format_instructions}
 """
 
-prompt = ChatPromptTemplate.from_template(template=review_template_2)
+    prompt = CompiledChatPromptTemplate.from_template(template=review_template_2)
 
-messages = prompt.format_messages(text=customer_review,
-                                  format_instructions=format_instructions)
-print(messages[0].content)
-#OUTPUT
-'''
-For the following text, extract the following information:
+    messages = prompt.format_messages(text=customer_review,
+                                      format_instructions=format_instructions)
+    print(messages[0].content)
+    #OUTPUT
+    '''
+    For the following text, extract the following information:
 
-gift: Was the item purchased as a gift for someone else? Answer True if yes, False if not or unknown.
+    gift: Was the item purchased as a gift for someone else? Answer True if yes, False if not or unknown.
 
-delivery_days: How many days did it take for the productto arrive? If this information is not found, output -1.
+    delivery_days: How many days did it take for the productto arrive? If this information is not found, output -1.
 
-price_value: Extract any sentences about the value or price,and output them as a comma separated Python list.
+    price_value: Extract any sentences about the value or price,and output them as a comma separated Python list.
 
-text: This leaf blower is pretty amazing.  It has four settings:candle blower, gentle breeze, windy city, and tornado. It arrived in two days, just in time for my wife's anniversary present. I think my wife liked it so much she was speechless. So far I've been the only one using it, and I've been using it every other morning to clear the leaves on our lawn. It's slightly more expensive than the other leaf blowers out there, but I think it's worth it for the extra features.
+    text: This leaf blower is pretty amazing.  It has four settings:candle blower, gentle breeze, windy city, and tornado. It arrived in two days, just in time for my wife's anniversary present. I think my wife liked it so much she was speechless. So far I've been the only one using it, and I've been using it every other morning to clear the leaves on our lawn. It's slightly more expensive than the other leaf blowers out there, but I think it's worth it for the extra features.
 
 
-The output should be a markdown code snippet formatted in the following schema, including the leading and trailing "\`\`\`json" and "\`\`\`":
+    The output should be a markdown code snippet formatted in the following schema, including the leading and trailing "\`\`\`json" and "\`\`\`":
 
-```json
-{
-	"gift": string  // Was the item purchased                             as a gift for someone else?                              Answer True if yes,                             False if not or unknown.
-	"delivery_days": string  // How many days                                      did it take for the product                                      to arrive? If this                                       information is not found,                                      output -1.
-	"price_value": string  // Extract any                                    sentences about the value or                                     price, and output them as a                                     comma separated Python list.
-}
-```
-'''
+    ```json
+    {
+    	"gift": string  // Was the item purchased                             as a gift for someone else?                              Answer True if yes,                             False if not or unknown.
+    	"delivery_days": string  // How many days                                      did it take for the product                                      to arrive? If this                                       information is not found,                                      output -1.
+    	"price_value": string  // Extract any                                    sentences about the value or                                     price, and output them as a                                     comma separated Python list.
+    }
+    ```
+    '''
 
-response = chat(messages)
-print(response.content)
+    response = chat(messages)
+    print(response.content)
 
-#OUTPUT
-'''
-```json
-{
-	"gift": true,
-	"delivery_days": 2,
-	"price_value": ["It's slightly more expensive than the other leaf blowers out there, but I think it's worth it for the extra features."]
-}
-```
-'''
+    #OUTPUT
+    '''
+    ```json
+    {
+    	"gift": true,
+    	"delivery_days": 2,
+    	"price_value": ["It's slightly more expensive than the other leaf blowers out there, but I think it's worth it for the extra features."]
+    }
+    ```
+    '''
+
+    output_dict = output_parser.parse(response.content)
+    print(output_dict)
+
+    #OUTPUT
+    '''
+    {'gift': True,
+     'delivery_days': 2,
+     'price_value': ["It's slightly more expensive than the other leaf blowers out there, but I think it's worth it for the extra features."]}
+    '''
+
+    output_dict.get('delivery_days') #Output = 2
+
+
+
+    # ---> Parse the response while it is streamed
+    '''
+    output_parser.parse only works on the complete response. IncrementalStructuredOutputParser reads the
+    streamed tokens and gives each field as soon as its value is complete; a malformed response raises
+    an OutputParserException at the first wrong character, without waiting for the rest.
+    '''
+    from .streaming_parser import IncrementalStructuredOutputParser
+
+    stream_parser = IncrementalStructuredOutputParser.from_response_schemas(response_schemas)
+    for name, value in stream_parser.parse_stream(chat.stream(messages)):
+        print(name, value)
+
+    #OUTPUT
+    '''
+    gift True
+    delivery_days 2
+    price_value ["It's slightly more expensive than the other leaf blowers out there, but I think it's worth it for the extra features."]
+    '''
+
+
+
+
+
+    # ---> Many reviews per call
+    '''
+    The nightly job extracts these fields from ~500k reviews. BulkReviewExtractor packs as many reviews as fit
+    in max_prompt_tokens into one prompt, so the instructions are paid once per batch instead of once per review,
+    and parses the JSON array of answers with the same response_schemas. Reviews whose answer is missing
+    or invalid are sent again one by one.
+    '''
+    from .review_extraction import BulkReviewExtractor
+
+    reviews = [("r1", customer_review), ("r2", "The blender broke after a week. Cheap, but not worth it.")]
+    extractor = BulkReviewExtractor(chat, response_schemas, max_prompt_tokens=3000)
+    extracted = extractor.run(reviews)
+    print(extracted["r1"]) # {'gift': True, 'delivery_days': 2, 'price_value': [...]}
+    print(extractor.stats()) # {'reviews': 2, 'calls': 1, ..., 'reviews_per_second': ..., 'tokens_per_review': ...}
+
+
+
+
+
+    # ---> Static instructions first, review last
+    '''
+    In review_template_2 the review ({text}) comes before the format instructions, so the prompts of two reviews
+    differ from the middle on, and the provider cannot reuse the cached start of the previous prompt.
+    prefix_prompt puts the instructions and the format instructions (filled in once, here) first,
+    and the review last, in the same human message. cacheable_prefix measures the tokens every prompt shares.
+    '''
+    from .prompt_prefix import cacheable_prefix, prefix_prompt
+
+    review_instructions = """\
+For the following text, extract the following information:
+
+gift: Was the item purchased as a gift for someone else? \
+Answer True if yes, False if not or unknown.
+
+delivery_days: How many days did it take for the product\
+to arrive? If this information is not found, output -1.
+
+price_value: Extract any sentences about the value or price,\
+and output them as a comma separated Python list.
+
+{format_instructions}
+"""
+
+    review_prompt = prefix_prompt(review_instructions, "text: {text}", format_instructions=format_instructions)
+    messages = review_prompt.format_messages(text=customer_review) # no format_instructions to pass any more
 
-output_dict = output_parser.parse(response.content)
-print(output_dict)
+    print(cacheable_prefix(prompt, chat.get_num_tokens)) # review_template_2: the prefix stops at {text}
+    print(cacheable_prefix(review_prompt, chat.get_num_tokens)) # all the instructions are in the prefix
 
-#OUTPUT
-'''
-{'gift': True,
- 'delivery_days': 2,
- 'price_value': ["It's slightly more expensive than the other leaf blowers out there, but I think it's worth it for the extra features."]}
-'''
 
-output_dict.get('delivery_days') #Output = 2
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+# Persistent Vector Index
+'''
+DocArrayInMemorySearch keeps every vector in RAM and forgets them when the process exits,
+so every run of Doc_Q&A.py re-embeds the whole CSV (one embedding call per row).
+
+The PersistentVectorIndex below writes the vectors once to disk:
+- vectors.npy     a float32 matrix (one row per document) opened with memory mapping,
+                  so re-opening the index only maps the file instead of reading it.
+- metadata.jsonl  a sidecar with one line per row: key, content hash, page_content and metadata.
+- index.json      small header (dimension, row count, embedding model).
+
+as_vectorstore() searches the mapped matrix with NumpyVectorStore, so it can be used as a retriever.
+The stores share the index's memory map: close() (and sync(), which closes the index it replaces)
+empties them, so ask the new index for a new store after a sync.
+
+When the CSV changes, sync() compares the content hash of every row and only re-embeds
+the rows that are new or whose content changed. Unchanged rows reuse their stored vector, wherever
+they moved in the file (a row inserted at the top does not re-embed the rows below it).
+'''
+import hashlib
+import json
+import os
+import weakref
+
+import numpy as np
+from langchain.schema import Document
+
+from .numpy_vectorstore import normalize, NumpyVectorStore
+
+VECTORS_FILE = "vectors.npy"
+METADATA_FILE = "metadata.jsonl"
+HEADER_FILE = "index.json"
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def document_key(doc, position):
+    # CSVLoader puts the file name and the row number in the metadata,
+    # which gives every row a stable key across runs.
+    source = doc.metadata.get("source")
+    row = doc.metadata.get("row")
+    if source is not None and row is not None:
+        return f"{source}:{row}"
+    return str(position)
+
+
+def _embedding_name(embeddings):
+    return (
+        getattr(embeddings, "model_name", None)
+        or getattr(embeddings, "model", None)
+        or type(embeddings).__name__
+    )
+
+
+class PersistentVectorIndex:
+    """Float32 vector matrix memory-mapped from disk, plus a metadata sidecar."""
+
+    def __init__(self, path, vectors, header):
+        self.path = path
+        self.vectors = vectors
+        self.header = header
+        self._records = None
+        self._stores = weakref.WeakSet()  # NumpyVectorStores searching self.vectors
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    @property
+    def dimension(self):
+        return self.header["dimension"]
+
+    # Opening only maps the matrix; the sidecar is read the first time it is needed.
+    @classmethod
+    def open(cls, path):
+        with open(os.path.join(path, HEADER_FILE), encoding="utf-8") as f:
+            header = json.load(f)
+        vectors = np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r")
+        return cls(path, vectors, header)
+
+    @classmethod
+    def exists(cls, path):
+        return all(
+            os.path.exists(os.path.join(path, name))
+            for name in (HEADER_FILE, VECTORS_FILE, METADATA_FILE)
+        )
+
+    def close(self):
+        """Unmap the vectors file (Windows cannot replace a file that is still mapped).
+
+        The stores returned by as_vectorstore() share the mapping: they are emptied too.
+        """
+        for store in list(self._stores):
+            store.clear()
+        self.vectors = None
+
+    @property
+    def records(self):
+        if self._records is None:
+            with open(os.path.join(self.path, METADATA_FILE), encoding="utf-8") as f:
+                self._records = [json.loads(line) for line in f]
+        return self._records
+
+    def documents(self):
+        return [
+            Document(page_content=r["page_content"], metadata=r["metadata"])
+            for r in self.records
+        ]
+
+    @classmethod
+    def build(cls, path, docs, embeddings, batch_size=1000):
+        """Embed every document and write a new index to `path`."""
+        return cls._write(path, list(docs), embeddings, {}, None, batch_size)
+
+    @classmethod
+    def from_loader(cls, path, loader, embeddings, batch_size=1000):
+        """Open the index at `path`, creating or refreshing it from the loader's rows."""
+        docs = loader.load()
+        if not cls.exists(path):
+            return cls.build(path, docs, embeddings, batch_size)
+        return cls.open(path).sync(docs, embeddings, batch_size)
+
+    def sync(self, docs, embeddings, batch_size=1000):
+        """Bring the index in line with `docs`, re-embedding only new or changed rows."""
+        docs = list(docs)
+        if self.header.get("embedding") != _embedding_name(embeddings):
+            # Vectors from another model are not comparable, start over.
+            self.close()
+            return self.build(self.path, docs, embeddings, batch_size)
+        unchanged = len(docs) == len(self) and all(
+            document_key(doc, i) == r["key"] and content_hash(doc.page_content) == r["hash"]
+            for i, (doc, r) in enumerate(zip(docs, self.records))
+        )
+        if unchanged:
+            return self
+        # Keyed on the content alone: a row keeps its vector when rows are inserted or deleted above it.
+        old_rows = {}
+        for i, r in enumerate(self.records):
+            old_rows.setdefault(r["hash"], i)
+        return self._write(self.path, docs, embeddings, old_rows, self, batch_size)
+
+    @classmethod
+    def _write(cls, path, docs, embeddings, old_rows, old_index, batch_size):
+        os.makedirs(path, exist_ok=True)
+        old_vectors = old_index.vectors if old_index is not None else None
+        records = []
+        reuse = {}  # new row -> old row
+        to_embed = []  # new rows that need an embedding call
+        for i, doc in enumerate(docs):
+            key = document_key(doc, i)
+            digest = content_hash(doc.page_content)
+            old = old_rows.get(digest)
+            if old is not None:
+                reuse[i] = old
+            else:
+                to_embed.append(i)
+            records.append({
+                "key": key,
+                "hash": digest,
+                "page_content": doc.page_content,
+                "metadata": doc.metadata,
+            })
+
+        new_vectors = {}
+        for start in range(0, len(to_embed), batch_size):
+            rows = to_embed[start:start + batch_size]
+            embedded = embeddings.embed_documents([docs[i].page_content for i in rows])
+            new_vectors.update(zip(rows, embedded))
+
+        if old_vectors is not None and len(old_vectors):
+            dimension = old_vectors.shape[1]
+        elif new_vectors:
+            dimension = len(next(iter(new_vectors.values())))
+        else:
+            dimension = 0
+
+        # Write into temporary files first so a crash never leaves a half-written index,
+        # then swap them in.
+        tmp_vectors = os.path.join(path, VECTORS_FILE + ".tmp")
+        matrix = np.lib.format.open_memmap(
+            tmp_vectors, mode="w+", dtype=np.float32, shape=(len(docs), dimension)
+        )
+        # Vectors are stored normalized, so cosine similarity is a plain dot product at search time.
+        for i in range(len(docs)):
+            if i in reuse:
+                matrix[i] = old_vectors[reuse[i]]
+            else:
+                matrix[i] = normalize(new_vectors[i])
+        matrix.flush()
+        del matrix
+        # Nothing may keep the old vectors.npy mapped when it is replaced below.
+        del old_vectors
+        if old_index is not None:
+            old_index.close()
+
+        tmp_metadata = os.path.join(path, METADATA_FILE + ".tmp")
+        with open(tmp_metadata, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+
+        header = {
+            "dimension": dimension,
+            "count": len(docs),
+            "embedding": _embedding_name(embeddings),
+            "reembedded": len(to_embed),
+        }
+        tmp_header = os.path.join(path, HEADER_FILE + ".tmp")
+        with open(tmp_header, "w", encoding="utf-8") as f:
+            json.dump(header, f)
+
+        os.replace(tmp_vectors, os.path.join(path, VECTORS_FILE))
+        os.replace(tmp_metadata, os.path.join(path, METADATA_FILE))
+        os.replace(tmp_header, os.path.join(path, HEADER_FILE))
+
+        index = cls.open(path)
+        index._records = records
+        return index
+
+    def as_vectorstore(self, embedding):
+        """NumpyVectorStore searching this index without copying or re-embedding the vectors (until close())."""
+        store = NumpyVectorStore.from_persistent_index(self, embedding)
+        self._stores.add(store)
+        return store
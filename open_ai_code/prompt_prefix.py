@@ -0,0 +1,79 @@
+# Prompt Prefix Caching
+'''
+The OpenAI API caches the beginning of prompts: when a prompt starts with the same tokens as a recent
+one (at least 1024 tokens, then by steps of 128), those tokens are not processed again, which lowers
+the latency and the price of the input. Only the part before the first difference can be reused,
+so everything that is the same for every call (the system text, the format instructions, the list of
+destinations) should come first, and the variables ({input}, {text}) last.
+
+review_template_2 in output_parser.py puts {text} before {format_instructions}, so the prompts of two
+reviews differ from the middle of the instructions on, and the format instructions are passed again
+with every call.
+
+prefix_prompt(static_template, variable_template, **static_values) builds the prompt in that order:
+the static text, filled in once with static_values (e.g. the format instructions), then the variable part.
+Both stay in one human message, like the prompts they replace: only the order changes, not the roles.
+
+cacheable_prefix(prompt) measures how many tokens of a prompt are the same for every input, and how
+many of them the provider can cache; prefix_report({name: prompt}) does it for a set of templates.
+'''
+from .compiled_prompt import CompiledChatPromptTemplate
+
+MIN_CACHED_TOKENS = 1024
+CACHE_INCREMENT = 128
+
+# Two values that differ from their first character, so two renderings share exactly the static prefix.
+_SENTINELS = ("\ue000", "\ue001")
+
+
+def approximate_tokens(text):
+    """Rough token count (4 characters per token), when no tokenizer is at hand."""
+    return (len(text) + 3) // 4
+
+
+def prefix_prompt(static_template, variable_template, **static_values):
+    """Chat prompt with the static text (filled in now) first and the variables last, in one human message."""
+    static_text = static_template.format(**static_values)
+    # The static text is final: escape its braces (JSON in the format instructions) before adding the variables.
+    escaped = static_text.replace("{", "{{").replace("}", "}}")
+    return CompiledChatPromptTemplate.from_template(escaped + variable_template)
+
+
+def render(prompt, values):
+    """The prompt as the provider reads it: the messages in order, with their role."""
+    if hasattr(prompt, "format_messages"):
+        return "".join(f"{m.type}: {m.content}\n" for m in prompt.format_messages(**values))
+    return prompt.format(**values)
+
+
+def cached_tokens(prefix_tokens, min_cached_tokens=MIN_CACHED_TOKENS, increment=CACHE_INCREMENT):
+    """How many of the `prefix_tokens` shared tokens the provider cache can reuse."""
+    if prefix_tokens < min_cached_tokens:
+        return 0
+    return min_cached_tokens + (prefix_tokens - min_cached_tokens) // increment * increment
+
+
+def cacheable_prefix(prompt, count_tokens=approximate_tokens, min_cached_tokens=MIN_CACHED_TOKENS,
+                     increment=CACHE_INCREMENT):
+    """Tokens of `prompt` that are the same whatever the input, and how many of them can be cached."""
+    first, second = (
+        render(prompt, {name: sentinel for name in prompt.input_variables}) for sentinel in _SENTINELS
+    )
+    shared = 0
+    for a, b in zip(first, second):
+        if a != b:
+            break
+        shared += 1
+    prefix_tokens = count_tokens(first[:shared])
+    static_tokens = count_tokens(render(prompt, {name: "" for name in prompt.input_variables}))
+    return {
+        "prefix_tokens": prefix_tokens,
+        "static_tokens": static_tokens,
+        "prefix_share": prefix_tokens / static_tokens if static_tokens else 0.0,
+        "cached_tokens": cached_tokens(prefix_tokens, min_cached_tokens, increment),
+    }
+
+
+def prefix_report(prompts, count_tokens=approximate_tokens, **kwargs):
+    """cacheable_prefix() of each {name: prompt}."""
+    return {name: cacheable_prefix(prompt, count_tokens, **kwargs) for name, prompt in prompts.items()}
@@ -1,5 +1,7 @@
-from langchain.prompts import ChatPromptTemplate
-from .start import chat
+# Importing start.py only defines functions: the model is created and called in main(),
+# with python -m open_ai_code.prompt_template.
+from dotenv import load_dotenv
+from .start import enable_cache, load_chat
 
 # PROMPT TEMPLATE
 template_string = """Translate the text \
@@ -8,11 +10,6 @@ into a style that is {style}. \
 text: ```{text}```
 """
 
-prompt_template = ChatPromptTemplate.from_template(template_string)
-
-# print(prompt_template.messages[0].prompt)
-# print(prompt_template.messages[0].prompt.input_variables) #this will print out [style, text]
-
 customer_style = """American English \
 in a calm and respectful tone
 """
@@ -25,19 +22,6 @@ cleaning up me kitchen. I need yer help \
 right now, matey!
 """
 
-customer_messages = prompt_template.format_messages(
-    style=customer_style,
-    text=customer_email)
-
-# print(type(customer_messages))
-# print(type(customer_messages[0]))
-
-# print(customer_messages[0])
-
-# Call the LLM to translate to the style of the customer message
-customer_response = chat(customer_messages)
-print(customer_response.content)
-
 service_reply = """Hey there customer, \
 the warranty does not cover \
 cleaning expenses for your kitchen \
@@ -52,11 +36,44 @@ service_style_pirate = """\
 a polite tone \
 that speaks in English Pirate\
 """
-service_messages = prompt_template.format_messages(
-    style=service_style_pirate,
-    text=service_reply)
 
-print(service_messages[0].content)
 
-service_response = chat(service_messages)
-print(service_response.content)
+def main():
+    from .compiled_prompt import CompiledChatPromptTemplate
+
+    # Load environment variables from .env file
+    load_dotenv()
+
+    chat = load_chat()
+    enable_cache()
+
+    prompt_template = CompiledChatPromptTemplate.from_template(template_string)
+
+    # print(prompt_template.messages[0].prompt)
+    # print(prompt_template.messages[0].prompt.input_variables) #this will print out [style, text]
+
+    customer_messages = prompt_template.format_messages(
+        style=customer_style,
+        text=customer_email)
+
+    # print(type(customer_messages))
+    # print(type(customer_messages[0]))
+
+    # print(customer_messages[0])
+
+    # Call the LLM to translate to the style of the customer message
+    customer_response = chat(customer_messages)
+    print(customer_response.content)
+
+    service_messages = prompt_template.format_messages(
+        style=service_style_pirate,
+        text=service_reply)
+
+    print(service_messages[0].content)
+
+    service_response = chat(service_messages)
+    print(service_response.content)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+# Pooled Python REPL Workers
+'''
+create_python_agent(llm, tool=PythonREPLTool()) runs the code of the agent in the agent's own process,
+in a single shared REPL: a snippet that loops forever blocks the agent, and two agent sessions cannot
+run code at the same time.
+
+PythonWorkerPool keeps a pool of worker processes started in advance (with common modules already
+imported), shared by every session:
+- the executions of all the sessions go through one queue, and run in parallel on `processes` workers
+  (one per core by default),
+- each execution may use at most cpu_seconds of CPU time (RLIMIT_CPU, counted from what the worker
+  has already used) and `timeout` seconds of wall-clock time (SIGALRM); a worker that still does not
+  answer is killed, and the pool starts a new one,
+- each worker may use at most memory_mb of memory more than the warm interpreter (RLIMIT_AS),
+- a worker is replaced by a fresh one after max_runs_per_worker executions.
+Each execution starts with empty globals: nothing is kept from one snippet to the next.
+
+PooledPythonREPLTool is the tool to give to create_python_agent instead of PythonREPLTool().
+The limits use the POSIX resource and signal modules; without them only the wall-clock timeout applies.
+'''
+import asyncio
+import importlib
+import itertools
+import multiprocessing
+import os
+import re
+import signal
+import threading
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+from typing import Any
+
+from langchain.tools import BaseTool
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_PRELOAD = ("math", "json", "re", "datetime", "collections", "itertools", "statistics")
+
+
+class CPUTimeExceeded(BaseException):
+    # BaseException, so that an `except Exception` in the snippet does not swallow it.
+    pass
+
+
+class ExecutionTimeout(BaseException):
+    pass
+
+
+def _raise_cpu(signum, frame):
+    raise CPUTimeExceeded()
+
+
+def _raise_timeout(signum, frame):
+    raise ExecutionTimeout()
+
+
+_started_queue = None
+
+
+def _init_worker(started_queue, memory_bytes, preload):
+    global _started_queue
+    _started_queue = started_queue
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C is for the parent
+    if hasattr(signal, "SIGXCPU"):
+        signal.signal(signal.SIGXCPU, _raise_cpu)
+    if hasattr(signal, "SIGALRM"):
+        signal.signal(signal.SIGALRM, _raise_timeout)
+    for name in preload:
+        importlib.import_module(name)
+    if resource is not None and memory_bytes:
+        # The worker starts with the address space of the parent (and of the preloaded modules):
+        # the limit is on top of it.
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        limit = _address_space() + memory_bytes
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+def _address_space():
+    """Bytes of address space used by this process (0 when /proc is not available)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def _execute(task_id, code, cpu_seconds, timeout):
+    """Run `code` in this worker; return (status, printed output or error)."""
+    _started_queue.put((task_id, os.getpid(), time.monotonic()))
+    cpu_hard = None
+    if resource is not None and cpu_seconds:
+        # RLIMIT_CPU counts the CPU time of the whole process: the limit is what this worker has used so far + cpu_seconds.
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        _, cpu_hard = resource.getrlimit(resource.RLIMIT_CPU)
+        soft = int(usage.ru_utime + usage.ru_stime + cpu_seconds) + 1
+        if cpu_hard != resource.RLIM_INFINITY:
+            soft = min(soft, cpu_hard)
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, cpu_hard))
+    if timeout and hasattr(signal, "setitimer"):
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+
+    output = StringIO()
+    try:
+        with redirect_stdout(output):
+            exec(code, {"__name__": "__main__"})
+        return "ok", output.getvalue()
+    except CPUTimeExceeded:
+        return "cpu_limit", f"CPU time limit exceeded ({cpu_seconds}s)"
+    except ExecutionTimeout:
+        return "timeout", "Execution timed out"
+    except MemoryError:
+        return "memory_limit", "MemoryError: memory limit exceeded"
+    except BaseException as e:  # SystemExit from exit() too: the worker must survive the snippet
+        return "error", repr(e)
+    finally:
+        if timeout and hasattr(signal, "setitimer"):
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        if cpu_hard is not None:
+            resource.setrlimit(resource.RLIMIT_CPU, (cpu_hard, cpu_hard))
+
+
+class PythonWorkerPool:
+    def __init__(self, processes=None, max_runs_per_worker=100, cpu_seconds=5, memory_mb=512,
+                 timeout=10.0, kill_grace=2.0, preload=DEFAULT_PRELOAD):
+        self.processes = processes or os.cpu_count() or 1
+        self.cpu_seconds = cpu_seconds
+        self.timeout = timeout
+        self.kill_grace = kill_grace
+        context = multiprocessing.get_context()
+        self._started_queue = context.SimpleQueue()  # no feeder thread in the workers
+        self._pool = context.Pool(
+            self.processes,
+            initializer=_init_worker,
+            initargs=(self._started_queue, memory_mb * 1024 * 1024 if memory_mb else None, tuple(preload)),
+            maxtasksperchild=max_runs_per_worker,
+        )
+        self._task_ids = itertools.count()
+        self._active = set()  # task ids of the run() calls waiting for a result
+        self._started = {}  # task id -> (worker pid, start time)
+        self._counts = {"runs": 0, "ok": 0, "error": 0, "cpu_limit": 0, "memory_limit": 0, "timeout": 0, "killed": 0}
+        self._lock = threading.Lock()
+        threading.Thread(target=self._read_started, daemon=True).start()
+
+    def _read_started(self):
+        while True:
+            message = self._started_queue.get()
+            if message is None:  # close()
+                return
+            task_id, pid, started = message
+            with self._lock:
+                if task_id in self._active:
+                    self._started[task_id] = (pid, started)
+
+    def _count(self, status):
+        with self._lock:
+            self._counts["runs"] += 1
+            self._counts[status] += 1
+
+    def run(self, code):
+        """Run `code` on a worker (waiting for a free one) and return what it printed, or the error."""
+        task_id = next(self._task_ids)
+        with self._lock:
+            self._active.add(task_id)
+        result = self._pool.apply_async(_execute, (task_id, code, self.cpu_seconds, self.timeout))
+        try:
+            while not result.ready():
+                result.wait(0.1)
+                with self._lock:
+                    pid, started = self._started.get(task_id, (None, None))
+                # The time spent waiting in the queue does not count, only the time since the worker took it.
+                if started is not None and time.monotonic() - started > self.timeout + self.kill_grace:
+                    # The snippet caught the timeout: kill the worker, the pool replaces it.
+                    try:
+                        os.kill(pid, signal.SIGKILL if hasattr(signal, "SIGKILL") else signal.SIGTERM)
+                    except OSError:
+                        pass
+                    self._count("killed")
+                    return "Execution timed out"
+            status, output = result.get()
+        finally:
+            with self._lock:
+                self._active.discard(task_id)
+                self._started.pop(task_id, None)
+        self._count(status)
+        return output
+
+    async def arun(self, code):
+        return await asyncio.get_running_loop().run_in_executor(None, self.run, code)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts, processes=self.processes)
+
+    def close(self):
+        self._started_queue.put(None)
+        self._pool.terminate()
+        self._pool.join()
+
+
+def sanitize_input(query):
+    """Remove the whitespace, backticks and "python" around the code written by the LLM."""
+    query = re.sub(r"^(\s|`)*(?i:python)?\s*", "", query)
+    return re.sub(r"(\s|`)*$", "", query)
+
+
+class PooledPythonREPLTool(BaseTool):
+    """PythonREPLTool running the code on a PythonWorkerPool."""
+
+    name: str = "Python_REPL"
+    description: str = (
+        "A Python shell. Use this to execute python commands. "
+        "Input should be a valid python command. "
+        "If you want to see the output of a value, you should print it out with `print(...)`."
+    )
+    pool: Any = None
+    sanitize_input: bool = True
+
+    def _run(self, query, run_manager=None):
+        if self.sanitize_input:
+            query = sanitize_input(query)
+        return self.pool.run(query)
+
+    async def _arun(self, query, run_manager=None):
+        if self.sanitize_input:
+            query = sanitize_input(query)
+        return await self.pool.arun(query)
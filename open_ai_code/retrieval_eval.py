@@ -0,0 +1,96 @@
+# Retrieval Evaluation
+'''
+A wrong answer from qa.run can come from the LLM or from the retrieval: if the right catalog row
+is not among the documents given to the LLM, it cannot answer. langchain.debug = True shows
+the retrieved documents, but only one query at a time and after paying for the generation.
+
+evaluate_retrieval() only runs the retriever, for every example at once, and measures:
+- recall@k: how often the row the question was written from is in the first k documents,
+- MRR (mean reciprocal rank): 1 if that row comes first, 1/2 if second, ... 0 if not retrieved,
+- the latency percentiles of the retrieval.
+
+Each example needs the query and the metadata of its source row
+(generate_dataset() writes it as "source"; for CSVLoader rows it is {"source": file, "row": n}).
+No LLM is called, so the index settings can be compared in seconds.
+The retriever is asked for max(ks) documents with its other settings unchanged (search_type,
+score threshold, filter): the metrics are those of the retriever the chain actually uses.
+'''
+import time
+
+from .latency import latency_summary
+
+
+def is_source(doc, source):
+    if hasattr(source, "page_content"):
+        return doc.page_content == source.page_content
+    return all(doc.metadata.get(key) == value for key, value in source.items())
+
+
+def with_k(retriever, k):
+    """A copy of the retriever returning k documents per query, with its other search settings."""
+    if hasattr(retriever, "search_kwargs"):
+        # VectorStoreRetriever: search_type (mmr, similarity_score_threshold) and filters are kept.
+        return retriever.copy(update={"search_kwargs": {**retriever.search_kwargs, "k": k}})
+    if hasattr(retriever, "k"):
+        return retriever.copy(update={"k": k})
+    raise ValueError(
+        f"Cannot make {type(retriever).__name__} return {k} documents per query: "
+        "recall@k would be capped at its own k. Pass a retriever with search_kwargs or a k field."
+    )
+
+
+def _retrieve_all(retriever, queries, k, batch_size):
+    """Documents retrieved for each query, and the latency (ms) of each query."""
+    if not hasattr(retriever, "get_relevant_documents"):
+        # A vector store: search it directly.
+        store, search = retriever, lambda query: retriever.similarity_search(query, k=k)
+    else:
+        retriever = with_k(retriever, k)
+        store, search = getattr(retriever, "vectorstore", None), retriever.invoke
+        plain = getattr(retriever, "search_type", None) == "similarity" and set(retriever.search_kwargs) == {"k"}
+        if not plain:
+            store = None
+
+    results, latencies = [], []
+    if hasattr(store, "similarity_search_batch"):
+        # NumpyVectorStore / IVFVectorStore: one call for a whole batch of queries.
+        for start in range(0, len(queries), batch_size):
+            batch = queries[start:start + batch_size]
+            started = time.perf_counter()
+            results.extend(store.similarity_search_batch(batch, k=k))
+            elapsed = (time.perf_counter() - started) * 1000
+            latencies.extend([elapsed / len(batch)] * len(batch))
+        return results, latencies
+
+    for query in queries:
+        started = time.perf_counter()
+        results.append(search(query))
+        latencies.append((time.perf_counter() - started) * 1000)
+    return results, latencies
+
+
+def evaluate_retrieval(retriever, examples, ks=(1, 4, 10), source_key="source", batch_size=256):
+    """recall@k for each k in `ks`, MRR@max(ks) and latency of the retriever over `examples`."""
+    examples = [e for e in examples if e.get(source_key) is not None]
+    k = max(ks)
+    started = time.perf_counter()
+    results, latencies = _retrieve_all(retriever, [e["query"] for e in examples], k, batch_size)
+    seconds = time.perf_counter() - started
+
+    ranks = []  # rank (1 = first) of the source row, None when not retrieved
+    for example, docs in zip(examples, results):
+        rank = next(
+            (i for i, doc in enumerate(docs, start=1) if is_source(doc, example[source_key])),
+            None,
+        )
+        ranks.append(rank)
+
+    n = len(examples)
+    report = {"queries": n}
+    for cutoff in ks:
+        report[f"recall@{cutoff}"] = sum(1 for r in ranks if r is not None and r <= cutoff) / n if n else 0.0
+    report[f"mrr@{k}"] = sum(1 / r for r in ranks if r is not None) / n if n else 0.0
+    report["latency_ms"] = latency_summary(latencies)
+    report["queries_per_second"] = n / seconds if seconds else 0.0
+    report["misses"] = [e["query"] for e, r in zip(examples, ranks) if r is None]
+    return report
@@ -0,0 +1,177 @@
+# Bulk Review Extraction
+'''
+output_parser.py extracts gift / delivery_days / price_value from one customer review per LLM call.
+Every call sends the instructions and the format instructions again, and for short reviews they are
+most of the tokens paid for.
+
+BulkReviewExtractor sends many reviews in each call:
+- the reviews are packed with their id into one prompt, as long as the prompt stays under
+  max_prompt_tokens (and max_reviews_per_call); the instructions are sent once per batch,
+- the LLM answers a JSON array with one object per review, with the id and the fields of the
+  same ResponseSchema list as output_parser.py,
+- the object of each review is checked against the schemas; a review whose object is missing or
+  invalid (or whose whole batch failed) is put back in the queue and sent again alone,
+- the batches run on a pool of threads (max_workers calls in flight).
+
+stats() gives the reviews per second and the tokens per review.
+'''
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextvars import copy_context
+
+from langchain.schema import OutputParserException
+from langchain_core.utils.json import parse_json_markdown
+
+from .compiled_prompt import CompiledChatPromptTemplate
+
+bulk_template = """\
+For each of the customer reviews below, extract the following information:
+
+{fields}
+
+Answer with a JSON array in a markdown code snippet starting with "```json" and ending with "```", \
+with one object per review, in the same order, with the following keys:
+\t"{id_key}": string  // The id of the review
+{format}
+
+{reviews}"""
+
+BULK_PROMPT = CompiledChatPromptTemplate.from_template(bulk_template)
+
+EMPTY_STATS = {"reviews": 0, "calls": 0, "requeued": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+
+def format_reviews(batch):
+    return "\n\n".join(f"REVIEW {review_id}:\n{text}" for review_id, text in batch)
+
+
+class BulkReviewExtractor:
+    def __init__(self, llm, response_schemas, max_prompt_tokens=3000, max_reviews_per_call=20,
+                 max_workers=4, id_key="id"):
+        self.llm = llm
+        self.response_schemas = response_schemas
+        self.keys = [rs.name for rs in response_schemas]
+        self.max_prompt_tokens = max_prompt_tokens
+        self.max_reviews_per_call = max_reviews_per_call
+        self.max_workers = max_workers
+        self.id_key = id_key
+        self.prompt = BULK_PROMPT.partial(
+            fields="\n\n".join(f"{rs.name}: {rs.description}" for rs in response_schemas),
+            format="\n".join(f'\t"{rs.name}": {rs.type}  // {rs.description}' for rs in response_schemas),
+            id_key=id_key,
+        )
+        # Tokens of the instructions, sent once per call whatever the number of reviews.
+        self.instruction_tokens = self._count(self.prompt.format_messages(reviews="")[0].content)
+        self.failures = []
+        self._stats = dict(EMPTY_STATS)
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def _count(self, text):
+        return self.llm.get_num_tokens(text)
+
+    def batches(self, reviews):
+        """Pack (id, text) reviews in batches whose prompt fits in max_prompt_tokens."""
+        batch, tokens = [], self.instruction_tokens
+        for review_id, text in reviews:
+            review_tokens = self._count(format_reviews([(review_id, text)])) + 2  # + the separator
+            if batch and (
+                tokens + review_tokens > self.max_prompt_tokens
+                or len(batch) >= self.max_reviews_per_call
+            ):
+                yield batch
+                batch, tokens = [], self.instruction_tokens
+            batch.append((review_id, text))  # a review longer than the budget goes alone
+            tokens += review_tokens
+        if batch:
+            yield batch
+
+    def _valid(self, item):
+        return isinstance(item, dict) and all(key in item for key in self.keys)
+
+    def _extract(self, batch):
+        """Send one batch; return ({id: fields} of the valid answers, [reviews to send again])."""
+        messages = self.prompt.format_messages(reviews=format_reviews(batch))
+        response = self.llm.invoke(messages)
+        usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+        with self._lock:
+            self._stats["calls"] += 1
+            self._stats["prompt_tokens"] += usage.get("prompt_tokens") or self._count(messages[0].content)
+            self._stats["completion_tokens"] += usage.get("completion_tokens") or self._count(response.content)
+
+        try:
+            items = parse_json_markdown(response.content)
+        except (OutputParserException, ValueError):
+            items = []
+        if isinstance(items, dict):
+            items = [items]
+        elif not isinstance(items, list):
+            items = []
+        ids = {str(review_id): review_id for review_id, _ in batch}
+        results = {}
+        for item in items:
+            if self._valid(item) and str(item.get(self.id_key)) in ids:
+                review_id = ids[str(item[self.id_key])]
+                results[review_id] = {key: item[key] for key in self.keys}
+        return results, [review for review in batch if review[0] not in results]
+
+    def run(self, reviews):
+        """Extract the fields of `reviews`, an iterable of (id, text); return {id: fields}."""
+        started = time.perf_counter()
+        results = {}
+        self.failures = []
+        self._stats = dict(EMPTY_STATS)
+        batches = self.batches(reviews)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            pending = {}
+
+            def submit(batch, retry):
+                pending[pool.submit(copy_context().run, self._extract, batch)] = (batch, retry)
+
+            # Keep at most 2 * max_workers batches queued, so a large input is read as it goes.
+            for batch in batches:
+                submit(batch, False)
+                if len(pending) >= 2 * self.max_workers:
+                    break
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch, retry = pending.pop(future)
+                    try:
+                        extracted, missing = future.result()
+                    except Exception as e:
+                        extracted, missing = {}, batch
+                        error = repr(e)
+                    else:
+                        error = "missing or invalid output"
+                    results.update(extracted)
+                    if retry:
+                        self.failures.extend({"id": review_id, "error": error} for review_id, _ in missing)
+                    else:
+                        # Send each review again on its own.
+                        with self._lock:
+                            self._stats["requeued"] += len(missing)
+                        for review in missing:
+                            submit([review], True)
+                for batch in batches:
+                    submit(batch, False)
+                    if len(pending) >= 2 * self.max_workers:
+                        break
+        self.seconds = time.perf_counter() - started
+        with self._lock:
+            self._stats["reviews"] = len(results)
+        return results
+
+    def stats(self):
+        """Throughput and token use of the last run()."""
+        with self._lock:
+            stats = dict(self._stats)
+        reviews = stats["reviews"]
+        tokens = stats["prompt_tokens"] + stats["completion_tokens"]
+        stats["failed"] = len(self.failures)
+        stats["seconds"] = self.seconds
+        stats["reviews_per_second"] = reviews / self.seconds if self.seconds else 0.0
+        stats["tokens_per_review"] = tokens / reviews if reviews else 0.0
+        stats["reviews_per_call"] = reviews / stats["calls"] if stats["calls"] else 0.0
+        return stats
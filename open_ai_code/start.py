@@ -1,18 +1,7 @@
+# Importing this module has no side effect (no model, no cache, no API call): the lesson runs in main(),
+# with python -m open_ai_code.start. prompt_template.py reuses load_chat() and enable_cache().
 import os
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
-# Load environment variables from .env file
-load_dotenv()
-# Access environment variables
-openai_key = os.environ.get('OPENAI_API_KEY')
-
-# MODEL
-
-
-chat = ChatOpenAI(temperature=0.0, model="gpt-3.5-turbo")
-#print(chat)
-
 
 # PROMPT TEMPLATE
 template_string = """Translate the text \
@@ -21,11 +10,6 @@ into a style that is {style}. \
 text: ```{text}```
 """
 
-prompt_template = ChatPromptTemplate.from_template(template_string)
-
-#print(prompt_template.messages[0].prompt)
-#print(prompt_template.messages[0].prompt.input_variables) #this will print out [style, text]
-
 customer_style = """American English \
 in a calm and respectful tone
 """
@@ -38,19 +22,6 @@ cleaning up me kitchen. I need yer help \
 right now, matey!
 """
 
-customer_messages = prompt_template.format_messages(
-    style=customer_style,
-    text=customer_email)
-
-# print(type(customer_messages))
-# print(type(customer_messages[0]))
-
-# print(customer_messages[0])
-
-# Call the LLM to translate to the style of the customer message
-customer_response = chat(customer_messages)
-print(customer_response.content)
-
 service_reply = """Hey there customer, \
 the warranty does not cover \
 cleaning expenses for your kitchen \
@@ -65,8 +36,62 @@ service_style_pirate = """\
 a polite tone \
 that speaks in English Pirate\
 """
-service_messages = prompt_template.format_messages(
-    style=service_style_pirate,
-    text=service_reply)
 
-print(service_messages[0].content)
+
+# MODEL
+def load_chat():
+    from .client_pool import chat_model
+    return chat_model(temperature=0.0, model="gpt-3.5-turbo")
+
+
+# CACHE
+# With temperature=0.0 the same messages always get the same answer, so answers are cached locally
+# (exact match on the formatted messages; pass embeddings= to also match near-identical ones).
+def enable_cache(path="llm_cache.sqlite"):
+    from langchain.globals import set_llm_cache
+    from .llm_cache import SemanticLLMCache
+    set_llm_cache(SemanticLLMCache(path))
+
+
+def translation_prompt():
+    from .compiled_prompt import CompiledChatPromptTemplate
+    return CompiledChatPromptTemplate.from_template(template_string)
+
+
+def main():
+    # Load environment variables from .env file
+    load_dotenv()
+    # Access environment variables
+    openai_key = os.environ.get('OPENAI_API_KEY')
+
+    chat = load_chat()
+    #print(chat)
+    enable_cache()
+
+    prompt_template = translation_prompt()
+
+    #print(prompt_template.messages[0].prompt)
+    #print(prompt_template.messages[0].prompt.input_variables) #this will print out [style, text]
+
+    customer_messages = prompt_template.format_messages(
+        style=customer_style,
+        text=customer_email)
+
+    # print(type(customer_messages))
+    # print(type(customer_messages[0]))
+
+    # print(customer_messages[0])
+
+    # Call the LLM to translate to the style of the customer message
+    customer_response = chat(customer_messages)
+    print(customer_response.content)
+
+    service_messages = prompt_template.format_messages(
+        style=service_style_pirate,
+        text=service_reply)
+
+    print(service_messages[0].content)
+
+
+if __name__ == "__main__":
+    main()
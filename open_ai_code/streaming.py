@@ -0,0 +1,162 @@
+# Token Streaming
+'''
+conversation.predict(...) and qa_stuff.run(query) only return once the LLM has written the whole
+answer, so a chat UI shows nothing until then: the time to the first token is the total time.
+
+stream_conversation() and stream_retrieval_qa() run the same chains but yield the answer
+token by token, as the LLM sends it:
+- stream_conversation(conversation, "Hi") yields the tokens, then saves the assembled answer
+  in the memory of the chain (as predict() does), so the next turn sees it;
+- stream_retrieval_qa(qa_stuff, query) first yields the retrieved documents, before the
+  generation starts, then the tokens. The events are ("sources", docs) and ("token", text).
+astream_conversation() and astream_retrieval_qa() are the async versions.
+
+Every call is timed: the time to first token (ttft_ms) and the total time (total_ms) are added
+to a StreamMetrics (the module-level `metrics` unless another one is given).
+'''
+import threading
+import time
+
+from langchain.chains.combine_documents.stuff import StuffDocumentsChain
+
+from .latency import latency_summary
+
+
+class StreamMetrics:
+    """Time to first token and total time of each streamed call."""
+
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def record(self, name, ttft_ms, total_ms, tokens):
+        with self._lock:
+            self.calls.append({"name": name, "ttft_ms": ttft_ms, "total_ms": total_ms, "tokens": tokens})
+
+    def summary(self):
+        with self._lock:
+            calls = list(self.calls)
+        return {
+            "calls": len(calls),
+            "ttft_ms": latency_summary([c["ttft_ms"] for c in calls if c["ttft_ms"] is not None]),
+            "total_ms": latency_summary([c["total_ms"] for c in calls]),
+        }
+
+
+metrics = StreamMetrics()
+
+
+class _Timer:
+    def __init__(self, name, metrics):
+        self.name = name
+        self.metrics = metrics
+        self.started = time.perf_counter()
+        self.ttft_ms = None
+        self.tokens = 0
+
+    def token(self):
+        if self.ttft_ms is None:
+            self.ttft_ms = (time.perf_counter() - self.started) * 1000
+        self.tokens += 1
+
+    def done(self):
+        total_ms = (time.perf_counter() - self.started) * 1000
+        self.metrics.record(self.name, self.ttft_ms, total_ms, self.tokens)
+
+
+def _text(chunk):
+    # Chat models stream message chunks, completion models stream strings.
+    return chunk if isinstance(chunk, str) else chunk.content
+
+
+def _conversation_prompt(chain, user_input):
+    inputs = chain.prep_inputs({chain.input_key: user_input})  # loads the memory
+    return inputs, chain.prompt.format_prompt(**inputs)
+
+
+def stream_conversation(chain, user_input, metrics=metrics):
+    """Yield the answer of a ConversationChain token by token, then save it in the chain's memory."""
+    inputs, prompt = _conversation_prompt(chain, user_input)
+    timer = _Timer("conversation", metrics)
+    parts = []
+    try:
+        for chunk in chain.llm.stream(prompt, **chain.llm_kwargs):
+            text = _text(chunk)
+            if text:
+                timer.token()
+                parts.append(text)
+                yield text
+    finally:
+        timer.done()
+    if chain.memory is not None:
+        chain.memory.save_context(inputs, {chain.output_key: "".join(parts)})
+
+
+async def astream_conversation(chain, user_input, metrics=metrics):
+    inputs, prompt = _conversation_prompt(chain, user_input)
+    timer = _Timer("conversation", metrics)
+    parts = []
+    try:
+        async for chunk in chain.llm.astream(prompt, **chain.llm_kwargs):
+            text = _text(chunk)
+            if text:
+                timer.token()
+                parts.append(text)
+                yield text
+    finally:
+        timer.done()
+    if chain.memory is not None:
+        chain.memory.save_context(inputs, {chain.output_key: "".join(parts)})
+
+
+def _stuff_prompt(qa, docs, query):
+    """The prompt the "stuff" chain of `qa` would send, or None for the other chain types."""
+    combine = qa.combine_documents_chain
+    if not isinstance(combine, StuffDocumentsChain):
+        return None
+    inputs = combine._get_inputs(docs, question=query)
+    return combine.llm_chain.prompt.format_prompt(**inputs)
+
+
+def stream_retrieval_qa(qa, query, metrics=metrics):
+    """Yield ("sources", docs), then ("token", text) for each token of the answer of a RetrievalQA."""
+    timer = _Timer("retrieval_qa", metrics)
+    try:
+        docs = qa.retriever.get_relevant_documents(query)
+        yield "sources", docs
+        prompt = _stuff_prompt(qa, docs, query)
+        if prompt is None:
+            # map_reduce / refine / map_rerank: no single prompt to stream, the answer comes in one piece.
+            answer = qa.combine_documents_chain.run(input_documents=docs, question=query)
+            timer.token()
+            yield "token", answer
+            return
+        llm_chain = qa.combine_documents_chain.llm_chain
+        for chunk in llm_chain.llm.stream(prompt, **llm_chain.llm_kwargs):
+            text = _text(chunk)
+            if text:
+                timer.token()
+                yield "token", text
+    finally:
+        timer.done()
+
+
+async def astream_retrieval_qa(qa, query, metrics=metrics):
+    timer = _Timer("retrieval_qa", metrics)
+    try:
+        docs = await qa.retriever.aget_relevant_documents(query)
+        yield "sources", docs
+        prompt = _stuff_prompt(qa, docs, query)
+        if prompt is None:
+            answer = await qa.combine_documents_chain.arun(input_documents=docs, question=query)
+            timer.token()
+            yield "token", answer
+            return
+        llm_chain = qa.combine_documents_chain.llm_chain
+        async for chunk in llm_chain.llm.astream(prompt, **llm_chain.llm_kwargs):
+            text = _text(chunk)
+            if text:
+                timer.token()
+                yield "token", text
+    finally:
+        timer.done()
@@ -0,0 +1,205 @@
+# Incremental Structured Output Parser
+'''
+output_parser.parse(response.content) waits for the whole response, looks for the ```json fence
+with a regex and then json.loads the whole string. With a streamed response nothing can be used
+before the last token, and a response that went wrong in its first line is only found out at the end.
+
+IncrementalStructuredOutputParser takes the same ResponseSchemas (it is a StructuredOutputParser),
+and parse_stream(chunks) reads the tokens as they arrive, in a single pass over the text:
+- the text before the JSON object (the ```json fence, an introduction) is skipped,
+- each field of the object ("gift", "delivery_days", "price_value") is yielded as (name, value)
+  as soon as its value is complete, while the rest of the object is still being generated,
+- anything that is not valid JSON structure (a missing ':' or ',', True instead of true, ...) raises
+  an OutputParserException right away, so a retry can start without waiting for the end,
+- at the end of the stream, a field of the schemas that never came raises an OutputParserException too.
+
+parse(text) runs the same parser on a complete string.
+'''
+import json
+import re
+
+from langchain.output_parsers import StructuredOutputParser
+from langchain.schema import OutputParserException
+
+_STRING_STOP = re.compile(r'["\\]')
+_SCALAR_START = set("-0123456789tfn")
+_SCALAR_END = set(",}") | set(" \t\r\n")
+
+# Parser states
+PREAMBLE, KEY_OR_END, KEY_START, KEY, COLON, VALUE, STRING, NESTED, SCALAR, AFTER_VALUE, DONE = range(11)
+
+
+class IncrementalJSONObject:
+    """Reads one JSON object chunk by chunk and returns each top-level field once its value is complete."""
+
+    def __init__(self):
+        self.state = PREAMBLE
+        self.fields = {}
+        self._key = None
+        self._buffer = []
+        self._escaped = False
+        self._depth = 0
+        self._in_string = False
+
+    def _fail(self, message, text):
+        raise OutputParserException(f"Invalid JSON: {message}", llm_output=text)
+
+    def _scan_string(self, chunk, i):
+        """Copy the string characters from chunk[i:] to the buffer; return the index after the closing quote, or None."""
+        while True:
+            if self._escaped:
+                if i >= len(chunk):
+                    return None
+                self._buffer.append(chunk[i])
+                self._escaped = False
+                i += 1
+            match = _STRING_STOP.search(chunk, i)
+            if match is None:
+                self._buffer.append(chunk[i:])
+                return None
+            j = match.start()
+            self._buffer.append(chunk[i:j])
+            if chunk[j] == '"':
+                return j + 1
+            self._buffer.append("\\")
+            self._escaped = True
+            i = j + 1
+
+    def _complete(self, text):
+        raw = "".join(self._buffer)
+        self._buffer = []
+        try:
+            value = json.loads(raw, strict=False)
+        except ValueError as e:
+            self._fail(f"bad value for {self._key!r}: {e}", text)
+        self.fields[self._key] = value
+        return self._key, value
+
+    def feed(self, chunk):
+        """Read the next chunk of text; return the (name, value) fields completed by it."""
+        completed = []
+        i, n = 0, len(chunk)
+        while i < n:
+            state = self.state
+            c = chunk[i]
+            if state == DONE:
+                break  # closing fence, trailing text
+            if state == PREAMBLE:
+                start = chunk.find("{", i)
+                if start < 0:
+                    break
+                self.state = KEY_OR_END
+                i = start + 1
+                continue
+            if state in (KEY_OR_END, KEY_START, COLON, VALUE, AFTER_VALUE) and c.isspace():
+                i += 1
+                continue
+            if state in (KEY_OR_END, KEY_START):
+                if c == '"':
+                    self.state = KEY
+                    i += 1
+                elif c == "}" and state == KEY_OR_END:
+                    self.state = DONE
+                    i += 1
+                else:
+                    self._fail(f"expected a key, got {c!r}", chunk)
+            elif state == KEY:
+                end = self._scan_string(chunk, i)
+                if end is None:
+                    break
+                self._key = json.loads('"' + "".join(self._buffer) + '"', strict=False)
+                self._buffer = []
+                self.state = COLON
+                i = end
+            elif state == COLON:
+                if c != ":":
+                    self._fail(f"expected ':' after {self._key!r}, got {c!r}", chunk)
+                self.state = VALUE
+                i += 1
+            elif state == VALUE:
+                if c == '"':
+                    self.state = STRING
+                    self._buffer.append('"')
+                elif c in "{[":
+                    self.state = NESTED
+                    self._depth = 1
+                    self._buffer.append(c)
+                elif c in _SCALAR_START:
+                    self.state = SCALAR
+                    self._buffer.append(c)
+                else:
+                    self._fail(f"expected a value for {self._key!r}, got {c!r}", chunk)
+                i += 1
+            elif state == STRING:
+                end = self._scan_string(chunk, i)
+                if end is None:
+                    break
+                self._buffer.append('"')
+                completed.append(self._complete(chunk))
+                self.state = AFTER_VALUE
+                i = end
+            elif state == NESTED:
+                if self._in_string:
+                    end = self._scan_string(chunk, i)
+                    if end is None:
+                        break
+                    self._buffer.append('"')
+                    self._in_string = False
+                    i = end
+                    continue
+                if c == '"':
+                    self._in_string = True
+                elif c in "{[":
+                    self._depth += 1
+                elif c in "}]":
+                    self._depth -= 1
+                self._buffer.append(c)
+                i += 1
+                if self._depth == 0:
+                    completed.append(self._complete(chunk))
+                    self.state = AFTER_VALUE
+            elif state == SCALAR:
+                if c in _SCALAR_END:
+                    completed.append(self._complete(chunk))
+                    self.state = AFTER_VALUE
+                    continue  # the delimiter is read in AFTER_VALUE
+                self._buffer.append(c)
+                i += 1
+            elif state == AFTER_VALUE:
+                if c == ",":
+                    self.state = KEY_START
+                elif c == "}":
+                    self.state = DONE
+                else:
+                    self._fail(f"expected ',' or '}}' after {self._key!r}, got {c!r}", chunk)
+                i += 1
+        return completed
+
+    def close(self):
+        """End of the stream: the object must be complete."""
+        if self.state != DONE:
+            raise OutputParserException("The response ended before the end of the JSON object")
+        return self.fields
+
+
+class IncrementalStructuredOutputParser(StructuredOutputParser):
+    """StructuredOutputParser that parses a streamed response as it arrives."""
+
+    def parse_stream(self, chunks):
+        """Yield (name, value) for each field of the response as soon as it is complete."""
+        state = IncrementalJSONObject()
+        for chunk in chunks:
+            # Chat models stream message chunks, completion models stream strings.
+            text = chunk if isinstance(chunk, str) else chunk.content
+            yield from state.feed(text)
+        fields = state.close()
+        missing = [rs.name for rs in self.response_schemas if rs.name not in fields]
+        if missing:
+            raise OutputParserException(f"Got invalid return object. Expected keys {missing} to be present")
+
+    def parse(self, text):
+        return dict(self.parse_stream([text]))
+
+    @property
+    def _type(self):
+        return "incremental_structured"
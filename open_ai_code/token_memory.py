@@ -0,0 +1,102 @@
+# Incremental Token Buffer Memory
+'''
+ConversationTokenBufferMemory counts the tokens of the whole conversation again after every
+save_context, and again after each message it drops. The longer the conversation, the slower each turn.
+
+IncrementalTokenBufferMemory counts the tokens of each message once, when it is saved.
+Messages are kept in a deque with their token count, and a running total says when to
+drop the oldest ones: each turn costs the same whatever the length of the conversation.
+The history string given to the prompt is only rebuilt when the buffer has changed.
+memory.chat_memory holds the same messages as the buffer (the pruned ones are removed from it too).
+
+It takes the same arguments as ConversationTokenBufferMemory (llm, max_token_limit, ...).
+'''
+from collections import deque
+from typing import Any
+
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain.pydantic_v1 import PrivateAttr
+from langchain.schema import AIMessage, HumanMessage, get_buffer_string
+from langchain.schema.language_model import BaseLanguageModel
+
+
+class IncrementalTokenBufferMemory(BaseChatMemory):
+    """Token-limited conversation memory with a cached token count per message."""
+
+    human_prefix: str = "Human"
+    ai_prefix: str = "AI"
+    llm: BaseLanguageModel
+    memory_key: str = "history"
+    max_token_limit: int = 2000
+
+    _messages: Any = PrivateAttr(default_factory=deque)  # (message, tokens, rendered line)
+    _total_tokens: int = PrivateAttr(default=0)
+    _overhead: Any = PrivateAttr(default=None)
+    _rendered: Any = PrivateAttr(default=None)
+
+    @property
+    def memory_variables(self):
+        return [self.memory_key]
+
+    @property
+    def total_tokens(self):
+        """Tokens of the buffer as counted by llm.get_num_tokens_from_messages."""
+        return self._total_tokens + (self._overhead or 0)
+
+    @property
+    def buffer_as_messages(self):
+        return [message for message, _, _ in self._messages]
+
+    @property
+    def buffer_as_str(self):
+        if self._rendered is None:
+            self._rendered = "\n".join(line for _, _, line in self._messages)
+        return self._rendered
+
+    @property
+    def buffer(self):
+        return self.buffer_as_messages if self.return_messages else self.buffer_as_str
+
+    def load_memory_variables(self, inputs):
+        return {self.memory_key: self.buffer}
+
+    def _count(self, message):
+        # get_num_tokens_from_messages adds a fixed overhead per call (3 tokens for OpenAI chat
+        # models); count it once so that the per-message counts add up to the real total.
+        if self._overhead is None:
+            self._overhead = self.llm.get_num_tokens_from_messages([])
+        return self.llm.get_num_tokens_from_messages([message]) - self._overhead
+
+    def _append(self, message):
+        self.chat_memory.add_message(message)
+        tokens = self._count(message)
+        line = get_buffer_string([message], human_prefix=self.human_prefix, ai_prefix=self.ai_prefix)
+        self._messages.append((message, tokens, line))
+        self._total_tokens += tokens
+        self._rendered = None
+
+    def prune(self):
+        """Drop the oldest messages until the buffer fits in max_token_limit."""
+        dropped = 0
+        while self._messages and self.total_tokens > self.max_token_limit:
+            _, tokens, _ = self._messages.popleft()
+            self._total_tokens -= tokens
+            self._rendered = None
+            dropped += 1
+        if dropped:
+            del self.chat_memory.messages[:dropped]
+
+    def save_context(self, inputs, outputs):
+        input_str, output_str = self._get_input_output(inputs, outputs)
+        self._append(HumanMessage(content=input_str))
+        self._append(AIMessage(content=output_str))
+        self.prune()
+
+    async def asave_context(self, inputs, outputs):
+        self.save_context(inputs, outputs)
+
+    def clear(self):
+        super().clear()
+        self._messages.clear()
+        self._total_tokens = 0
+        self._rendered = None
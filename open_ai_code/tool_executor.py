@@ -0,0 +1,285 @@
+# Cached, Parallel Tool Execution
+'''
+The AgentExecutor built by initialize_agent runs the actions of the agent one after the other, and runs
+a tool again every time the agent asks for it, even when another question just looked up the same
+Wikipedia page.
+
+CachingAgentExecutor is an AgentExecutor that:
+- keeps the observation of each tool call in a TTL cache, per tool, keyed on the normalized action_input
+  (extra whitespace does not matter, case does), so a repeated lookup is answered locally until it expires.
+  Caching is opt-in: tool_ttl={"wikipedia": 3600} caches that tool, default_ttl (0 = never cached) applies
+  to the others. Errors (exceptions, and the error observations of tools with handle_tool_error) are
+  never cached,
+- when the agent returns several actions in one step, runs them at the same time on a pool of threads
+  (max_workers); identical actions of a step share one call. Only agents that plan several actions per
+  step gain from this (the OpenAI tools agent of create_openai_tools_agent, with parallel tool calls):
+  the ReAct agents of initialize_agent, CHAT_ZERO_SHOT_REACT_DESCRIPTION included, plan one action per
+  step, so for them only the cache helps.
+
+The async path (arun/ainvoke) uses the same cache; its actions already run concurrently (asyncio.gather).
+
+from_executor(agent) wraps the AgentExecutor returned by initialize_agent. close() (or a with block)
+shuts down the thread pool.
+For the tests, LocalWikipediaTool answers like the wikipedia tool from a dict of pages, without network
+(see wikipedia_fixture.py), and replace_tool swaps it in the list returned by load_tools.
+'''
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Any, Dict
+
+from langchain.agents import AgentExecutor
+from langchain.pydantic_v1 import PrivateAttr
+from langchain.tools import BaseTool
+from langchain_core.agents import AgentAction, AgentStep
+from langchain_core.callbacks import AsyncCallbackManager, BaseCallbackHandler, CallbackManager
+
+
+def normalize_input(tool_input):
+    """Cache key of an action_input: single spaces, sorted keys for dict inputs (case is kept)."""
+    if isinstance(tool_input, str):
+        return " ".join(tool_input.split())
+    if isinstance(tool_input, dict):
+        return json.dumps({k: normalize_input(v) for k, v in tool_input.items()}, sort_keys=True)
+    return json.dumps(tool_input, sort_keys=True, default=str)
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire `ttl` seconds after they are set."""
+
+    def __init__(self, max_items=1024):
+        self.max_items = max_items
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()  # key -> (expires, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[0] < time.monotonic():
+                self._items.pop(key, None)
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._items[key] = (time.monotonic() + ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+
+class _ToolOutcome(BaseCallbackHandler):
+    """Records whether a tool call ended normally: tools handling their errors end them with color="red"."""
+
+    run_inline = True  # also called in place (not in a thread) by the async callback manager
+
+    def __init__(self):
+        self.ok = False  # stays False for the validation errors, which end without any callback
+
+    def on_tool_end(self, output, color=None, **kwargs):
+        self.ok = color != "red"
+
+    def on_tool_error(self, error, **kwargs):
+        self.ok = False
+
+
+class _WatchedRunManager:
+    """Run manager adding a _ToolOutcome to the callbacks of the tool call."""
+
+    def __init__(self, run_manager, outcome):
+        self.run_manager = run_manager
+        self.outcome = outcome
+
+    def on_agent_action(self, action, **kwargs):
+        if self.run_manager:
+            self.run_manager.on_agent_action(action, **kwargs)
+
+    def get_child(self):
+        manager = self.run_manager.get_child() if self.run_manager else CallbackManager([])
+        manager.add_handler(self.outcome, inherit=False)
+        return manager
+
+
+class _AsyncWatchedRunManager(_WatchedRunManager):
+    """_WatchedRunManager for the async run manager of _aperform_agent_action."""
+
+    async def on_agent_action(self, action, **kwargs):
+        if self.run_manager:
+            await self.run_manager.on_agent_action(action, **kwargs)
+
+    def get_child(self):
+        manager = self.run_manager.get_child() if self.run_manager else AsyncCallbackManager([])
+        manager.add_handler(self.outcome, inherit=False)
+        return manager
+
+
+class CachingAgentExecutor(AgentExecutor):
+    """AgentExecutor with a per-tool TTL cache of the observations and parallel actions."""
+
+    max_workers: int = 4
+    tool_ttl: Dict[str, float] = {}
+    default_ttl: float = 0.0
+    cache_size: int = 1024
+
+    _cache: Any = PrivateAttr(default=None)
+    _pool: Any = PrivateAttr(default=None)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)  # guards the lazy _cache and _pool
+    _local: Any = PrivateAttr(default_factory=threading.local)
+
+    @classmethod
+    def from_executor(cls, executor, **kwargs):
+        """The same agent, tools and settings as the AgentExecutor `executor`."""
+        fields = [
+            "agent", "tools", "memory", "callbacks", "verbose", "tags", "metadata",
+            "return_intermediate_steps", "max_iterations", "max_execution_time",
+            "early_stopping_method", "handle_parsing_errors", "trim_intermediate_steps",
+        ]
+        return cls(**{name: getattr(executor, name) for name in fields}, **kwargs)
+
+    @property
+    def cache(self):
+        with self._lock:
+            if self._cache is None:
+                self._cache = TTLCache(self.cache_size)
+            return self._cache
+
+    def _ttl(self, tool_name):
+        return self.tool_ttl.get(tool_name, self.default_ttl)
+
+    def _lookup(self, name_to_tool_map, agent_action):
+        """(key, ttl, cached observation or None) of the action; key is None when its tool is not cached."""
+        ttl = self._ttl(agent_action.tool)
+        if ttl <= 0 or agent_action.tool not in name_to_tool_map:
+            return None, ttl, None
+        key = (agent_action.tool, normalize_input(agent_action.tool_input))
+        return key, ttl, self.cache.get(key)
+
+    @staticmethod
+    def _watched_colors(color_mapping, tool):
+        if color_mapping.get(tool) == "red":
+            # Red marks the handled errors in _ToolOutcome: print this tool in another color.
+            return {**color_mapping, tool: "pink"}
+        return color_mapping
+
+    def _run_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        key, ttl, observation = self._lookup(name_to_tool_map, agent_action)
+        if key is None:
+            return super()._perform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager)
+        if observation is not None:
+            if run_manager:
+                run_manager.on_agent_action(agent_action, color="green")
+            return AgentStep(action=agent_action, observation=observation)
+        outcome = _ToolOutcome()
+        step = super()._perform_agent_action(
+            name_to_tool_map, self._watched_colors(color_mapping, agent_action.tool), agent_action,
+            _WatchedRunManager(run_manager, outcome),
+        )
+        if outcome.ok:
+            self.cache.set(key, step.observation, ttl)
+        return step
+
+    async def _aperform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        key, ttl, observation = self._lookup(name_to_tool_map, agent_action)
+        if key is None:
+            return await super()._aperform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager)
+        if observation is not None:
+            if run_manager:
+                await run_manager.on_agent_action(agent_action, color="green")
+            return AgentStep(action=agent_action, observation=observation)
+        outcome = _ToolOutcome()
+        step = await super()._aperform_agent_action(
+            name_to_tool_map, self._watched_colors(color_mapping, agent_action.tool), agent_action,
+            _AsyncWatchedRunManager(run_manager, outcome),
+        )
+        if outcome.ok:
+            self.cache.set(key, step.observation, ttl)
+        return step
+
+    def _iter_next_step(self, name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=None):
+        # The base class yields all the actions of the step before performing any of them:
+        # each one is started on the pool as soon as it is yielded, and
+        # _perform_agent_action only waits for its result.
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers)
+            pool = self._pool
+        futures = self._local.futures = {}
+        started = {}  # identical actions of the step share one call
+        for output in super()._iter_next_step(
+            name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager
+        ):
+            if isinstance(output, AgentAction):
+                key = (output.tool, normalize_input(output.tool_input))
+                if key not in started:
+                    # In a copy of this context: the tool's spans and callbacks follow the agent's.
+                    started[key] = pool.submit(
+                        copy_context().run, self._run_action, name_to_tool_map, color_mapping, output, run_manager
+                    )
+                futures[id(output)] = started[key]
+            yield output
+
+    def _perform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        future = getattr(self._local, "futures", {}).pop(id(agent_action), None)
+        if future is None:
+            return self._run_action(name_to_tool_map, color_mapping, agent_action, run_manager)
+        step = future.result()
+        return AgentStep(action=agent_action, observation=step.observation)
+
+    def stats(self):
+        return {"cache_hits": self.cache.hits, "cache_misses": self.cache.misses}
+
+    def close(self):
+        """Shut down the thread pool of the parallel actions (a later call starts a new one)."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class LocalWikipediaTool(BaseTool):
+    """Stand-in for the wikipedia tool answering from a {title: summary} dict, for tests without network."""
+
+    name: str = "wikipedia"
+    description: str = (
+        "A wrapper around Wikipedia. Useful for when you need to answer general questions about "
+        "people, places, companies, facts, historical events, or other subjects. "
+        "Input should be a search query."
+    )
+    pages: Dict[str, str] = {}
+    top_k_results: int = 3
+    calls: int = 0
+
+    def _run(self, query, run_manager=None):
+        self.calls += 1
+        words = set(query.lower().split())
+        scored = []
+        for title, summary in self.pages.items():
+            title_words = set(title.lower().split())
+            score = 2 * len(words & title_words) + len(words & set(summary.lower().split()))
+            if score:
+                scored.append((score, title, summary))
+        scored.sort(key=lambda item: -item[0])
+        if not scored:
+            return "No good Wikipedia Search Result was found"
+        return "\n\n".join(
+            f"Page: {title}\nSummary: {summary}" for _, title, summary in scored[: self.top_k_results]
+        )
+
+
+def replace_tool(tools, new_tool):
+    """`tools` with the tool of the same name as `new_tool` replaced by it."""
+    return [new_tool if tool.name == new_tool.name else tool for tool in tools]
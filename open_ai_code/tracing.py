@@ -0,0 +1,422 @@
+# Tracing
+'''
+langchain.debug = True prints every input and output of every step to stdout: fine to look at one call,
+useless to find out, over many calls in production, which step of RetrievalQA or MultiPromptChain
+takes the time.
+
+Tracer records spans instead: one per step, with its duration, nested like the calls (a trace per
+top-level call), with the token counts of the LLM calls. Everything comes from LangChain's callbacks
+(activate() registers the handler with register_configure_hook, nothing is patched):
+- chains, LLM calls, retrievers and tools have their own callbacks,
+- prompt formatting and output parsing have none: a chain whose first step is an LLM call gets a
+  "prompt.format" span from its start to the LLM call, and one whose last step is an LLM call gets a
+  "parse" span from the end of the LLM call to its own end (output parsing, and saving the memory),
+- tracer.span("name") records any other block of code.
+Loading the memory happens before the chain's first callback. instrument() adds "memory.load" and
+"memory.save" spans by wrapping Chain.prep_inputs / prep_outputs; it is opt-in, does nothing the
+second time, and uninstrument() puts the original methods back.
+
+The current span lives in a ContextVar: threads started by the helpers (DAGSequentialChain,
+CachingAgentExecutor, EvaluationRunner, ...) run their work in a copy of the caller's context, so their
+spans nest under the caller's and the handler registered by activate() follows them.
+
+sample_rate decides which top-level calls are traced (the steps inside follow their top-level call);
+with sample_rate=0 nothing is recorded and each step costs a single check.
+The spans go to an exporter: JSONLExporter writes one JSON object per span, OTLPJSONExporter writes
+OpenTelemetry OTLP/JSON (one ExportTraceServiceRequest per line, like the OpenTelemetry file exporter),
+which OpenTelemetry collectors and tools read. summary() gives the time and tokens per step.
+
+    tracer = Tracer(JSONLExporter("traces.jsonl"), sample_rate=0.1)
+    tracer.activate() # every chain call in this context is traced from now on
+    qa.run(query)
+    print(tracer.summary())
+'''
+import atexit
+import json
+import os
+import random
+import threading
+import time
+import weakref
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from langchain_core.callbacks.base import BaseCallbackHandler
+from langchain_core.tracers.context import register_configure_hook
+
+from .latency import percentile
+
+_current = ContextVar("tracing_current_span", default=None)
+_handler_var = ContextVar("tracing_handler", default=None)
+register_configure_hook(_handler_var, inheritable=True)
+
+_active = None  # the activated Tracer, used by the instrumented steps
+_tracers = weakref.WeakSet()  # tracers with an exporter, flushed at exit
+
+
+@atexit.register
+def _flush_all():
+    for tracer in list(_tracers):
+        tracer.flush()
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent", "previous", "name", "kind", "start_ns", "end_ns",
+                 "attributes", "error", "sampled")
+
+    def __init__(self, trace_id, parent, previous, name, kind, attributes, sampled):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex() if sampled else None
+        self.parent = parent
+        self.previous = previous  # the current span before this one started, restored when it ends
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes or {}
+        self.error = None
+        self.sampled = sampled
+
+    @property
+    def duration_ms(self):
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent is not None else None,
+            "name": self.name,
+            "kind": self.kind,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": self.duration_ms,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class JSONLExporter:
+    """One JSON object per span, appended to `path`."""
+
+    def __init__(self, path="traces.jsonl"):
+        self.path = path
+
+    def export(self, spans):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for span in spans:
+                f.write(json.dumps(span.to_dict(), default=str) + "\n")
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OTLPJSONExporter:
+    """OpenTelemetry OTLP/JSON: one ExportTraceServiceRequest per line of `path`."""
+
+    KINDS = {"chain": 1, "llm": 3, "retriever": 3, "tool": 1}  # SPAN_KIND_INTERNAL / SPAN_KIND_CLIENT
+
+    def __init__(self, path="traces.otlp.jsonl", service_name="open_ai_code"):
+        self.path = path
+        self.service_name = service_name
+
+    def _span(self, span):
+        data = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": self.KINDS.get(span.kind, 1),
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in dict(span.attributes, **{"langchain.kind": span.kind}).items()
+            ],
+            "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+        }
+        if span.parent is not None:
+            data["parentSpanId"] = span.parent.span_id
+        return data
+
+    def export(self, spans):
+        request = {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+            "scopeSpans": [{"scope": {"name": "open_ai_code.tracing"}, "spans": [self._span(s) for s in spans]}],
+        }]}
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(request) + "\n")
+
+
+class Tracer:
+    def __init__(self, exporter=None, sample_rate=1.0, batch_size=100, keep=10000):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.batch_size = batch_size
+        self.spans = deque(maxlen=keep)  # finished spans, for summary()
+        self._pending = []
+        self._lock = threading.Lock()
+        if exporter is not None:
+            _tracers.add(self)
+
+    def start_span(self, name, kind="internal", attributes=None, parent=None):
+        """Start a span (child of `parent`, or of the current span); None when sampling is off."""
+        if not self.sample_rate:
+            return None
+        previous = _current.get()
+        if parent is None:
+            parent = previous
+        if parent is None:
+            sampled = self.sample_rate >= 1 or random.random() < self.sample_rate
+            trace_id = os.urandom(16).hex() if sampled else None
+        else:
+            sampled = parent.sampled
+            trace_id = parent.trace_id
+        span = Span(trace_id, parent, previous, name, kind, attributes, sampled)
+        _current.set(span)
+        return span
+
+    def end_span(self, span, error=None, **attributes):
+        if span is None:
+            return
+        _current.set(span.previous)
+        if not span.sampled:
+            return
+        span.end_ns = time.time_ns()
+        span.attributes.update(attributes)
+        if error is not None:
+            span.error = repr(error)
+        self._finish(span)
+
+    def add_span(self, name, kind, parent, start_ns, end_ns, **attributes):
+        """Record a finished span of `parent`'s trace, timed from the outside."""
+        if parent is None or not parent.sampled:
+            return
+        span = Span(parent.trace_id, parent, None, name, kind, attributes, True)
+        span.start_ns = start_ns
+        span.end_ns = end_ns
+        self._finish(span)
+
+    def _finish(self, span):
+        with self._lock:
+            self.spans.append(span)
+            if self.exporter is not None:
+                self._pending.append(span)
+                if len(self._pending) >= self.batch_size:
+                    self._flush_locked()
+
+    @contextmanager
+    def span(self, name, kind="internal", **attributes):
+        span = self.start_span(name, kind, attributes)
+        try:
+            yield span
+        except BaseException as e:
+            self.end_span(span, error=e)
+            raise
+        self.end_span(span)
+
+    def _flush_locked(self):
+        if self._pending:
+            self.exporter.export(self._pending)
+            self._pending = []
+
+    def flush(self):
+        with self._lock:
+            if self.exporter is not None:
+                self._flush_locked()
+
+    def handler(self):
+        """Callback handler recording the chain, LLM, retriever and tool runs in this tracer."""
+        return TracingCallbackHandler(self)
+
+    def activate(self):
+        """Trace every LangChain call of this context (and the threads copying it) from now on."""
+        global _active
+        _active = self
+        _handler_var.set(self.handler())
+
+    def deactivate(self):
+        global _active
+        if _active is self:
+            _active = None
+        _handler_var.set(None)
+        self.flush()
+
+    def summary(self):
+        """Count, time (ms) and tokens of the finished spans, per step (kind and name)."""
+        with self._lock:
+            spans = list(self.spans)
+        steps = {}
+        for span in spans:
+            steps.setdefault(f"{span.kind}:{span.name}", []).append(span)
+        report = {}
+        for step, group in sorted(steps.items(), key=lambda item: -sum(s.duration_ms for s in item[1])):
+            durations = [s.duration_ms for s in group]
+            report[step] = {
+                "count": len(group),
+                "total_ms": sum(durations),
+                "p50_ms": percentile(durations, 50),
+                "p99_ms": percentile(durations, 99),
+                "tokens": sum(s.attributes.get("total_tokens", 0) for s in group),
+                "errors": sum(1 for s in group if s.error),
+            }
+        return report
+
+
+def _token_usage(response):
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if usage:
+        return usage
+    totals = {}
+    for generations in response.generations:
+        for generation in generations:
+            message = getattr(generation, "message", None)
+            metadata = getattr(message, "response_metadata", None) or {}
+            for key, value in (metadata.get("token_usage") or {}).items():
+                if isinstance(value, int):
+                    totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    run_inline = True  # in the caller's thread and context, so the nesting of the spans is kept
+
+    def __init__(self, tracer):
+        self.tracer = tracer
+        self._runs = {}  # run id -> span
+        self._steps = {}  # chain run id -> [steps started, end_ns of its last step if it was an LLM call]
+        self._llm_parents = {}  # LLM run id -> run id of its chain
+
+    def _start(self, run_id, parent_run_id, name, kind, attributes=None):
+        parent = self._runs.get(parent_run_id) if parent_run_id else None
+        steps = self._steps.get(parent_run_id)
+        if steps is not None:
+            if kind == "llm" and steps[0] == 0:
+                self.tracer.add_span("prompt.format", "step", parent, parent.start_ns, time.time_ns())
+            steps[0] += 1
+            steps[1] = None
+        span = self.tracer.start_span(name, kind, attributes, parent)
+        if span is not None:
+            self._runs[run_id] = span
+            if kind == "chain":
+                self._steps[run_id] = [0, None]
+            elif kind == "llm" and steps is not None:
+                self._llm_parents[run_id] = parent_run_id
+
+    def _end(self, run_id, error=None, **attributes):
+        span = self._runs.pop(run_id, None)
+        end_ns = time.time_ns()
+        steps = self._steps.pop(run_id, None)
+        if steps is not None and steps[1] is not None and error is None:
+            self.tracer.add_span("parse", "step", span, steps[1], end_ns)
+        parent_steps = self._steps.get(self._llm_parents.pop(run_id, None))
+        if parent_steps is not None:
+            parent_steps[1] = end_ns
+        self.tracer.end_span(span, error, **attributes)
+
+    @staticmethod
+    def _name(serialized, kwargs, default):
+        if kwargs.get("name"):
+            return kwargs["name"]
+        serialized = serialized or {}
+        return serialized.get("name") or (serialized.get("id") or [default])[-1]
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, self._name(serialized, kwargs, "chain"), "chain")
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def _llm_start(self, serialized, prompt_count, run_id, parent_run_id, kwargs):
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model_name") or params.get("model") or params.get("_type") or ""
+        self._start(run_id, parent_run_id, self._name(serialized, kwargs, "llm"), "llm",
+                    {"model": model, "prompts": prompt_count})
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self._llm_start(serialized, len(prompts), run_id, parent_run_id, kwargs)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        self._llm_start(serialized, len(messages), run_id, parent_run_id, kwargs)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = _token_usage(response)
+        self._end(run_id, **{k: usage[k] for k in ("prompt_tokens", "completion_tokens", "total_tokens") if k in usage})
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def on_retriever_start(self, serialized, query, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, self._name(serialized, kwargs, "retriever"), "retriever")
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self._end(run_id, documents=len(documents))
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, self._name(serialized, kwargs, "tool"), "tool",
+                    {"input_chars": len(input_str)})
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id, output_chars=len(str(output)))
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+
+def _traced(method, name, condition=None):
+    def wrapper(self, *args, **kwargs):
+        tracer = _active
+        if tracer is None or (condition is not None and not condition(self)):
+            return method(self, *args, **kwargs)
+        span = tracer.start_span(name, "step", {"class": type(self).__name__})
+        try:
+            result = method(self, *args, **kwargs)
+        except BaseException as e:
+            tracer.end_span(span, error=e)
+            raise
+        tracer.end_span(span)
+        return result
+
+    wrapper.__wrapped__ = method
+    wrapper.__name__ = method.__name__
+    return wrapper
+
+
+_originals = {}  # method name -> original Chain method, while instrumented
+_instrument_lock = threading.Lock()
+
+
+def instrument():
+    """Add "memory.load" / "memory.save" spans around Chain.prep_inputs / prep_outputs (idempotent)."""
+    from langchain.chains.base import Chain
+
+    with _instrument_lock:
+        if _originals:
+            return
+        has_memory = lambda chain: chain.memory is not None
+        for method, name in (("prep_inputs", "memory.load"), ("prep_outputs", "memory.save")):
+            _originals[method] = Chain.__dict__[method]
+            setattr(Chain, method, _traced(_originals[method], name, has_memory))
+
+
+def uninstrument():
+    """Put back the methods wrapped by instrument()."""
+    from langchain.chains.base import Chain
+
+    with _instrument_lock:
+        for method, original in _originals.items():
+            setattr(Chain, method, original)
+        _originals.clear()
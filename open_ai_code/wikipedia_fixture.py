@@ -0,0 +1,35 @@
+# Local Wikipedia Fixture
+'''
+A few Wikipedia summaries, so the agent of agent.py can be run and tested without network access:
+
+    tools = replace_tool(load_tools(["llm-math", "wikipedia"], llm=llm), local_wikipedia())
+'''
+from .tool_executor import LocalWikipediaTool
+
+PAGES = {
+    "Tom M. Mitchell": (
+        "Tom Michael Mitchell (born August 9, 1951) is an American computer scientist and the Founders "
+        "University Professor at Carnegie Mellon University (CMU). He is a founder and former Chair of the "
+        "Machine Learning Department at CMU. Mitchell is known for his contributions to the advancement of "
+        "machine learning, artificial intelligence, and cognitive neuroscience and is the author of the "
+        "textbook Machine Learning."
+    ),
+    "Machine Learning (book)": (
+        "Machine Learning is a textbook by Tom M. Mitchell, published by McGraw Hill in 1997. "
+        "It covers concept learning, decision trees, neural networks, Bayesian learning and "
+        "reinforcement learning."
+    ),
+    "Carnegie Mellon University": (
+        "Carnegie Mellon University (CMU) is a private research university in Pittsburgh, Pennsylvania, "
+        "United States. It was established in 1900 by Andrew Carnegie."
+    ),
+    "LangChain": (
+        "LangChain is a software framework that helps facilitate the integration of large language "
+        "models (LLMs) into applications."
+    ),
+}
+
+
+def local_wikipedia(pages=None, top_k_results=3):
+    """LocalWikipediaTool over `pages` (PAGES by default)."""
+    return LocalWikipediaTool(pages=PAGES if pages is None else pages, top_k_results=top_k_results)
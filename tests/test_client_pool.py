@@ -0,0 +1,154 @@
+# Tests of client_pool.py against the local fake OpenAI server (no network, no API key).
+# Run from the repository root: python -m pytest -q
+import asyncio
+import threading
+import time
+
+import pytest
+
+from open_ai_code import client_pool
+from open_ai_code.client_pool import AdaptiveLimiter, ClientPool, chat_model, configure, shared_chat_model
+from open_ai_code.fake_openai_server import start_server
+
+CHAT = {"model": "gpt-3.5-turbo", "messages": [{"role": "user", "content": "hello"}]}
+
+
+@pytest.fixture
+def server():
+    server = start_server(port=0)
+    server.base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def configure_pool(monkeypatch):
+    """configure() for a test: the shared pool and model registry are restored afterwards."""
+    monkeypatch.delenv("LLM_BACKEND", raising=False)
+    previous_pool = client_pool._pool
+    previous_models = dict(client_pool._registry._models)
+    pools = []
+
+    def configure_for_test(**kwargs):
+        pools.append(configure(**kwargs))
+        return pools[-1]
+
+    yield configure_for_test
+    for pool in pools:
+        pool.close()
+    with client_pool._pool_lock:
+        client_pool._pool = previous_pool
+    client_pool._registry.clear()
+    client_pool._registry._models.update(previous_models)
+
+
+def post_all(pool, server, count):
+    statuses = []
+
+    def post():
+        statuses.append(pool.http_client.post(server.base_url + "/chat/completions", json=CHAT).status_code)
+
+    threads = [threading.Thread(target=post) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return statuses
+
+
+def test_requests_reuse_keepalive_connections(server):
+    pool = ClientPool()
+    for _ in range(10):
+        assert pool.http_client.post(server.base_url + "/chat/completions", json=CHAT).status_code == 200
+    assert server.requests == 10
+    assert len(server.connections) == 1
+    pool.close()
+
+
+def test_concurrency_limit(server):
+    server.latency = 0.1
+    pool = ClientPool(AdaptiveLimiter(initial_concurrency=2, max_concurrency=2))
+    started = time.monotonic()
+    assert post_all(pool, server, 8) == [200] * 8
+    # 8 requests, 2 at a time, 0.1 s each.
+    assert time.monotonic() - started >= 0.35
+    assert pool.limiter.stats()["in_flight"] == 0
+    assert pool.limiter.stats()["successes"] == 8
+    pool.close()
+
+
+def test_burst_of_429_halves_concurrency_once(server):
+    server.latency = 0.05
+    server.error_rate = 1.0
+    server.retry_after = 0
+    limiter = AdaptiveLimiter(initial_concurrency=8, max_concurrency=8)
+    pool = ClientPool(limiter)
+    assert post_all(pool, server, 8) == [429] * 8
+    assert limiter.throttled == 8
+    assert limiter.concurrency == 4
+    pool.close()
+
+
+def test_async_client_waits_for_a_slot(server):
+    server.latency = 0.05
+    pool = ClientPool(AdaptiveLimiter(initial_concurrency=2, max_concurrency=2))
+
+    async def run():
+        client = pool.http_async_client
+        responses = await asyncio.gather(*[
+            client.post(server.base_url + "/chat/completions", json=CHAT) for _ in range(6)
+        ])
+        await client.aclose()
+        return [r.status_code for r in responses]
+
+    assert asyncio.run(run()) == [200] * 6
+    assert pool.limiter.stats()["successes"] == 6
+    pool.close()
+
+
+def test_close_closes_both_clients(server):
+    pool = ClientPool()
+    sync_client, async_client = pool.http_client, pool.http_async_client
+    pool.close()
+    assert sync_client.is_closed
+    assert async_client.is_closed
+
+
+def test_chat_model_uses_the_shared_pool(server, configure_pool):
+    pool = configure_pool()
+    llm = chat_model(model="gpt-3.5-turbo", base_url=server.base_url, api_key="fake", max_retries=0)
+    assert llm.invoke("hello").content == "echo: hello"
+    assert pool.limiter.stats()["successes"] == 1
+
+
+def test_stats_count_waiting_and_in_flight_requests(server):
+    server.latency = 0.3
+    pool = ClientPool(AdaptiveLimiter(initial_concurrency=1, max_concurrency=1))
+    thread = threading.Thread(target=post_all, args=(pool, server, 3))
+    thread.start()
+    time.sleep(0.15)
+    stats = pool.stats()["sync"]
+    assert (stats["in_flight"], stats["waiting"]) == (1, 2)
+    thread.join()
+    stats = pool.stats()["sync"]
+    assert (stats["in_flight"], stats["waiting"]) == (0, 0)
+    pool.close()
+
+
+def test_configure_keeps_models_of_the_old_pool_working(server, configure_pool):
+    configure_pool()
+    llm = chat_model(model="gpt-3.5-turbo", base_url=server.base_url, api_key="fake", max_retries=0)
+    configure_pool()
+    assert llm.invoke("hello").content == "echo: hello"
+
+
+def test_registry_counts_the_calls_of_fake_models(configure_pool, monkeypatch):
+    pool = configure_pool()
+    monkeypatch.setenv("LLM_BACKEND", "fake")
+    llm = shared_chat_model(temperature=0.0, model="gpt-3.5-turbo")
+    assert shared_chat_model(temperature=0, model_name="gpt-3.5-turbo") is llm
+    llm.invoke("hello")
+    stats = client_pool.get_registry().model_stats(llm)
+    assert stats["requests"] == 1
+    assert stats["pool"] == pool.stats()
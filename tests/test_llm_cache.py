@@ -0,0 +1,53 @@
+# Tests of llm_cache.py against the local fake OpenAI server (no network, no API key).
+# Run from the repository root: python -m pytest -q
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from open_ai_code.fake_openai_server import start_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# One process: a pooled chat model (its http_client is part of the llm_string) behind the cache.
+CALL = """
+import json, sys
+from langchain.globals import set_llm_cache
+from open_ai_code.client_pool import chat_model
+from open_ai_code.llm_cache import SemanticLLMCache
+
+cache = SemanticLLMCache(sys.argv[1])
+set_llm_cache(cache)
+llm = chat_model(model="gpt-3.5-turbo", temperature=0.0, base_url=sys.argv[2], api_key="fake", max_retries=0)
+print(json.dumps({"answer": llm.invoke("hello").content, **cache.stats()}))
+"""
+
+
+@pytest.fixture
+def server():
+    server = start_server(port=0)
+    server.base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def call_in_new_process(path, server):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    env.pop("LLM_BACKEND", None)
+    out = subprocess.run(
+        [sys.executable, "-c", CALL, str(path), server.base_url],
+        env=env, cwd=ROOT, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def test_cache_hits_across_processes(server, tmp_path):
+    path = tmp_path / "llm_cache.sqlite"
+    first = call_in_new_process(path, server)
+    second = call_in_new_process(path, server)
+    assert (first["answer"], first["misses"]) == ("echo: hello", 1)
+    assert (second["answer"], second["exact_hits"], second["misses"]) == ("echo: hello", 1, 0)
+    assert server.requests == 1